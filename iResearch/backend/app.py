@@ -7,23 +7,51 @@
 
 import os
 import sys
+import json
+import time
+import shutil
 import logging
 from datetime import datetime, timedelta
 from functools import wraps
 
+import click
 import pymysql
 import jwt
-from flask import Flask, request, jsonify, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, send_from_directory, abort, g, has_request_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
+from db_pool import ConnectionPool, PoolTimeout
+from migrations import migrate, status as migration_status
+from metrics import (InstrumentedConnection, MetricsRegistry, begin_request, clear_directory as clear_metrics_directory,
+                     end_request, phase, server_timing)
+from slow_queries import SlowQueryLog
+from profiling import (SAMPLER_EPOCH, ProfilerBusy, RequestProfiler, StackSampler, format_stacks,
+                       set_sampler_state)
+from passwords import HasherBusy, LoginThrottle, PasswordHasher
+from images import ImageError, ImageProcessor, load_variants, save_upload
+from storage import URL_PREFIX as UPLOAD_URL_PREFIX, UploadSweeper, is_content_addressed
+from static_files import IMMUTABLE, REVALIDATE, asset_cache_control, send_static
+from importer import ImportFormatError, ImportReport, import_records, is_ndjson, stream_import
+from exporter import EXPORTS, FORMATS as EXPORT_FORMATS, export_stream
+from snapshot import (EXTENSION as SNAPSHOT_EXTENSION, SnapshotError, create_snapshot,
+                      list_snapshots, read_manifest, restore_snapshot)
+from cache import LRUCache, ResponseCache, TokenCache, bump_version, get_version, get_versions
+from pagination import InvalidCursor, fetch_keyset_page, fetch_ranked_page, fetch_sorted_page, order_clause
+from import_jobs import ImportJobRunner, JobQueueFull, JOB_COLUMNS, job_to_dict
+from search_index import SearchService, log_changes
+from json_provider import FastJSONProvider, choose_encoding, compress, is_compressible
+from suggest import SuggestService
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 创建 Flask 应用
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # 从环境变量读取配置
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -35,22 +63,92 @@ app.config['DB_NAME'] = os.getenv('DB_NAME', 'concept_research')
 app.config['ADMIN_USER'] = os.getenv('ADMIN_USER', 'admin')
 app.config['ADMIN_PASS'] = os.getenv('ADMIN_PASS', 'admin123')
 app.config['RECENT_DAYS'] = int(os.getenv('RECENT_DAYS', '7'))
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+app.config['DB_POOL_PING_INTERVAL'] = int(os.getenv('DB_POOL_PING_INTERVAL', '30'))
+app.config['DB_POOL_SLOW_CHECKOUT_MS'] = int(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', '100'))
+app.config['TAXONOMY_CACHE_TTL'] = int(os.getenv('TAXONOMY_CACHE_TTL', '60'))
+app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', '4096'))
+app.config['RESPONSE_CACHE_MAX_MB'] = int(os.getenv('RESPONSE_CACHE_MAX_MB', '64'))
+app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', '300'))
+app.config['RESPONSE_CACHE_LIST_TTL'] = int(os.getenv('RESPONSE_CACHE_LIST_TTL', '30'))
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+app.config['PASSWORD_WORKERS'] = int(os.getenv('PASSWORD_WORKERS', '2'))
+app.config['PASSWORD_MAX_PENDING'] = int(os.getenv('PASSWORD_MAX_PENDING', '32'))
+app.config['PASSWORD_TIMEOUT'] = int(os.getenv('PASSWORD_TIMEOUT', '10'))
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['LOGIN_MAX_FAILURES_USER'] = int(os.getenv('LOGIN_MAX_FAILURES_USER', '5'))
+app.config['LOGIN_MAX_FAILURES_IP'] = int(os.getenv('LOGIN_MAX_FAILURES_IP', '20'))
+app.config['LOGIN_THROTTLE_WINDOW'] = int(os.getenv('LOGIN_THROTTLE_WINDOW', '300'))
+app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', '1'))
+app.config['TOKEN_CACHE_SIZE'] = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+app.config['TOKEN_REVOCATION_SYNC'] = int(os.getenv('TOKEN_REVOCATION_SYNC', '5'))
+app.config['TOTALS_CACHE_SIZE'] = int(os.getenv('TOTALS_CACHE_SIZE', '2048'))
+app.config['TOTALS_CACHE_TTL'] = int(os.getenv('TOTALS_CACHE_TTL', '30'))
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', '500'))
+app.config['IMPORT_MAX_ERRORS'] = int(os.getenv('IMPORT_MAX_ERRORS', '1000'))
+app.config['IMPORT_MAX_RECORD_MB'] = int(os.getenv('IMPORT_MAX_RECORD_MB', '16'))
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', '1'))
+app.config['IMPORT_MAX_RUNNING'] = int(os.getenv('IMPORT_MAX_RUNNING', '1'))
+app.config['IMPORT_MAX_PENDING'] = int(os.getenv('IMPORT_MAX_PENDING', '4'))
+# 不按相关度排序时，搜索命中数不超过该值用 ID 列表过滤，超过时改用 LIKE
+app.config['SEARCH_SETTLE_SECONDS'] = int(os.getenv('SEARCH_SETTLE_SECONDS', '10'))
+app.config['SEARCH_REBUILD_INTERVAL'] = int(os.getenv('SEARCH_REBUILD_INTERVAL', '3600'))
+app.config['IMAGE_MAX_MB'] = int(os.getenv('IMAGE_MAX_MB', '10'))
+app.config['IMAGE_MAX_PIXELS'] = int(os.getenv('IMAGE_MAX_PIXELS', '40000000'))
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', '1'))
+app.config['IMAGE_WEBP_QUALITY'] = int(os.getenv('IMAGE_WEBP_QUALITY', '80'))
+# 指标：多进程汇总目录（gunicorn 部署时设置）、写入间隔秒数、/metrics 访问令牌、是否返回 Server-Timing
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = int(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['METRICS_SERVER_TIMING'] = os.getenv('METRICS_SERVER_TIMING', '1') == '1'
+# 慢查询：阈值毫秒数（0 关闭计时）、是否捕获执行计划、最多保存的语句指纹数、同一语句两次捕获执行计划的间隔秒数
+app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', '200'))
+app.config['SLOW_QUERY_EXPLAIN'] = os.getenv('SLOW_QUERY_EXPLAIN', '1') == '1'
+app.config['SLOW_QUERY_MAX_FINGERPRINTS'] = int(os.getenv('SLOW_QUERY_MAX_FINGERPRINTS', '500'))
+app.config['SLOW_QUERY_EXPLAIN_INTERVAL'] = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '600'))
+app.config['SLOW_QUERY_REDACT_TABLES'] = [t.strip() for t in os.getenv('SLOW_QUERY_REDACT_TABLES', 'user,token_revocation').split(',') if t.strip()]
+# 请求分析：单个请求采样间隔毫秒数；常驻采样器的默认间隔毫秒数、最多保存的不同调用栈数、各进程读取开关状态的间隔秒数
+app.config['PROFILE_SAMPLE_INTERVAL_MS'] = int(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '1'))
+app.config['PROFILING_SAMPLER_MS'] = int(os.getenv('PROFILING_SAMPLER_MS', '20'))
+app.config['PROFILING_MAX_STACKS'] = int(os.getenv('PROFILING_MAX_STACKS', '10000'))
+app.config['PROFILING_SYNC_INTERVAL'] = int(os.getenv('PROFILING_SYNC_INTERVAL', '10'))
+app.config['SCHEMA_LOCK_TIMEOUT'] = int(os.getenv('SCHEMA_LOCK_TIMEOUT', '300'))
+app.config['UPLOAD_GC_INTERVAL'] = int(os.getenv('UPLOAD_GC_INTERVAL', '3600'))
+app.config['UPLOAD_GC_GRACE'] = int(os.getenv('UPLOAD_GC_GRACE', '3600'))
+# 静态文件交给前端服务器发送：空（本进程发送）、x-accel-redirect（nginx）或 x-sendfile
+app.config['STATIC_OFFLOAD'] = os.getenv('STATIC_OFFLOAD', '').lower()
+app.config['STATIC_ACCEL_PREFIX'] = os.getenv('STATIC_ACCEL_PREFIX', '/_static/')
+app.config['EXPORT_CHUNK_SIZE'] = int(os.getenv('EXPORT_CHUNK_SIZE', '65536'))
+app.config['EXPORT_NET_WRITE_TIMEOUT'] = int(os.getenv('EXPORT_NET_WRITE_TIMEOUT', '600'))
+app.config['SNAPSHOT_WORKERS'] = int(os.getenv('SNAPSHOT_WORKERS', '4'))
+app.config['SNAPSHOT_GROUP_ROWS'] = int(os.getenv('SNAPSHOT_GROUP_ROWS', '5000'))
+app.config['SNAPSHOT_DIR'] = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'data', 'snapshots'))
+app.config['IMPORT_SPOOL_DIR'] = os.getenv('IMPORT_SPOOL_DIR', os.path.join(os.path.dirname(__file__), 'data', 'imports'))
+
+# 反向代理之后：按 X-Forwarded-For 中可信的最后 PROXY_FIX_X_FOR 跳取客户端地址（登录限流按 IP 计数），0 表示直接对外
+if app.config['PROXY_FIX_X_FOR'] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 
 # 开发环境启用 CORS
 if os.getenv('FLASK_ENV') == 'development':
     CORS(app, origins="http://localhost:5173", supports_credentials=True)
 
-# 确保上传目录存在
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
+# 确保上传目录存在（前端构建产物也在 static 目录下）
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+UPLOAD_FOLDER = os.path.join(STATIC_FOLDER, 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# 全局变量存储数据库连接
-db_connection = None
-
-def get_db_connection():
-    """获取数据库连接"""
+def create_db_connection():
+    """新建数据库连接（供连接池使用）"""
     try:
-        connection = pymysql.connect(
+        # 与 pymysql.connect 相同，另外记录每条 SQL 的耗时（见 metrics.py）
+        connection = InstrumentedConnection(
             host=app.config['DB_HOST'],
             port=app.config['DB_PORT'],
             user=app.config['DB_USER'],
@@ -64,190 +162,311 @@ def get_db_connection():
         logger.error(f"数据库连接失败: {e}")
         raise
 
-def ensure_schema():
-    """创建/更新数据库表结构"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # 创建公司表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS company (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(255) UNIQUE NOT NULL,
-                domain VARCHAR(255),
-                website VARCHAR(512),
-                address VARCHAR(255),
-                team_info TEXT,
-                funding_info TEXT,
-                field VARCHAR(255),
-                product TEXT,
-                problem TEXT,
-                method TEXT,
-                difference TEXT,
-                tech_core TEXT,
-                biz_model TEXT,
-                partners TEXT,
-                clients TEXT,
-                notes TEXT,
-                source_link VARCHAR(512),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_company_name (name)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建分类表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS category (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(128) UNIQUE NOT NULL,
-                parent_id BIGINT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (parent_id) REFERENCES category(id) ON DELETE SET NULL,
-                INDEX idx_category_parent (parent_id)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建概念表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS concept (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                term VARCHAR(128) UNIQUE NOT NULL,
-                plain_def TEXT,
-                mechanism TEXT,
-                examples TEXT,
-                image_path VARCHAR(512),
-                last_used TIMESTAMP NULL,
-                category_id BIGINT NULL,
-                FOREIGN KEY (category_id) REFERENCES category(id) ON DELETE SET NULL,
-                INDEX idx_concept_term (term),
-                INDEX idx_concept_cat (category_id, last_used)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建公司概念关联表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS company_concept (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                company_id BIGINT NOT NULL,
-                concept_id BIGINT NOT NULL,
-                UNIQUE(company_id, concept_id),
-                FOREIGN KEY (company_id) REFERENCES company(id) ON DELETE CASCADE,
-                FOREIGN KEY (concept_id) REFERENCES concept(id) ON DELETE CASCADE,
-                INDEX idx_cc_company (company_id),
-                INDEX idx_cc_concept (concept_id)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建分类概念关联表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS category_concept (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                category_id BIGINT NOT NULL,
-                concept_id BIGINT NOT NULL,
-                UNIQUE(category_id, concept_id),
-                FOREIGN KEY (category_id) REFERENCES category(id) ON DELETE CASCADE,
-                FOREIGN KEY (concept_id) REFERENCES concept(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建分类关系表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS category_relation (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                subject_id BIGINT NOT NULL,
-                predicate ENUM('broader','narrower','related') NOT NULL,
-                object_id BIGINT NOT NULL,
-                UNIQUE(subject_id, predicate, object_id),
-                FOREIGN KEY (subject_id) REFERENCES category(id) ON DELETE CASCADE,
-                FOREIGN KEY (object_id) REFERENCES category(id) ON DELETE CASCADE,
-                INDEX idx_cr_subject (subject_id)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建用户表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                role ENUM('admin','editor','viewer') NOT NULL DEFAULT 'viewer',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user_username (username),
-                INDEX idx_user_email (email)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        # 创建全文索引（若不存在）
+# 数据库连接池
+db_pool = ConnectionPool(
+    create_db_connection,
+    max_size=app.config['DB_POOL_SIZE'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    recycle=app.config['DB_POOL_RECYCLE'],
+    ping_interval=app.config['DB_POOL_PING_INTERVAL'],
+    slow_checkout_ms=app.config['DB_POOL_SLOW_CHECKOUT_MS']
+)
+
+# 请求指标（/metrics）；后台线程的查询也计入
+request_metrics = MetricsRegistry(
+    db_pool.stats,
+    directory=app.config['METRICS_DIR'],
+    flush_interval=app.config['METRICS_FLUSH_INTERVAL']
+)
+InstrumentedConnection.registry = request_metrics
+
+def current_query_context():
+    """慢查询日志中记录的调用位置：请求的路由或 background"""
+    if not has_request_context():
+        return 'background'
+    rule = request.url_rule
+    return f"{request.method} {rule.rule if rule else request.path}"
+
+# 慢查询日志（/api/slow-queries）；执行计划在连接池的另一个连接上捕获
+slow_query_log = SlowQueryLog(
+    threshold_ms=app.config['SLOW_QUERY_MS'],
+    pool=db_pool if app.config['SLOW_QUERY_EXPLAIN'] else None,
+    context=current_query_context,
+    max_fingerprints=app.config['SLOW_QUERY_MAX_FINGERPRINTS'],
+    explain_interval=app.config['SLOW_QUERY_EXPLAIN_INTERVAL'],
+    redact_tables=app.config['SLOW_QUERY_REDACT_TABLES']
+)
+if app.config['SLOW_QUERY_MS'] > 0:
+    InstrumentedConnection.slow_log = slow_query_log
+
+# 常驻调用栈采样器（/api/profiling/sampler），调用栈从 Flask.wsgi_app 开始
+stack_sampler = StackSampler(
+    interval_ms=app.config['PROFILING_SAMPLER_MS'],
+    max_stacks=app.config['PROFILING_MAX_STACKS'],
+    directory=app.config['METRICS_DIR'],
+    flush_interval=app.config['METRICS_FLUSH_INTERVAL'],
+    sync_interval=app.config['PROFILING_SYNC_INTERVAL'],
+    stop_at=Flask.wsgi_app.__code__
+)
+
+# 后台导入任务
+import_runner = ImportJobRunner(
+    db_pool,
+    app.config['IMPORT_SPOOL_DIR'],
+    workers=app.config['IMPORT_WORKERS'],
+    max_running=app.config['IMPORT_MAX_RUNNING'],
+    max_pending=app.config['IMPORT_MAX_PENDING'],
+    chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+    batch_size=app.config['IMPORT_BATCH_SIZE'],
+    max_errors=app.config['IMPORT_MAX_ERRORS'],
+    max_record_size=app.config['IMPORT_MAX_RECORD_MB'] * 1024 * 1024,
+    chunk_hook=lambda: import_chunk_hook()
+)
+
+# 搜索索引（字段, 权重）
+CONCEPT_SEARCH_FIELDS = ('term', 'plain_def', 'mechanism', 'examples')
+concept_search = SearchService(
+    db_pool,
+    'concept',
+    "SELECT id, term, plain_def, mechanism, examples, last_used FROM concept",
+    list(zip(CONCEPT_SEARCH_FIELDS, (3.0, 1.0, 1.0, 0.5))),
+    settle_seconds=app.config['SEARCH_SETTLE_SECONDS'],
+    rebuild_interval=app.config['SEARCH_REBUILD_INTERVAL'],
+    sort_fields=('term', 'last_used')
+)
+
+COMPANY_SEARCH_FIELDS = (
+    ('name', 4.0), ('field', 3.0), ('product', 2.0), ('tech_core', 1.5), ('notes', 1.0),
+    ('problem', 0.8), ('method', 0.8), ('difference', 0.8), ('biz_model', 0.8),
+    ('clients', 0.8), ('partners', 0.8), ('team_info', 0.5), ('funding_info', 0.5)
+)
+company_search = SearchService(
+    db_pool,
+    'company',
+    f"SELECT id, {', '.join(name for name, _ in COMPANY_SEARCH_FIELDS)} FROM company",
+    list(COMPANY_SEARCH_FIELDS),
+    settle_seconds=app.config['SEARCH_SETTLE_SECONDS'],
+    rebuild_interval=app.config['SEARCH_REBUILD_INTERVAL'],
+    sort_fields=('name',)
+)
+
+# 输入联想索引（按关联公司数、最近使用时间排序）
+concept_suggest = SuggestService(
+    db_pool,
+    'concept',
+    """
+        SELECT c.id, c.term, c.last_used,
+               (SELECT COUNT(*) FROM company_concept cc WHERE cc.concept_id = c.id) AS links
+        FROM concept c
+    """,
+    'term',
+    id_column='c.id',
+    settle_seconds=app.config['SEARCH_SETTLE_SECONDS'],
+    rebuild_interval=app.config['SEARCH_REBUILD_INTERVAL']
+)
+company_suggest = SuggestService(
+    db_pool,
+    'company',
+    """
+        SELECT co.id, co.name,
+               (SELECT COUNT(*) FROM company_concept cc WHERE cc.company_id = co.id) AS links
+        FROM company co
+    """,
+    'name',
+    id_column='co.id',
+    settle_seconds=app.config['SEARCH_SETTLE_SECONDS'],
+    rebuild_interval=app.config['SEARCH_REBUILD_INTERVAL']
+)
+
+def get_db_connection():
+    """获取当前请求的数据库连接（每个请求一个，请求结束时归还连接池）"""
+    if 'db_conn' not in g:
+        conn, created_at = db_pool.checkout()
+        g.db_conn = conn
+        g.db_conn_created_at = created_at
+        if request.method in ('GET', 'HEAD'):
+            # 读请求使用只读事务
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("START TRANSACTION READ ONLY")
+            except Exception:
+                db_pool.checkin(conn, created_at, broken=True)
+                g.pop('db_conn')
+                raise
+    return g.db_conn
+
+def return_db_connection():
+    """把当前请求的连接还给连接池（未提交的事务回滚），之后 get_db_connection 会重新取一个"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.checkin(conn, g.pop('db_conn_created_at'), broken=not conn.open)
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    """请求结束时归还数据库连接"""
+    return_db_connection()
+
+@app.before_request
+def start_profiling():
+    """常驻采样器登记本线程；管理员可用 X-Profile 头或 _profile 参数（cprofile / sample）分析本请求"""
+    if request.path.startswith('/api/') and stack_sampler.needs_sync():
+        cursor = get_db_connection().cursor()
         try:
-            cursor.execute(
-                """
-                SELECT COUNT(1) 
-                FROM information_schema.statistics
-                WHERE table_schema = %s 
-                  AND table_name = 'concept' 
-                  AND index_name = 'ft_concept_term_plain'
-                """,
-                (app.config['DB_NAME'],)
-            )
-            exists = cursor.fetchone()[0]
-            if not exists:
-                cursor.execute(
-                    """
-                    CREATE FULLTEXT INDEX ft_concept_term_plain 
-                    ON concept(term, plain_def, mechanism, examples)
-                    """
-                )
-                logger.info("全文索引创建成功")
-            else:
-                logger.info("全文索引已存在，跳过创建")
+            stack_sampler.sync(cursor)
         except Exception as e:
-            logger.warning(f"检查/创建全文索引时出错（可能不支持FULLTEXT）: {e}")
-        
-        conn.commit()
-        logger.info("数据库表结构创建/更新完成")
-        
-        # 检查是否需要创建默认管理员
-        cursor.execute("SELECT COUNT(*) FROM user")
-        user_count = cursor.fetchone()[0]
-        
-        if user_count == 0:
-            admin_password_hash = generate_password_hash(app.config['ADMIN_PASS'])
-            cursor.execute("""
-                INSERT INTO user (username, email, password_hash, role) 
-                VALUES (%s, %s, %s, 'admin')
-            """, (app.config['ADMIN_USER'], 'admin@example.com', admin_password_hash))
-            conn.commit()
-            logger.info(f"默认管理员账户已创建: {app.config['ADMIN_USER']} / {app.config['ADMIN_PASS']}")
-            logger.warning("请在生产环境中修改默认密码！")
-        
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"数据库初始化失败: {e}")
-        raise
-    finally:
-        cursor.close()
+            logger.warning(f"读取采样器状态失败: {e}")
+        finally:
+            cursor.close()
+    if stack_sampler.enabled:
+        stack_sampler.add_thread(current_query_context())
+    
+    mode = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not mode:
+        return None
+    if mode not in RequestProfiler.MODES:
+        return jsonify({'error': '分析模式无效'}), 400
+    auth_header = request.headers.get('Authorization', '')
+    payload = verify_token(auth_header.split(' ')[1]) if auth_header.startswith('Bearer ') else None
+    if not payload or payload['role'] != 'admin':
+        return jsonify({'error': '需要管理员权限'}), 403
+    
+    profiler = RequestProfiler(mode, current_query_context(),
+                               interval_ms=app.config['PROFILE_SAMPLE_INTERVAL_MS'],
+                               stop_at=Flask.wsgi_app.__code__)
+    try:
+        profiler.start()
+    except ProfilerBusy:
+        return jsonify({'error': '已有请求正在分析，请稍后重试'}), 409
+    g.profiler = profiler
+
+# 在 record_request_metrics 之前注册，最后执行：分析包括压缩，响应换成分析结果
+@app.after_request
+def return_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    data, mimetype, extension = profiler.result()
+    # 流式响应（导出）不再发送，生成器中的耗时不在分析结果中
+    response.close()
+    
+    profile = app.response_class(data, mimetype=mimetype)
+    filename = f"profile-{request.endpoint or 'unmatched'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    profile.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    profile.headers['Cache-Control'] = 'no-store'
+    profile.headers['X-Profile-Status'] = str(response.status_code)
+    if 'Server-Timing' in response.headers:
+        profile.headers['Server-Timing'] = response.headers['Server-Timing']
+    return profile
+
+@app.teardown_request
+def finish_profiling(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+    stack_sampler.remove_thread()
+
+@app.before_request
+def start_request_timer():
+    g.request_timer = begin_request()
+
+# 在其他 after_request 之前注册，最后执行：耗时和字节数包括压缩
+@app.after_request
+def record_request_metrics(response):
+    timer = g.pop('request_timer', None)
+    if timer is None:
+        return response
+    elapsed = time.perf_counter() - timer.start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_metrics.observe_request(route, request.method, response.status_code, elapsed,
+                                    timer, response.content_length or 0)
+    if app.config['METRICS_SERVER_TIMING']:
+        response.headers['Server-Timing'] = server_timing(timer, elapsed)
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    end_request()
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    logger.warning(f"数据库连接池耗尽: {e}")
+    return jsonify({'error': '服务繁忙，请稍后重试'}), 503
+
+# 密码哈希进程池和登录失败限流
+password_hasher = PasswordHasher(
+    workers=app.config['PASSWORD_WORKERS'],
+    max_pending=app.config['PASSWORD_MAX_PENDING'],
+    timeout=app.config['PASSWORD_TIMEOUT'],
+    method=app.config['PASSWORD_HASH_METHOD']
+)
+login_throttle = LoginThrottle(
+    max_user=app.config['LOGIN_MAX_FAILURES_USER'],
+    max_ip=app.config['LOGIN_MAX_FAILURES_IP'],
+    window=app.config['LOGIN_THROTTLE_WINDOW']
+)
+
+@app.errorhandler(HasherBusy)
+def handle_hasher_busy(e):
+    logger.warning(f"密码哈希繁忙: {e}")
+    return jsonify({'error': '服务繁忙，请稍后重试'}), 503, {'Retry-After': '1'}
+
+def ensure_schema():
+    """执行未执行的数据库迁移（见 migrations.py；已是最新时只需一次查询）"""
+    start = time.monotonic()
+    with db_pool.connection() as conn:
+        applied = migrate(conn, app.config, lock_timeout=app.config['SCHEMA_LOCK_TIMEOUT'])
+    elapsed_ms = (time.monotonic() - start) * 1000
+    if applied:
+        logger.info(f"数据库迁移完成: {applied}，耗时 {elapsed_ms:.0f}ms")
+    else:
+        logger.info(f"数据库表结构已是最新，检查耗时 {elapsed_ms:.1f}ms")
+
+TOKEN_LIFETIME = timedelta(hours=24)
+
+# 已验证令牌的缓存；修改角色、密码或删除用户时吊销其令牌
+token_cache = TokenCache(
+    max_entries=app.config['TOKEN_CACHE_SIZE'],
+    sync_interval=app.config['TOKEN_REVOCATION_SYNC'],
+    max_age=int(TOKEN_LIFETIME.total_seconds())
+)
 
 def generate_token(user):
     """生成 JWT token"""
+    now = time.time()
     payload = {
         'user_id': user['id'],
         'username': user['username'],
         'role': user['role'],
-        'exp': datetime.utcnow() + timedelta(hours=24)
+        # 精确到毫秒，与吊销时间比较
+        'iat': round(now, 3),
+        'exp': int(now + TOKEN_LIFETIME.total_seconds())
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
 def verify_token(token):
-    """验证 JWT token"""
-    try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+    """验证 JWT token（验证过的令牌缓存到过期为止）"""
+    payload = token_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return None
+        except jwt.InvalidTokenError:
+            return None
+        token_cache.set(token, payload)
+    
+    if token_cache.needs_sync():
+        cursor = get_db_connection().cursor()
+        try:
+            token_cache.sync(cursor)
+        except Exception as e:
+            logger.warning(f"读取令牌吊销列表失败: {e}")
+        finally:
+            cursor.close()
+    
+    if token_cache.is_revoked(payload):
         return None
+    return payload
 
 def auth_required(required_role=None):
     """权限验证装饰器"""
@@ -278,6 +497,120 @@ def auth_required(required_role=None):
         return decorated_function
     return decorator
 
+# 缓存版本号：写操作在事务中递增，读接口的缓存按所依赖的版本号失效
+# 分类树类接口：分类、概念归属变化
+TAXONOMY_VERSION = 'taxonomy'
+# 分类名称变化
+CATEGORIES_VERSION = 'categories'
+# 概念、公司列表
+CONCEPTS_VERSION = 'concepts'
+COMPANIES_VERSION = 'companies'
+# 单条记录按 ID 分桶（concept:<n> / company:<n>），避免版本号行无限增长
+VERSION_BUCKETS = 1024
+
+response_cache = ResponseCache(
+    max_entries=app.config['RESPONSE_CACHE_SIZE'],
+    max_bytes=app.config['RESPONSE_CACHE_MAX_MB'] * 1024 * 1024
+)
+
+def entity_versions(kind, ids):
+    """单条记录的版本号名称"""
+    return sorted({f"{kind}:{int(entity_id) % VERSION_BUCKETS}" for entity_id in ids})
+
+def linked_companies(cursor, concept_ids):
+    """关联了这些概念的公司 ID"""
+    if not concept_ids:
+        return []
+    cursor.execute("""
+        SELECT DISTINCT company_id FROM company_concept WHERE concept_id IN ({})
+    """.format(','.join(['%s'] * len(concept_ids))), list(concept_ids))
+    return [row[0] for row in cursor.fetchall()]
+
+def response_cached(ttl, versions=()):
+    """按路由、参数和角色缓存 GET 接口的 200 响应，并用 ETag 支持 304
+
+    versions 为所依赖的版本号名称列表，或按路由参数返回该列表的函数；版本号
+    变化或超过 ttl 秒后重新生成。并发的相同请求只有一个访问数据库。
+    需放在 auth_required 之后。
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # 分析请求时不使用缓存，分析结果包括生成响应的过程
+            if 'profiler' in g:
+                return f(*args, **kwargs)
+            names = list(versions(**kwargs) if callable(versions) else versions)
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            try:
+                current = get_versions(cursor, names)
+            finally:
+                cursor.close()
+            
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                request.current_user['role']
+            )
+            cached = response_cache.get(key, current)
+            if cached is None:
+                # 等待其他请求生成响应期间不占用连接，需要自行生成时再取
+                with response_cache.single_flight(key, before_wait=return_db_connection) as leader:
+                    if not leader:
+                        cached = response_cache.get(key, current)
+                    if cached is None:
+                        response = app.make_response(f(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        cached = response_cache.set(key, current, response.get_data(), ttl,
+                                                    mimetype=response.mimetype)
+            
+            response = app.response_class(cached.body, mimetype=cached.mimetype)
+            response.set_etag(cached.etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return compress_response(response.make_conditional(request), cached.variants)
+        return decorated_function
+    return decorator
+
+def compress_response(response, variants=None):
+    """按 Accept-Encoding 压缩不小于 COMPRESS_MIN_SIZE 的文本响应
+
+    variants 用于保存同一响应体的压缩结果（缓存的响应只压缩一次）
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    
+    compressed = variants.get(encoding) if variants is not None else None
+    if compressed is None:
+        with phase('compress'):
+            compressed = compress(data, encoding,
+                                  gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+                                  brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        if variants is not None:
+            variants[encoding] = compressed
+    
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的内容与原文不再逐字节相同，ETag 改为弱校验
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.after_request
+def compress_after_request(response):
+    return compress_response(response)
+
 # 身份认证相关路由
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -289,6 +622,10 @@ def login():
     if not username or not password:
         return jsonify({'error': '用户名和密码不能为空'}), 400
     
+    retry_after = login_throttle.retry_after(username, request.remote_addr)
+    if retry_after:
+        return jsonify({'error': '登录失败次数过多，请稍后再试'}), 429, {'Retry-After': str(retry_after)}
+    
     conn = get_db_connection()
     cursor = conn.cursor(pymysql.cursors.DictCursor)
     
@@ -296,7 +633,10 @@ def login():
         cursor.execute("SELECT * FROM user WHERE username = %s", (username,))
         user = cursor.fetchone()
         
-        if user and check_password_hash(user['password_hash'], password):
+        if user and password_hasher.verify(user['password_hash'], password):
+            login_throttle.success(username)
+            if password_hasher.needs_rehash(user['password_hash']):
+                rehash_password(cursor, user, password)
             token = generate_token(user)
             return jsonify({
                 'token': token,
@@ -307,14 +647,30 @@ def login():
                 }
             })
         else:
+            login_throttle.failure(username, request.remote_addr)
             return jsonify({'error': '用户名或密码不正确'}), 401
     
+    except HasherBusy:
+        raise
     except Exception as e:
         logger.error(f"登录错误: {e}")
         return jsonify({'error': '登录失败'}), 500
     finally:
         cursor.close()
 
+def rehash_password(cursor, user, password):
+    """登录成功后按当前参数重新生成密码哈希（失败不影响登录）"""
+    try:
+        password_hash = password_hasher.hash(password)
+        cursor.execute(
+            "UPDATE user SET password_hash = %s WHERE id = %s AND password_hash = %s",
+            (password_hash, user['id'], user['password_hash'])
+        )
+        cursor.connection.commit()
+    except Exception as e:
+        cursor.connection.rollback()
+        logger.warning(f"更新用户 {user['id']} 的密码哈希失败: {e}")
+
 @app.route('/api/auth/me', methods=['GET'])
 @auth_required()
 def get_current_user():
@@ -337,11 +693,6 @@ def get_users():
         cursor.execute("SELECT id, username, email, role, created_at FROM user ORDER BY created_at DESC")
         users = cursor.fetchall()
         
-        # 格式化日期
-        for user in users:
-            if user['created_at']:
-                user['created_at'] = user['created_at'].strftime('%Y-%m-%d')
-        
         return jsonify({'items': users})
     
     except Exception as e:
@@ -366,11 +717,12 @@ def create_user():
     if role not in ['admin', 'editor', 'viewer']:
         return jsonify({'error': '无效的角色'}), 400
     
+    password_hash = password_hasher.hash(password)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        password_hash = generate_password_hash(password)
         cursor.execute("""
             INSERT INTO user (username, email, password_hash, role) 
             VALUES (%s, %s, %s, %s)
@@ -399,6 +751,7 @@ def create_user():
 def update_user(user_id):
     """更新用户信息"""
     data = request.get_json()
+    password_hash = password_hasher.hash(data['password']) if 'password' in data else None
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -407,8 +760,7 @@ def update_user(user_id):
         updates = []
         params = []
         
-        if 'password' in data:
-            password_hash = generate_password_hash(data['password'])
+        if password_hash:
             updates.append("password_hash = %s")
             params.append(password_hash)
         
@@ -428,7 +780,10 @@ def update_user(user_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '用户不存在'}), 404
         
+        # 角色或密码变化后，已签发的令牌立即失效
+        revoked_at = token_cache.revoke(cursor, user_id)
         conn.commit()
+        token_cache.revoked(user_id, revoked_at)
         return jsonify({'ok': True})
     
     except Exception as e:
@@ -454,7 +809,9 @@ def delete_user(user_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '用户不存在'}), 404
         
+        revoked_at = token_cache.revoke(cursor, user_id)
         conn.commit()
+        token_cache.revoked(user_id, revoked_at)
         return jsonify({'ok': True})
     
     except Exception as e:
@@ -463,9 +820,25 @@ def delete_user(user_id):
     finally:
         cursor.close()
 
+def category_ancestors(category_dict):
+    """计算每个分类的祖先集合（包含自身），父子关系成环时在环处截断"""
+    ancestors = {}
+    for cat_id in category_dict:
+        seen = set()
+        current = cat_id
+        while current is not None and current in category_dict and current not in seen:
+            if current in ancestors:
+                seen.update(ancestors[current])
+                break
+            seen.add(current)
+            current = category_dict[current]['parent_id']
+        ancestors[cat_id] = frozenset(seen)
+    return ancestors
+
 # 分类相关路由
 @app.route('/api/categories/flat', methods=['GET'])
 @auth_required()
+@response_cached(app.config['TAXONOMY_CACHE_TTL'], [TAXONOMY_VERSION])
 def get_categories_flat():
     """获取所有分类（平铺）"""
     conn = get_db_connection()
@@ -484,8 +857,13 @@ def get_categories_flat():
 
 @app.route('/api/categories/tree', methods=['GET'])
 @auth_required()
+@response_cached(app.config['TAXONOMY_CACHE_TTL'], [TAXONOMY_VERSION])
 def get_categories_tree():
-    """获取分类树结构"""
+    """获取分类树结构
+
+    每个分类返回 count_main（主分类概念数）、count_extra（附加分类概念数）、
+    count_total（两者去重）和 count_subtree（含所有子孙分类，去重）
+    """
     conn = get_db_connection()
     cursor = conn.cursor(pymysql.cursors.DictCursor)
     
@@ -507,21 +885,62 @@ def get_categories_tree():
                 if parent:
                     parent['children'].append(cat)
         
-        # 计算每个分类的主分类概念数
-        for cat in categories:
-            cursor.execute("SELECT COUNT(*) AS cnt FROM concept WHERE category_id = %s", (cat['id'],))
-            cat['count_main'] = cursor.fetchone()['cnt']
-        
-        # 计算统计信息
-        cursor.execute("SELECT COUNT(*) AS cnt FROM concept")
-        count_all = cursor.fetchone()['cnt']
+        # 主分类概念数、总数、未分类数和最近使用数：一次聚合查询
+        recent_days = int(app.config['RECENT_DAYS'])
+        cursor.execute(f"""
+            SELECT category_id, COUNT(*) AS cnt,
+                   SUM(last_used >= NOW() - INTERVAL {recent_days} DAY) AS recent
+            FROM concept
+            GROUP BY category_id
+        """)
+        main_counts = {}
+        count_all = count_uncat = count_recent = 0
+        for row in cursor.fetchall():
+            count_all += row['cnt']
+            count_recent += int(row['recent'] or 0)
+            if row['category_id'] is None:
+                count_uncat = row['cnt']
+            else:
+                main_counts[row['category_id']] = row['cnt']
         
-        cursor.execute("SELECT COUNT(*) AS cnt FROM concept WHERE category_id IS NULL")
-        count_uncat = cursor.fetchone()['cnt']
+        # 附加分类关联
+        cursor.execute("""
+            SELECT cc.category_id, cc.concept_id, c.category_id AS main_id
+            FROM category_concept cc
+            JOIN concept c ON cc.concept_id = c.id
+        """)
+        extra_links = cursor.fetchall()
+        
+        ancestors = category_ancestors(category_dict)
+        
+        # 子树主分类概念数：每个分类的计数累加到自身及所有祖先
+        subtree_main = dict.fromkeys(category_dict, 0)
+        for cat_id, cnt in main_counts.items():
+            for ancestor_id in ancestors.get(cat_id, ()):
+                subtree_main[ancestor_id] += cnt
+        
+        # 附加分类：主分类不在同一子树内的概念才额外计数（按概念去重）
+        count_extra = dict.fromkeys(category_dict, 0)
+        count_extra_only = dict.fromkeys(category_dict, 0)
+        subtree_extra = {}
+        for link in extra_links:
+            cat_id = link['category_id']
+            if cat_id not in category_dict:
+                continue
+            count_extra[cat_id] += 1
+            if link['main_id'] != cat_id:
+                count_extra_only[cat_id] += 1
+            main_ancestors = ancestors.get(link['main_id'], ())
+            for ancestor_id in ancestors[cat_id]:
+                if ancestor_id not in main_ancestors:
+                    subtree_extra.setdefault(ancestor_id, set()).add(link['concept_id'])
         
-        recent_days = int(app.config['RECENT_DAYS'])
-        cursor.execute(f"SELECT COUNT(*) AS cnt FROM concept WHERE last_used >= NOW() - INTERVAL {recent_days} DAY")
-        count_recent = cursor.fetchone()['cnt']
+        for cat in categories:
+            cat_id = cat['id']
+            cat['count_main'] = main_counts.get(cat_id, 0)
+            cat['count_extra'] = count_extra[cat_id]
+            cat['count_total'] = cat['count_main'] + count_extra_only[cat_id]
+            cat['count_subtree'] = subtree_main[cat_id] + len(subtree_extra.get(cat_id, ()))
         
         return jsonify({
             'tree': root_categories,
@@ -539,6 +958,7 @@ def get_categories_tree():
 
 @app.route('/api/categories/with-concepts', methods=['GET'])
 @auth_required()
+@response_cached(app.config['TAXONOMY_CACHE_TTL'], [TAXONOMY_VERSION])
 def get_categories_with_concepts():
     """获取包含概念信息的分类树结构"""
     conn = get_db_connection()
@@ -648,7 +1068,6 @@ def get_categories_with_concepts():
         return jsonify({'error': '获取分类概念树失败'}), 500
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/api/category', methods=['POST'])
 @auth_required('editor')
@@ -667,6 +1086,7 @@ def create_category():
     try:
         cursor.execute("INSERT INTO category (name, parent_id) VALUES (%s, %s)", (name, parent_id))
         category_id = cursor.lastrowid
+        bump_version(cursor, TAXONOMY_VERSION, CATEGORIES_VERSION)
         conn.commit()
         
         return jsonify({'id': category_id, 'name': name, 'parent_id': parent_id}), 201
@@ -732,6 +1152,7 @@ def update_category(category_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '分类不存在'}), 404
         
+        bump_version(cursor, TAXONOMY_VERSION, CATEGORIES_VERSION)
         conn.commit()
         return jsonify({'ok': True})
     
@@ -766,6 +1187,7 @@ def delete_category(category_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '分类不存在'}), 404
         
+        bump_version(cursor, TAXONOMY_VERSION, CATEGORIES_VERSION)
         conn.commit()
         return jsonify({'ok': True})
     
@@ -775,11 +1197,89 @@ def delete_category(category_id):
     finally:
         cursor.close()
 
+# 列表排序键：(排序列, 从结果行取排序键值)，末尾的唯一 id 保证顺序确定，供游标分页使用
+# 排序键、取行排序键值的函数、游标中各键允许的类型、排序键值 -> 内存排序键（对搜索命中排序）
+CONCEPT_SORTS = {
+    'term': (
+        [('c.term', 'ASC'), ('c.id', 'ASC')],
+        lambda row: [row['term'], row['id']],
+        [(str,), (int,)],
+        lambda values: (values[0].casefold(), values[0], values[1])
+    ),
+    'last_used': (
+        [('(c.last_used IS NULL)', 'ASC'), ('c.last_used', 'DESC'), ('c.term', 'ASC'), ('c.id', 'ASC')],
+        lambda row: [int(row['last_used'] is None), row['last_used'], row['term'], row['id']],
+        [(int,), (datetime, type(None)), (str,), (int,)],
+        lambda values: (values[0], datetime.max - values[1] if values[1] else timedelta(0),
+                        values[2].casefold(), values[2], values[3])
+    ),
+}
+
+COMPANY_SORT = (
+    [('name', 'ASC'), ('id', 'ASC')],
+    lambda row: [row['name'], row['id']],
+    [(str,), (int,)],
+    lambda values: (values[0].casefold(), values[0], values[1])
+)
+
+TOTAL_MODES = ('exact', 'cached', 'estimate', 'none')
+totals_cache = LRUCache(max_entries=app.config['TOTALS_CACHE_SIZE'], ttl=app.config['TOTALS_CACHE_TTL'])
+
+def count_total(cursor, mode, from_sql, where_clause, params, version_name):
+    """按 total 参数计算列表总数
+
+    exact: 每次 COUNT(*)；cached: 按过滤条件缓存 COUNT(*) 结果，相应版本号变化或超过
+    TOTALS_CACHE_TTL 后重新计算；estimate: 取 EXPLAIN 或表统计信息的估算行数；
+    none: 不计算，前端只用 has_more
+    """
+    if mode == 'none':
+        return None
+    if mode == 'estimate':
+        return estimate_rows(cursor, from_sql, where_clause, params)
+    
+    key = None
+    if mode == 'cached':
+        key = (from_sql, where_clause, tuple(params), get_version(cursor, version_name))
+        total = totals_cache.get(key)
+        if total is not None:
+            return total
+    
+    cursor.execute(f"SELECT COUNT(*) AS cnt FROM {from_sql} {where_clause}", params)
+    total = cursor.fetchone()['cnt']
+    if key is not None:
+        totals_cache.set(key, total)
+    return total
+
+def estimate_rows(cursor, from_sql, where_clause, params):
+    """估算行数：无过滤条件时读表统计信息，否则取 EXPLAIN 的行数估算"""
+    if not where_clause:
+        cursor.execute("""
+            SELECT TABLE_ROWS AS cnt FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (from_sql.split()[0],))
+        row = cursor.fetchone()
+        return int(row['cnt'] or 0) if row else 0
+    
+    cursor.execute(f"EXPLAIN SELECT 1 FROM {from_sql} {where_clause}", params)
+    plan = cursor.fetchall()
+    if not plan:
+        return 0
+    rows = plan[0].get('rows') or 0
+    filtered = plan[0].get('filtered') or 100
+    return int(rows * float(filtered) / 100)
+
 # 概念相关路由
 @app.route('/api/concepts', methods=['GET'])
 @auth_required()
+@response_cached(app.config['RESPONSE_CACHE_LIST_TTL'], [CONCEPTS_VERSION, CATEGORIES_VERSION])
 def get_concepts():
-    """查询概念列表"""
+    """查询概念列表
+
+    传 cursor（或 paging=cursor 取第一页）时使用游标分页，返回 next_cursor / prev_cursor；
+    否则按 page 偏移分页。total 参数选择总数的计算方式（见 count_total）。
+    q 由内存搜索索引匹配（索引构建完成前返回 503），命中在内存中排序分页，
+    sort=relevance 时按相关度排序
+    """
     # 获取查询参数
     q = request.args.get('q', '')
     cat_id = request.args.get('cat_id')
@@ -787,6 +1287,12 @@ def get_concepts():
     page = int(request.args.get('page', 1))
     page_size = min(int(request.args.get('page_size', 50)), 200)
     use_ft = request.args.get('use_ft', '0') == '1'
+    cursor_token = request.args.get('cursor')
+    keyset = bool(cursor_token) or request.args.get('paging') == 'cursor'
+    total_mode = request.args.get('total', 'exact')
+    
+    if total_mode not in TOTAL_MODES:
+        return jsonify({'error': '无效的 total 参数'}), 400
     
     conn = get_db_connection()
     cursor = conn.cursor(pymysql.cursors.DictCursor)
@@ -797,30 +1303,30 @@ def get_concepts():
         params = []
         
         # 关键词搜索
+        hits = None
         if q:
             if use_ft:
                 # 全文搜索
                 words = q.split()
                 ft_query = ' '.join([f'+{word}*' for word in words])
-                where_conditions.append(f"MATCH(term, plain_def, mechanism, examples) AGAINST (%s IN BOOLEAN MODE)")
+                where_conditions.append(f"MATCH(c.term, c.plain_def, c.mechanism, c.examples) AGAINST (%s IN BOOLEAN MODE)")
                 params.append(ft_query)
             else:
-                # LIKE 搜索
-                search_term = f"%{q}%"
-                where_conditions.append("(term LIKE %s OR plain_def LIKE %s OR mechanism LIKE %s OR examples LIKE %s)")
-                params.extend([search_term, search_term, search_term, search_term])
+                hits = concept_search.search(cursor, q)
+                if hits is None:
+                    return jsonify({'error': '搜索索引正在构建，请稍后再试'}), 503
         
         # 分类筛选
         if cat_id:
             if cat_id == '-1':  # 未分类
-                where_conditions.append("category_id IS NULL")
+                where_conditions.append("c.category_id IS NULL")
             elif cat_id == '-2':  # 最近使用
                 recent_days = int(app.config['RECENT_DAYS'])
-                where_conditions.append(f"last_used >= NOW() - INTERVAL {recent_days} DAY")
+                where_conditions.append(f"c.last_used >= NOW() - INTERVAL {recent_days} DAY")
             else:
                 # 具体分类（包括主分类和附加分类）
                 where_conditions.append("""
-                    (category_id = %s OR id IN (
+                    (c.category_id = %s OR c.id IN (
                         SELECT concept_id FROM category_concept WHERE category_id = %s
                     ))
                 """)
@@ -831,50 +1337,87 @@ def get_concepts():
         if where_conditions:
             where_clause = "WHERE " + " AND ".join(where_conditions)
         
-        # 排序
-        order_clause = ""
-        if sort == 'last_used':
-            order_clause = "ORDER BY (last_used IS NULL) ASC, last_used DESC, term ASC"
-        else:
-            order_clause = "ORDER BY term ASC"
-        
-        # 分页
-        offset = (page - 1) * page_size
-        
-        # 查询数据
-        sql = f"""
+        sort_keys = CONCEPT_SORTS.get(sort, CONCEPT_SORTS['term'])
+        # image_thumb：最小的可用图片（缩略图、WebP 或原图）
+        select_sql = """
             SELECT c.id, c.term, c.plain_def, c.mechanism, c.examples, 
-                   c.category_id, cat.name as category, c.last_used
+                   c.category_id, cat.name as category, c.last_used,
+                   COALESCE(JSON_UNQUOTE(JSON_EXTRACT(c.image_variants, '$.thumb.path')),
+                            JSON_UNQUOTE(JSON_EXTRACT(c.image_variants, '$.webp.path')),
+                            c.image_path) AS image_thumb
             FROM concept c
             LEFT JOIN category cat ON c.category_id = cat.id
-            {where_clause}
-            {order_clause}
-            LIMIT %s OFFSET %s
         """
         
-        params.extend([page_size, offset])
-        cursor.execute(sql, params)
-        concepts = cursor.fetchall()
-        
-        # 查询总数
-        count_sql = f"SELECT COUNT(*) AS cnt FROM concept c {where_clause}"
-        cursor.execute(count_sql, params[:-2])  # 去掉 LIMIT 和 OFFSET 参数
-        total = cursor.fetchone()['cnt']
-        
-        # 格式化日期
-        for concept in concepts:
-            if concept['last_used']:
-                concept['last_used'] = concept['last_used'].strftime('%Y-%m-%d')
+        if hits is not None:
+            # 命中由索引给出，排序和分页在内存中完成，数据库只过滤分类、按主键取当前页
+            relevance = sort == 'relevance'
+            keyset = keyset and not relevance
+            if relevance:
+                ordered = hits.ranked()
+            else:
+                sort_rows = hits.sorted_rows(key=lambda row: sort_keys[3](sort_keys[1](row)))
+            if cat_id and hits:
+                cursor.execute(f"SELECT c.id FROM concept c {where_clause}", params)
+                allowed = {row['id'] for row in cursor.fetchall()}
+                if relevance:
+                    ordered = [doc_id for doc_id in ordered if doc_id in allowed]
+                else:
+                    sort_rows = [row for row in sort_rows if row['id'] in allowed]
+            
+            if keyset:
+                concepts, next_cursor, prev_cursor = fetch_sorted_page(
+                    cursor, select_sql, 'c.id', sort_rows, sort_keys, page_size, cursor_token
+                )
             else:
-                concept['last_used'] = None
+                if not relevance:
+                    ordered = [row['id'] for row in sort_rows]
+                concepts, has_more = fetch_ranked_page(cursor, select_sql, 'c.id', ordered, page, page_size)
+            total = (len(ordered) if relevance else len(sort_rows)) if total_mode != 'none' else None
+        else:
+            if keyset:
+                # 游标分页
+                concepts, next_cursor, prev_cursor = fetch_keyset_page(
+                    cursor, select_sql, where_conditions, params, sort_keys, page_size, cursor_token
+                )
+            else:
+                # 偏移分页（兼容模式）
+                offset = (page - 1) * page_size
+                sql = f"""
+                    {select_sql}
+                    {where_clause}
+                    {order_clause(sort_keys[0])}
+                    LIMIT %s OFFSET %s
+                """
+                cursor.execute(sql, params + [page_size + 1, offset])
+                concepts = cursor.fetchall()
+                has_more = len(concepts) > page_size
+                concepts = concepts[:page_size]
+            
+            # 查询总数
+            total = count_total(cursor, total_mode, 'concept c', where_clause, params, CONCEPTS_VERSION)
         
-        return jsonify({
+        result = {
             'items': concepts,
             'total': total,
-            'page': page,
+            'total_mode': total_mode,
             'page_size': page_size
-        })
+        }
+        if keyset:
+            result.update({
+                'next_cursor': next_cursor,
+                'prev_cursor': prev_cursor,
+                'has_more': next_cursor is not None
+            })
+        else:
+            result.update({
+                'page': page,
+                'has_more': has_more
+            })
+        return jsonify(result)
     
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"查询概念列表错误: {e}")
         return jsonify({'error': '查询概念列表失败'}), 500
@@ -883,6 +1426,8 @@ def get_concepts():
 
 @app.route('/api/concept/<int:concept_id>', methods=['GET'])
 @auth_required()
+@response_cached(app.config['RESPONSE_CACHE_TTL'],
+                 lambda concept_id: entity_versions('concept', [concept_id]) + [CATEGORIES_VERSION])
 def get_concept(concept_id):
     """获取单个概念详情"""
     conn = get_db_connection()
@@ -910,11 +1455,8 @@ def get_concept(concept_id):
         """, (concept_id,))
         extra_categories = cursor.fetchall()
         
-        # 格式化日期
-        if concept['last_used']:
-            concept['last_used'] = concept['last_used'].strftime('%Y-%m-%d')
-        
         concept['extra_categories'] = extra_categories
+        concept['image_variants'] = load_variants(concept.get('image_variants'))
         
         return jsonify(concept)
     
@@ -948,6 +1490,8 @@ def create_concept():
         """, (term, plain_def, mechanism, examples, category_id))
         
         concept_id = cursor.lastrowid
+        log_changes(cursor, 'concept', [concept_id])
+        bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION)
         conn.commit()
         
         return jsonify({'id': concept_id}), 201
@@ -1018,6 +1562,11 @@ def update_concept(concept_id):
                     VALUES (%s, %s)
                 """, (cat_id, concept_id))
         
+        # 公司详情中显示关联概念的术语和解释
+        companies = linked_companies(cursor, [concept_id]) if 'term' in data or 'plain_def' in data else []
+        log_changes(cursor, 'concept', [concept_id])
+        bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION,
+                     *entity_versions('concept', [concept_id]), *entity_versions('company', companies))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1060,6 +1609,11 @@ def quick_update_concept(concept_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '概念不存在'}), 404
         
+        log_changes(cursor, 'concept', [concept_id])
+        # 仅更新 last_used 也会改变分类树中的最近使用数（count_recent），同样递增 TAXONOMY_VERSION
+        companies = linked_companies(cursor, [concept_id]) if 'term' in data or 'plain_def' in data else []
+        bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION,
+                     *entity_versions('concept', [concept_id]), *entity_versions('company', companies))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1085,6 +1639,7 @@ def move_concept(concept_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '概念不存在'}), 404
         
+        bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION, *entity_versions('concept', [concept_id]))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1118,11 +1673,13 @@ def bulk_concepts():
             """.format(','.join(['%s'] * len(concept_ids))), 
             [category_id] + concept_ids)
             
+            bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION, *entity_versions('concept', concept_ids))
             conn.commit()
             return jsonify({'ok': True})
         
         elif operation == 'delete':
-            # 删除关联
+            # 删除关联（关联公司的详情和联想排序随之更新）
+            companies = linked_companies(cursor, concept_ids)
             cursor.execute("""
                 DELETE FROM company_concept 
                 WHERE concept_id IN ({})
@@ -1140,6 +1697,10 @@ def bulk_concepts():
             """.format(','.join(['%s'] * len(concept_ids))), concept_ids)
             
             deleted_count = cursor.rowcount
+            log_changes(cursor, 'concept', concept_ids)
+            log_changes(cursor, 'company', companies)
+            bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION,
+                         *entity_versions('concept', concept_ids), *entity_versions('company', companies))
             conn.commit()
             return jsonify({'ok': True, 'deleted': deleted_count})
         
@@ -1155,7 +1716,15 @@ def bulk_concepts():
 @app.route('/api/concept/<int:concept_id>/image', methods=['POST'])
 @auth_required('editor')
 def upload_concept_image(concept_id):
-    """上传概念图片"""
+    """上传概念图片
+
+    按块保存并限制大小，按文件内容判断格式；缩略图和 WebP 版本在后台生成
+    """
+    max_bytes = app.config['IMAGE_MAX_MB'] * 1024 * 1024
+    # 明显超过上限的请求不必读取请求体
+    if request.content_length and request.content_length > max_bytes + 64 * 1024:
+        return jsonify({'error': f"图片不能超过 {app.config['IMAGE_MAX_MB']}MB"}), 413
+    
     if 'image' not in request.files:
         return jsonify({'error': '没有上传文件'}), 400
     
@@ -1163,89 +1732,187 @@ def upload_concept_image(concept_id):
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
     
-    # 检查文件类型
-    allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-    if not ('.' in file.filename and 
-            file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
-        return jsonify({'error': '只支持 PNG, JPG, JPEG, GIF 格式'}), 400
+    # 按内容哈希保存，同一张图片只存一份；扩展名由文件内容决定
+    try:
+        filename, _ = save_upload(file.stream, UPLOAD_FOLDER, max_bytes)
+    except ImageError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"保存图片错误: {e}")
+        return jsonify({'error': '上传图片失败'}), 500
     
-    # 生成安全文件名
-    filename = secure_filename(file.filename)
-    filename = f"{concept_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
     try:
-        file.save(filepath)
-        
-        # 更新数据库
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        relative_path = f"uploads/{filename}"
-        cursor.execute("UPDATE concept SET image_path = %s WHERE id = %s", (relative_path, concept_id))
+        relative_path = f"{UPLOAD_URL_PREFIX}{filename}"
+        cursor.execute(
+            "UPDATE concept SET image_path = %s, image_variants = NULL WHERE id = %s",
+            (relative_path, concept_id)
+        )
+        if cursor.rowcount == 0:
+            # 文件可能与其他概念共用，由清理线程按引用回收
+            return jsonify({'error': '概念不存在'}), 404
+        bump_version(cursor, CONCEPTS_VERSION, *entity_versions('concept', [concept_id]))
         conn.commit()
-        
-        return jsonify({'ok': True, 'image_path': relative_path})
     
     except Exception as e:
+        conn.rollback()
         logger.error(f"上传图片错误: {e}")
         return jsonify({'error': '上传图片失败'}), 500
+    finally:
+        cursor.close()
+    
+    image_processor.submit(concept_id, relative_path)
+    return jsonify({'ok': True, 'image_path': relative_path, 'processing': image_processor.enabled})
+
+def save_image_variants(concept_id, image_path, variants):
+    """缩略图生成后写回数据库
+
+    写入所有引用同一图片的概念；图片已被再次替换的概念不受影响。
+    """
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM concept WHERE image_path = %s FOR UPDATE", (image_path,))
+            ids = [row[0] for row in cursor.fetchall()]
+            if ids:
+                cursor.execute(
+                    "UPDATE concept SET image_variants = %s WHERE image_path = %s",
+                    (json.dumps(variants), image_path)
+                )
+                bump_version(cursor, CONCEPTS_VERSION, *entity_versions('concept', ids))
+            conn.commit()
+        finally:
+            cursor.close()
+
+# 概念图片的缩略图在后台线程中生成
+image_processor = ImageProcessor(
+    UPLOAD_FOLDER,
+    save_image_variants,
+    workers=app.config['IMAGE_WORKERS'],
+    max_pixels=app.config['IMAGE_MAX_PIXELS'],
+    quality=app.config['IMAGE_WEBP_QUALITY']
+)
+
+def upload_references(cursor):
+    """所有被引用的上传文件路径：概念原图及其缩略图（每个引用产出一次）"""
+    cursor.execute("SELECT image_path, image_variants FROM concept WHERE image_path IS NOT NULL")
+    for image_path, image_variants in cursor.fetchall():
+        yield image_path
+        for variant in (load_variants(image_variants) or {}).values():
+            if variant.get('path'):
+                yield variant['path']
+
+# 定期删除没有概念引用的上传文件
+upload_sweeper = UploadSweeper(
+    db_pool,
+    UPLOAD_FOLDER,
+    upload_references,
+    interval=app.config['UPLOAD_GC_INTERVAL'],
+    grace=app.config['UPLOAD_GC_GRACE']
+)
+
+@app.route('/api/uploads/gc', methods=['POST'])
+@auth_required('admin')
+def sweep_uploads():
+    """立即清理没有引用的上传文件（dry_run=1 时只统计不删除）"""
+    dry_run = request.args.get('dry_run') in ('1', 'true')
+    report = upload_sweeper.sweep(dry_run=dry_run)
+    if report is None:
+        return jsonify({'error': '其他进程正在清理上传文件'}), 409
+    return jsonify(report)
 
 # 公司相关路由
 @app.route('/api/companies', methods=['GET'])
 @auth_required()
+@response_cached(app.config['RESPONSE_CACHE_LIST_TTL'], [COMPANIES_VERSION])
 def get_companies():
-    """查询公司列表"""
+    """查询公司列表（分页方式同 /api/concepts）
+
+    q 由内存搜索索引在各描述字段中匹配（索引构建完成前返回 503），命中在内存中排序分页，
+    默认按相关度排序，sort=name 时按名称排序
+    """
     q = request.args.get('q', '')
+    sort = request.args.get('sort', 'relevance')
     page = int(request.args.get('page', 1))
     page_size = min(int(request.args.get('page_size', 50)), 200)
+    cursor_token = request.args.get('cursor')
+    keyset = bool(cursor_token) or request.args.get('paging') == 'cursor'
+    total_mode = request.args.get('total', 'exact')
+    
+    if total_mode not in TOTAL_MODES:
+        return jsonify({'error': '无效的 total 参数'}), 400
     
     conn = get_db_connection()
     cursor = conn.cursor(pymysql.cursors.DictCursor)
     
     try:
-        where_conditions = []
-        params = []
-        
+        hits = None
         if q:
-            where_conditions.append("(name LIKE %s OR field LIKE %s)")
-            search_term = f"%{q}%"
-            params.extend([search_term, search_term])
-        
-        where_clause = ""
-        if where_conditions:
-            where_clause = "WHERE " + " AND ".join(where_conditions)
-        
-        offset = (page - 1) * page_size
-        
-        sql = f"""
-            SELECT id, name, field, created_at
-            FROM company
-            {where_clause}
-            ORDER BY name ASC
-            LIMIT %s OFFSET %s
-        """
-        
-        params.extend([page_size, offset])
-        cursor.execute(sql, params)
-        companies = cursor.fetchall()
-        
-        # 查询总数
-        count_sql = f"SELECT COUNT(*) FROM company {where_clause}"
-        cursor.execute(count_sql, params[:-2])
-        total = cursor.fetchone()['COUNT(*)']
-        
-        # 格式化日期
-        for company in companies:
-            if company['created_at']:
-                company['created_at'] = company['created_at'].strftime('%Y-%m-%d')
+            hits = company_search.search(cursor, q)
+            if hits is None:
+                return jsonify({'error': '搜索索引正在构建，请稍后再试'}), 503
+        
+        select_sql = "SELECT id, name, field, created_at FROM company"
+        
+        if hits is not None:
+            # 命中由索引给出，排序和分页在内存中完成，数据库只按主键取当前页
+            relevance = sort == 'relevance'
+            keyset = keyset and not relevance
+            if relevance:
+                ordered = hits.ranked()
+            else:
+                sort_rows = hits.sorted_rows(key=lambda row: COMPANY_SORT[3](COMPANY_SORT[1](row)))
+                ordered = [row['id'] for row in sort_rows]
+            
+            if keyset:
+                companies, next_cursor, prev_cursor = fetch_sorted_page(
+                    cursor, select_sql, 'id', sort_rows, COMPANY_SORT, page_size, cursor_token
+                )
+            else:
+                companies, has_more = fetch_ranked_page(cursor, select_sql, 'id', ordered, page, page_size)
+            total = len(ordered) if total_mode != 'none' else None
+        else:
+            if keyset:
+                companies, next_cursor, prev_cursor = fetch_keyset_page(
+                    cursor, select_sql, [], [], COMPANY_SORT, page_size, cursor_token
+                )
+            else:
+                offset = (page - 1) * page_size
+                sql = f"""
+                    {select_sql}
+                    {order_clause(COMPANY_SORT[0])}
+                    LIMIT %s OFFSET %s
+                """
+                cursor.execute(sql, [page_size + 1, offset])
+                companies = cursor.fetchall()
+                has_more = len(companies) > page_size
+                companies = companies[:page_size]
+            
+            total = count_total(cursor, total_mode, 'company', '', [], COMPANIES_VERSION)
         
-        return jsonify({
+        result = {
             'items': companies,
             'total': total,
-            'page': page,
+            'total_mode': total_mode,
             'page_size': page_size
-        })
+        }
+        if keyset:
+            result.update({
+                'next_cursor': next_cursor,
+                'prev_cursor': prev_cursor,
+                'has_more': next_cursor is not None
+            })
+        else:
+            result.update({
+                'page': page,
+                'has_more': has_more
+            })
+        return jsonify(result)
     
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"查询公司列表错误: {e}")
         return jsonify({'error': '查询公司列表失败'}), 500
@@ -1254,6 +1921,8 @@ def get_companies():
 
 @app.route('/api/company/<int:company_id>', methods=['GET'])
 @auth_required()
+@response_cached(app.config['RESPONSE_CACHE_TTL'],
+                 lambda company_id: entity_versions('company', [company_id]))
 def get_company(company_id):
     """获取公司详情"""
     conn = get_db_connection()
@@ -1279,10 +1948,6 @@ def get_company(company_id):
         
         company['concepts'] = concepts
         
-        # 格式化日期
-        if company['created_at']:
-            company['created_at'] = company['created_at'].strftime('%Y-%m-%d')
-        
         return jsonify(company)
     
     except Exception as e:
@@ -1315,6 +1980,8 @@ def create_company():
         ))
         
         company_id = cursor.lastrowid
+        log_changes(cursor, 'company', [company_id])
+        bump_version(cursor, COMPANIES_VERSION)
         conn.commit()
         
         return jsonify({'id': company_id}), 201
@@ -1361,6 +2028,8 @@ def update_company(company_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '公司不存在'}), 404
         
+        log_changes(cursor, 'company', [company_id])
+        bump_version(cursor, COMPANIES_VERSION, *entity_versions('company', [company_id]))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1380,7 +2049,9 @@ def delete_company(company_id):
     cursor = conn.cursor()
     
     try:
-        # 删除关联
+        # 删除关联（关联概念的联想排序随之更新）
+        cursor.execute("SELECT concept_id FROM company_concept WHERE company_id = %s", (company_id,))
+        linked_concepts = [row[0] for row in cursor.fetchall()]
         cursor.execute("DELETE FROM company_concept WHERE company_id = %s", (company_id,))
         
         # 删除公司
@@ -1389,6 +2060,9 @@ def delete_company(company_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '公司不存在'}), 404
         
+        log_changes(cursor, 'company', [company_id])
+        log_changes(cursor, 'concept', linked_concepts)
+        bump_version(cursor, COMPANIES_VERSION, *entity_versions('company', [company_id]))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1416,7 +2090,13 @@ def bulk_companies():
     cursor = conn.cursor()
     
     try:
-        # 删除关联
+        # 删除关联（关联概念的联想排序随之更新）
+        cursor.execute("""
+            SELECT DISTINCT concept_id FROM company_concept 
+            WHERE company_id IN ({})
+        """.format(','.join(['%s'] * len(company_ids))), company_ids)
+        linked_concepts = [row[0] for row in cursor.fetchall()]
+        
         cursor.execute("""
             DELETE FROM company_concept 
             WHERE company_id IN ({})
@@ -1429,6 +2109,9 @@ def bulk_companies():
         """.format(','.join(['%s'] * len(company_ids))), company_ids)
         
         deleted_count = cursor.rowcount
+        log_changes(cursor, 'company', company_ids)
+        log_changes(cursor, 'concept', linked_concepts)
+        bump_version(cursor, COMPANIES_VERSION, *entity_versions('company', company_ids))
         conn.commit()
         return jsonify({'ok': True, 'deleted': deleted_count})
     
@@ -1460,6 +2143,7 @@ def add_company_concept(company_id):
             # 创建新概念
             cursor.execute("INSERT INTO concept (term) VALUES (%s)", (term,))
             concept_id = cursor.lastrowid
+            bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION)
         else:
             concept_id = concept[0]
         
@@ -1469,6 +2153,10 @@ def add_company_concept(company_id):
             VALUES (%s, %s)
         """, (company_id, concept_id))
         
+        # 关联数变化，联想排序随之更新
+        log_changes(cursor, 'concept', [concept_id])
+        log_changes(cursor, 'company', [company_id])
+        bump_version(cursor, *entity_versions('company', [company_id]))
         conn.commit()
         return jsonify({'ok': True, 'concept_id': concept_id})
     
@@ -1496,6 +2184,9 @@ def remove_company_concept(company_id, concept_id):
         if cursor.rowcount == 0:
             return jsonify({'error': '关联不存在'}), 404
         
+        log_changes(cursor, 'concept', [concept_id])
+        log_changes(cursor, 'company', [company_id])
+        bump_version(cursor, *entity_versions('company', [company_id]))
         conn.commit()
         return jsonify({'ok': True})
     
@@ -1505,11 +2196,83 @@ def remove_company_concept(company_id, concept_id):
     finally:
         cursor.close()
 
+# 输入联想路由
+SUGGEST_SOURCES = (
+    ('concept', concept_suggest, 'term'),
+    ('company', company_suggest, 'name'),
+)
+
+@app.route('/api/suggest', methods=['GET'])
+@auth_required()
+def suggest():
+    """输入联想：按前缀（或拼音、拼音首字母）匹配概念术语和公司名称
+
+    type 为 concept / company / all，结果按关联公司数、最近使用时间排序
+    """
+    q = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'concept')
+    limit = min(int(request.args.get('limit', 10)), 50)
+    
+    if kind not in ('concept', 'company', 'all'):
+        return jsonify({'error': '无效的 type 参数'}), 400
+    if not q:
+        return jsonify({'items': []})
+    
+    conn = get_db_connection()
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    
+    try:
+        items = []
+        for entity, service, column in SUGGEST_SOURCES:
+            if kind not in (entity, 'all'):
+                continue
+            
+            hits = service.search(cursor, q, limit)
+            if hits is None:
+                # 索引尚未构建完成，按名称前缀查询
+                pattern = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                cursor.execute(
+                    f"SELECT id, {column} AS label FROM {entity} WHERE {column} LIKE %s ORDER BY {column} LIMIT %s",
+                    (pattern, limit)
+                )
+                hits = [(row['id'], row['label'], None, None) for row in cursor.fetchall()]
+            
+            for item_id, label, links, last_used in hits:
+                items.append({
+                    'type': entity,
+                    'id': item_id,
+                    'label': label,
+                    'links': links,
+                    'last_used': last_used
+                })
+        
+        return jsonify({'items': items})
+    
+    except Exception as e:
+        logger.error(f"输入联想错误: {e}")
+        return jsonify({'error': '查询联想失败'}), 500
+    finally:
+        cursor.close()
+
 # 上传JSON路由
 @app.route('/api/upload', methods=['POST'])
 @auth_required('admin')
 def upload_json():
-    """批量导入JSON数据"""
+    """批量导入JSON数据
+
+    请求体直接为 JSON 数组或 NDJSON（application/x-ndjson），或上传文件时带 stream=1，
+    则使用流式导入（分块提交）；.ndjson/.jsonl 文件总是流式导入；
+    带 async=1 时作为后台任务执行，立即返回任务 ID
+    """
+    async_mode = request.args.get('async') == '1'
+    
+    if request.mimetype in ('application/json', 'application/x-ndjson'):
+        ndjson = request.mimetype == 'application/x-ndjson'
+        if async_mode:
+            filename = 'upload.ndjson' if ndjson else 'upload.json'
+            return submit_import_job(filename, lambda path: save_stream(request.stream, path))
+        return stream_upload(request.stream, ndjson=ndjson)
+    
     if 'file' not in request.files:
         return jsonify({'error': '没有上传文件'}), 400
     
@@ -1517,11 +2280,17 @@ def upload_json():
     if file.filename == '':
         return jsonify({'error': '没有选择文件'}), 400
     
-    if not file.filename.endswith('.json'):
-        return jsonify({'error': '只支持JSON格式文件'}), 400
+    ndjson = is_ndjson(file.filename)
+    if not file.filename.endswith('.json') and not ndjson:
+        return jsonify({'error': '只支持JSON或NDJSON格式文件'}), 400
+    
+    if async_mode:
+        return submit_import_job(secure_filename(file.filename), file.save)
+    
+    if request.args.get('stream') == '1' or ndjson:
+        return stream_upload(file.stream, ndjson=ndjson)
     
     try:
-        import json
         # 读取文件内容并解析JSON
         file_content = file.read().decode('utf-8')
         data = json.loads(file_content)
@@ -1533,90 +2302,23 @@ def upload_json():
         cursor = conn.cursor()
         
         try:
-            companies_added = 0
-            concepts_added = 0
-            errors = []
-            
-            for i, company_data in enumerate(data):
-                try:
-                    # 创建或更新公司
-                    company_name = company_data.get('company_name')
-                    if not company_name:
-                        errors.append(f"第{i+1}条记录缺少公司名称")
-                        continue
-                    
-                    cursor.execute("SELECT id FROM company WHERE name = %s", (company_name,))
-                    existing_company = cursor.fetchone()
-                    
-                    if existing_company:
-                        company_id = existing_company[0]
-                    else:
-                        cursor.execute("""
-                            INSERT INTO company (name, website, address, team_info, funding_info,
-                                               product, biz_model, partners, clients, field, 
-                                               notes, source_link) 
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            company_name,
-                            company_data.get('website'),
-                            company_data.get('address'),
-                            company_data.get('team_info'),
-                            company_data.get('funding_info'),
-                            company_data.get('product_service'),
-                            company_data.get('biz_model'),
-                            company_data.get('partners'),
-                            company_data.get('clients'),
-                            company_data.get('field'),
-                            company_data.get('detail'),
-                            company_data.get('source')
-                        ))
-                        company_id = cursor.lastrowid
-                        companies_added += 1
-                    
-                    # 处理概念
-                    explain = company_data.get('explain', {})
-                    if isinstance(explain, dict):
-                        for term, definition in explain.items():
-                            if not term:
-                                continue
-                            
-                            # 查找或创建概念
-                            cursor.execute("SELECT id FROM concept WHERE term = %s", (term,))
-                            concept = cursor.fetchone()
-                            
-                            if not concept:
-                                cursor.execute("""
-                                    INSERT INTO concept (term, plain_def) VALUES (%s, %s)
-                                """, (term, definition or ''))
-                                concept_id = cursor.lastrowid
-                                concepts_added += 1
-                            else:
-                                concept_id = concept[0]
-                            
-                            # 建立关联
-                            try:
-                                cursor.execute("""
-                                    INSERT INTO company_concept (company_id, concept_id) 
-                                    VALUES (%s, %s)
-                                """, (company_id, concept_id))
-                            except pymysql.IntegrityError:
-                                pass  # 关联已存在，忽略
-                
-                except Exception as e:
-                    errors.append(f"第{i+1}条记录处理失败: {str(e)}")
-            
+            report = import_records(cursor, data, batch_size=app.config['IMPORT_BATCH_SIZE'])
+            log_changes(cursor, 'concept', report.take_added_ids('concept'))
+            log_changes(cursor, 'company', report.take_added_ids('company'))
+            bump_version(cursor, *entity_versions('company', report.take_added_ids('linked_company')))
+            if report.concepts_added:
+                bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION)
+            if report.companies_added:
+                bump_version(cursor, COMPANIES_VERSION)
             conn.commit()
             
-            return jsonify({
-                'ok': True,
-                'companies_added': companies_added,
-                'concepts_added': concepts_added,
-                'errors': errors
-            })
+            return jsonify({'ok': True, **report.to_dict()})
         
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             cursor.close()
-            conn.close()
     
     except json.JSONDecodeError:
         return jsonify({'error': 'JSON格式错误'}), 400
@@ -1624,29 +2326,498 @@ def upload_json():
         logger.error(f"上传JSON错误: {e}")
         return jsonify({'error': '上传处理失败'}), 500
 
+def import_chunk_hook():
+    """导入每块提交前的回调：登记新概念、新公司供搜索索引更新，并递增相应版本号"""
+    concepts_added = 0
+    companies_added = 0
+    
+    def before_commit(cursor, report):
+        nonlocal concepts_added, companies_added
+        log_changes(cursor, 'concept', report.take_added_ids('concept'))
+        log_changes(cursor, 'company', report.take_added_ids('company'))
+        bump_version(cursor, *entity_versions('company', report.take_added_ids('linked_company')))
+        if report.concepts_added != concepts_added:
+            bump_version(cursor, TAXONOMY_VERSION, CONCEPTS_VERSION)
+        if report.companies_added != companies_added:
+            bump_version(cursor, COMPANIES_VERSION)
+        concepts_added = report.concepts_added
+        companies_added = report.companies_added
+    
+    return before_commit
+
+def stream_upload(stream, ndjson=False):
+    """边读边解析上传内容，每 IMPORT_CHUNK_SIZE 条记录提交一次"""
+    conn = get_db_connection()
+    report = ImportReport(max_errors=app.config['IMPORT_MAX_ERRORS'])
+    
+    try:
+        stream_import(
+            conn, stream,
+            chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+            batch_size=app.config['IMPORT_BATCH_SIZE'],
+            report=report,
+            before_commit=import_chunk_hook(),
+            ndjson=ndjson,
+            max_record_size=app.config['IMPORT_MAX_RECORD_MB'] * 1024 * 1024
+        )
+    except ImportFormatError as e:
+        # 出错位置之前的记录已经提交
+        return jsonify({'error': str(e), **report.to_dict(), 'progress': report.progress()}), 400
+    except Exception as e:
+        logger.error(f"流式导入错误: {e}")
+        return jsonify({'error': '上传处理失败', 'progress': report.progress()}), 500
+    
+    return jsonify({'ok': True, **report.to_dict(), 'progress': report.progress()})
+
+def save_stream(stream, path):
+    """把请求体写入文件"""
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f, 1024 * 1024)
+
+def submit_import_job(filename, save_file):
+    """登记后台导入任务"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        job_id = import_runner.submit(cursor, save_file, filename, request.current_user['user_id'])
+        conn.commit()
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"创建导入任务错误: {e}")
+        return jsonify({'error': '创建导入任务失败'}), 500
+    finally:
+        cursor.close()
+    
+    import_runner.notify()
+    return jsonify({'ok': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/import/jobs', methods=['GET'])
+@auth_required('admin')
+def get_import_jobs():
+    """获取最近的导入任务"""
+    conn = get_db_connection()
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    
+    try:
+        cursor.execute(f"SELECT {JOB_COLUMNS} FROM import_job ORDER BY id DESC LIMIT 50")
+        jobs = cursor.fetchall()
+        return jsonify({'items': [job_to_dict(job) for job in jobs]})
+    
+    except Exception as e:
+        logger.error(f"获取导入任务列表错误: {e}")
+        return jsonify({'error': '获取导入任务列表失败'}), 500
+    finally:
+        cursor.close()
+
+@app.route('/api/import/jobs/<int:job_id>', methods=['GET'])
+@auth_required('admin')
+def get_import_job(job_id):
+    """获取导入任务状态、进度和错误列表"""
+    conn = get_db_connection()
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    
+    try:
+        cursor.execute(f"SELECT {JOB_COLUMNS}, errors FROM import_job WHERE id = %s", (job_id,))
+        job = cursor.fetchone()
+        
+        if not job:
+            return jsonify({'error': '导入任务不存在'}), 404
+        
+        return jsonify(job_to_dict(job, include_errors=True))
+    
+    except Exception as e:
+        logger.error(f"获取导入任务错误: {e}")
+        return jsonify({'error': '获取导入任务失败'}), 500
+    finally:
+        cursor.close()
+
+# 数据导出
+@app.route('/api/export/<kind>', methods=['GET'])
+@auth_required('editor')
+def export_data(kind):
+    """流式导出公司（companies）、概念（concepts）或公司概念关联（links）
+
+    format 为 ndjson（默认）、json 或 csv。只有公司的 ndjson / json 导出是上传格式，可通过
+    /api/upload 重新导入；概念和关联导出按表列出数据，不能导入
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if kind not in EXPORTS:
+        return jsonify({'error': '不支持的导出类型'}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': '不支持的导出格式'}), 400
+    
+    stream = export_stream(
+        db_pool, kind, fmt,
+        chunk_bytes=app.config['EXPORT_CHUNK_SIZE'],
+        net_write_timeout=app.config['EXPORT_NET_WRITE_TIMEOUT']
+    )
+    try:
+        # 先借出连接并执行查询，出错时还能返回错误状态码
+        next(stream)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"导出数据错误: {e}")
+        return jsonify({'error': '导出失败'}), 500
+    
+    content_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    response = Response(stream, content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # 反向代理（nginx）不缓冲，逐块转发
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 数据快照
+def snapshot_path(name):
+    """SNAPSHOT_DIR 中的快照文件路径，名称无效时返回 None"""
+    name = secure_filename(name)
+    if not name.endswith(SNAPSHOT_EXTENSION):
+        return None
+    return os.path.join(app.config['SNAPSHOT_DIR'], name)
+
+def run_restore(path):
+    """恢复快照并清空本进程的缓存（其他进程随版本号递增失效）"""
+    result = restore_snapshot(
+        db_pool, path, UPLOAD_FOLDER,
+        workers=app.config['SNAPSHOT_WORKERS'],
+        batch_size=app.config['IMPORT_BATCH_SIZE']
+    )
+    response_cache.clear()
+    totals_cache.clear()
+    return result
+
+@app.route('/api/snapshots', methods=['GET'])
+@auth_required('admin')
+def get_snapshots():
+    """列出服务器上的快照文件"""
+    return jsonify({'items': list_snapshots(app.config['SNAPSHOT_DIR'])})
+
+@app.route('/api/snapshots', methods=['POST'])
+@auth_required('admin')
+def post_snapshot():
+    """写出全部数据和上传文件的快照"""
+    name = f"snapshot-{datetime.now().strftime('%Y%m%d-%H%M%S')}{SNAPSHOT_EXTENSION}"
+    try:
+        manifest = create_snapshot(
+            db_pool, snapshot_path(name), UPLOAD_FOLDER,
+            workers=app.config['SNAPSHOT_WORKERS'],
+            group_rows=app.config['SNAPSHOT_GROUP_ROWS']
+        )
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"创建快照错误: {e}")
+        return jsonify({'error': '创建快照失败'}), 500
+    
+    return jsonify({'ok': True, 'name': name, **manifest})
+
+@app.route('/api/snapshots/<name>', methods=['GET'])
+@auth_required('admin')
+def download_snapshot(name):
+    """下载快照文件"""
+    path = snapshot_path(name)
+    if not path or not os.path.exists(path):
+        return jsonify({'error': '快照不存在'}), 404
+    return send_from_directory(app.config['SNAPSHOT_DIR'], os.path.basename(path), as_attachment=True)
+
+@app.route('/api/snapshots/<name>/restore', methods=['POST'])
+@auth_required('admin')
+def post_snapshot_restore(name):
+    """用快照替换当前全部数据（上传 file 时先保存为该名称）"""
+    path = snapshot_path(name)
+    if not path:
+        return jsonify({'error': '快照名称无效'}), 400
+    
+    if 'file' in request.files:
+        os.makedirs(app.config['SNAPSHOT_DIR'], exist_ok=True)
+        request.files['file'].save(path)
+    if not os.path.exists(path):
+        return jsonify({'error': '快照不存在'}), 404
+    
+    try:
+        read_manifest(path)
+        result = run_restore(path)
+    except SnapshotError as e:
+        return jsonify({'error': str(e)}), 400
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"恢复快照错误: {e}")
+        return jsonify({'error': '恢复快照失败'}), 500
+    
+    return jsonify({'ok': True, **result})
+
+@app.cli.command('snapshot')
+@click.argument('path', required=False)
+def snapshot_command(path):
+    """写出数据快照（默认保存到 SNAPSHOT_DIR）"""
+    if not path:
+        path = snapshot_path(f"snapshot-{datetime.now().strftime('%Y%m%d-%H%M%S')}{SNAPSHOT_EXTENSION}")
+    manifest = create_snapshot(
+        db_pool, path, UPLOAD_FOLDER,
+        workers=app.config['SNAPSHOT_WORKERS'],
+        group_rows=app.config['SNAPSHOT_GROUP_ROWS']
+    )
+    for table, info in manifest['tables'].items():
+        click.echo(f"{table:20s} {info['rows']:>10} 行 {info['bytes'] / 1024:>10.1f} KB {info['ms']:>9.0f} ms")
+    click.echo(f"{path}: {manifest['uploads']} 个上传文件，共 {manifest['elapsed_ms']:.0f} ms")
+
+@app.cli.command('restore')
+@click.argument('path')
+@click.option('--yes', is_flag=True, help='不再确认')
+def restore_command(path, yes):
+    """用快照替换当前全部数据"""
+    manifest = read_manifest(path)
+    if not yes:
+        click.confirm(f"将用 {manifest['created_at']} 的快照替换数据库 {app.config['DB_NAME']} 中的全部数据，继续？", abort=True)
+    ensure_schema()
+    result = run_restore(path)
+    for table, info in result['tables'].items():
+        click.echo(f"{table:20s} {info['rows']:>10} 行 {info['ms']:>9.0f} ms")
+    click.echo(f"{result['uploads']} 个上传文件，共 {result['elapsed_ms']:.0f} ms")
+
+@app.cli.command('schema-status')
+def schema_status_command():
+    """列出数据库迁移的执行情况"""
+    with db_pool.connection() as conn:
+        rows = migration_status(conn)
+    for row in rows:
+        applied_at = row['applied_at'].strftime('%Y-%m-%d %H:%M:%S') if row['applied_at'] else ''
+        duration = f"{row['duration_ms']} ms" if row['duration_ms'] is not None else ''
+        click.echo(f"{row['version']:>4}  {row['name']:30s} {row['state']:9s} {applied_at:20s} {duration}")
+
+@app.cli.command('schema-migrate')
+def schema_migrate_command():
+    """执行未执行的数据库迁移"""
+    ensure_schema()
+
+@app.cli.command('migrate-uploads')
+def migrate_uploads_command():
+    """把旧版本平铺存放的概念图片转存为按内容命名的分目录存储"""
+    ensure_schema()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT DISTINCT image_path FROM concept WHERE image_path IS NOT NULL")
+            legacy = [path for path, in cursor.fetchall() if not is_content_addressed(path)]
+            conn.commit()
+            
+            migrated = []
+            for old_path in legacy:
+                source = os.path.join(UPLOAD_FOLDER, old_path[len(UPLOAD_URL_PREFIX):])
+                try:
+                    with open(source, 'rb') as f:
+                        filename, _ = save_upload(f, UPLOAD_FOLDER, sys.maxsize)
+                except (OSError, ImageError) as e:
+                    click.echo(f"跳过 {old_path}: {e}")
+                    continue
+                
+                new_path = f"{UPLOAD_URL_PREFIX}{filename}"
+                cursor.execute("SELECT id FROM concept WHERE image_path = %s FOR UPDATE", (old_path,))
+                ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute(
+                    "UPDATE concept SET image_path = %s, image_variants = NULL WHERE image_path = %s",
+                    (new_path, old_path)
+                )
+                bump_version(cursor, CONCEPTS_VERSION, *entity_versions('concept', ids))
+                conn.commit()
+                migrated.append((ids[0] if ids else None, new_path))
+        finally:
+            cursor.close()
+    
+    for concept_id, new_path in migrated:
+        image_processor.process(concept_id, new_path)
+    click.echo(f"转存 {len(migrated)} / {len(legacy)} 个文件；原文件由 flask uploads-gc 或后台清理线程回收")
+
+@app.cli.command('uploads-gc')
+@click.option('--dry-run', is_flag=True, help='只统计不删除')
+def uploads_gc_command(dry_run):
+    """删除没有概念引用的上传文件"""
+    report = upload_sweeper.sweep(dry_run=dry_run)
+    if report is None:
+        raise click.ClickException('其他进程正在清理上传文件')
+    for key, value in report.items():
+        click.echo(f"{key:18s} {value}")
+
+# 缓存统计
+@app.route('/api/cache/stats', methods=['GET'])
+@auth_required('admin')
+def get_cache_stats():
+    """本进程各缓存的命中、未命中、淘汰计数"""
+    return jsonify({
+        'pid': os.getpid(),
+        'responses': response_cache.stats(),
+        'totals': totals_cache.stats(),
+        'tokens': token_cache.stats(),
+        'passwords': password_hasher.stats(),
+        'login_throttle': login_throttle.stats(),
+        'db_pool': db_pool.stats()
+    })
+
+# 慢查询
+@app.route('/api/slow-queries', methods=['GET'])
+@auth_required('admin')
+def get_slow_queries():
+    """本进程按语句指纹汇总的查询耗时，默认按总耗时排序"""
+    order = request.args.get('sort', 'total_ms')
+    if order not in ('total_ms', 'max_ms', 'count', 'slow_count'):
+        return jsonify({'error': '排序字段无效'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    return jsonify({
+        'pid': os.getpid(),
+        'threshold_ms': app.config['SLOW_QUERY_MS'],
+        'queries': slow_query_log.top(limit, order)
+    })
+
+@app.route('/api/slow-queries', methods=['DELETE'])
+@auth_required('admin')
+def reset_slow_queries():
+    """清空本进程的慢查询统计"""
+    slow_query_log.reset()
+    return jsonify({'ok': True})
+
+# 请求分析
+@app.route('/api/profiling/sampler', methods=['GET'])
+@auth_required('admin')
+def get_sampler_status():
+    """常驻采样器的开关状态和本进程的采样计数"""
+    return jsonify({'pid': os.getpid(), **stack_sampler.stats()})
+
+@app.route('/api/profiling/sampler', methods=['PUT'])
+@auth_required('admin')
+def update_sampler():
+    """打开或关闭常驻采样器（所有进程在 PROFILING_SYNC_INTERVAL 秒内生效）"""
+    data = request.get_json() or {}
+    interval_ms = data.get('interval_ms', app.config['PROFILING_SAMPLER_MS'])
+    if not isinstance(interval_ms, int) or isinstance(interval_ms, bool) or not 1 <= interval_ms <= 1000:
+        return jsonify({'error': '采样间隔应为 1 到 1000 毫秒'}), 400
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        set_sampler_state(cursor, interval_ms if data.get('enabled') else 0)
+        conn.commit()
+        stack_sampler.sync(cursor)
+        return jsonify({'pid': os.getpid(), **stack_sampler.stats()})
+    
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"更新采样器状态错误: {e}")
+        return jsonify({'error': '更新采样器状态失败'}), 500
+    finally:
+        cursor.close()
+
+@app.route('/api/profiling/sampler/stacks', methods=['GET'])
+@auth_required('admin')
+def download_sampler_stacks():
+    """下载常驻采样器的折叠调用栈（设置 METRICS_DIR 时汇总所有进程）"""
+    cursor = get_db_connection().cursor()
+    try:
+        epoch = get_version(cursor, SAMPLER_EPOCH)
+    finally:
+        cursor.close()
+    
+    stack_sampler.flush()
+    response = Response(format_stacks(stack_sampler.collect(epoch)), mimetype='text/plain')
+    filename = f"stacks-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/profiling/sampler/stacks', methods=['DELETE'])
+@auth_required('admin')
+def reset_sampler_stacks():
+    """清空所有进程的采样计数"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        bump_version(cursor, SAMPLER_EPOCH)
+        conn.commit()
+        stack_sampler.sync(cursor)
+        return jsonify({'ok': True})
+    
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"清空采样计数错误: {e}")
+        return jsonify({'error': '清空采样计数失败'}), 500
+    finally:
+        cursor.close()
+
+# Prometheus 指标
+@app.route('/metrics')
+def export_metrics():
+    """各路由的耗时直方图、SQL 语句数、数据库耗时、响应字节数和连接池统计（所有进程汇总）"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({'error': '未授权'}), 401
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # 静态文件服务
-@app.route('/uploads/<filename>')
+def serve_static(path, cache_control, etag=None):
+    """发送 static 目录下的文件（按配置交给前端服务器发送）"""
+    return send_static(
+        STATIC_FOLDER, path, cache_control, etag=etag,
+        offload=app.config['STATIC_OFFLOAD'],
+        accel_prefix=app.config['STATIC_ACCEL_PREFIX']
+    )
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """提供上传文件访问"""
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    """提供上传文件访问
+
+    上传文件名唯一（按内容哈希命名），内容不会变化：长期缓存，文件名即为强 ETag
+    """
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    return serve_static(f"{UPLOAD_URL_PREFIX}{filename}", IMMUTABLE, etag=etag)
 
 # SPA 路由支持
 @app.route('/<path:path>')
 def catch_all(path):
-    """捕获所有未匹配的路由，返回前端入口"""
-    if path.startswith('api/'):
+    """前端构建产物按文件发送，其余路径返回前端入口"""
+    if path.startswith('api/') or path.startswith(UPLOAD_URL_PREFIX):
+        abort(404)
+    full = safe_join(STATIC_FOLDER, path)
+    if full and os.path.isfile(full):
+        return serve_static(path, asset_cache_control(path))
+    # 发布后旧页面引用的、已不存在的资源不能返回 index.html
+    if path.startswith('assets/'):
         abort(404)
-    return send_from_directory('static', 'index.html')
+    return serve_static('index.html', REVALIDATE)
 
 @app.route('/')
 def index():
     """首页"""
-    return send_from_directory('static', 'index.html')
+    return serve_static('index.html', REVALIDATE)
+
+def start_background_services():
+    """启动本进程的后台线程（导入任务、上传文件清理、搜索和联想索引）"""
+    import_runner.start()
+    upload_sweeper.start()
+    concept_search.start()
+    company_search.start()
+    concept_suggest.start()
+    company_suggest.start()
+
+def init_worker():
+    """WSGI 服务进程 fork 之后调用：丢弃继承的数据库连接和指标计数，启动后台线程"""
+    db_pool.after_fork()
+    request_metrics.after_fork()
+    slow_query_log.after_fork()
+    stack_sampler.after_fork()
+    start_background_services()
 
 if __name__ == '__main__':
     # 初始化数据库
     ensure_schema()
+    start_background_services()
     
-    # 启动应用
+    # 启动应用（开发服务器；生产环境使用 gunicorn，见 wsgi.py）
     debug_mode = os.getenv('FLASK_ENV') == 'development'
     app.run(host='0.0.0.0', port=5000, debug=debug_mode)
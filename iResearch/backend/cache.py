@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应缓存
+全局版本号保存在 app_state 表中，写操作在自己的事务里递增版本号，
+多个进程读取同一行即可判断缓存是否失效。
+另有已验证令牌的缓存及令牌吊销列表。
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def bump_version(cursor, *names):
+    """递增一个或多个版本号（在写操作的事务中、提交前调用）"""
+    if not names:
+        return
+    values = ', '.join(['(%s, 1)'] * len(names))
+    cursor.execute(f"""
+        INSERT INTO app_state (name, version) VALUES {values}
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, names)
+
+
+def get_version(cursor, name):
+    """读取版本号，不存在时为 0"""
+    cursor.execute("SELECT version FROM app_state WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
+
+def get_versions(cursor, names):
+    """一次读取多个版本号，按 names 的顺序返回元组"""
+    if not names:
+        return ()
+    placeholders = ', '.join(['%s'] * len(names))
+    cursor.execute(f"SELECT name, version FROM app_state WHERE name IN ({placeholders})", names)
+    found = {}
+    for row in cursor.fetchall():
+        if isinstance(row, dict):
+            found[row['name']] = row['version']
+        else:
+            found[row[0]] = row[1]
+    return tuple(found.get(name, 0) for name in names)
+
+
+class CachedResponse:
+    """缓存的响应体，variants 保存按编码压缩后的响应体"""
+
+    __slots__ = ('body', 'etag', 'mimetype', 'versions', 'expires_at', 'variants')
+
+    def __init__(self, body, etag, mimetype, versions, expires_at):
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+        self.versions = versions
+        self.expires_at = expires_at
+        self.variants = {}
+
+
+class ResponseCache:
+    """GET 响应缓存
+
+    - 条目数和总字节数双上限，超出时按 LRU 淘汰
+    - 每个条目记录生成时的版本号和过期时间，版本号不一致或过期即视为未命中，
+      同一 key 的新响应直接替换旧条目
+    - 同一 key 的并发未命中由 single_flight 合并，只有一个请求访问数据库
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, wait_timeout=5.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, key, versions):
+        """返回 CachedResponse，未命中返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.versions != versions or entry.expires_at < now:
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, versions, body, ttl, mimetype='application/json'):
+        """保存响应体，返回 CachedResponse"""
+        entry = CachedResponse(body, hashlib.sha1(body).hexdigest(), mimetype,
+                               versions, time.monotonic() + ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+        return entry
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    @contextmanager
+    def single_flight(self, key, before_wait=None):
+        """同一 key 只允许一个请求生成响应
+
+        第一个请求得到 True，负责生成并写入缓存；其他请求等待其完成（最多
+        wait_timeout 秒）后得到 False，应重新读取缓存，仍未命中时自行生成。
+        before_wait 在等待之前调用（如归还数据库连接，避免等待期间占用连接池）。
+        """
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if before_wait:
+                before_wait()
+            event.wait(self.wait_timeout)
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'evictions': self.evictions,
+            'coalesced': self.coalesced
+        }
+
+
+class LRUCache:
+    """有界 LRU 缓存，条目按 ttl 过期（set 时可单独指定）"""
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class TokenCache:
+    """已验证令牌的缓存和令牌吊销列表
+
+    验证通过的令牌按 SHA-256 摘要缓存到令牌过期为止，命中时不再验签和解析。
+    吊销记录（用户 ID, 吊销时间（毫秒））保存在 token_revocation 表中，各进程每 sync_interval
+    秒增量读取一次，签发时间（iat，精确到毫秒）早于吊销时间的令牌一律失效，
+    吊销后重新登录拿到的令牌不受影响。
+    """
+
+    # 重复读取最近这段时间内的吊销记录，防止晚提交的事务被跳过、容忍各服务器时钟偏差
+    OVERLAP_SECONDS = 30
+
+    def __init__(self, max_entries=4096, sync_interval=5, max_age=86400):
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self._tokens = LRUCache(max_entries=max_entries)
+        self._revoked = {}          # 用户 ID -> 最近的吊销时间（毫秒）
+        self._synced_at = None      # 上次读取的时间（time.monotonic）
+        self._synced_since = None   # 上次读取开始时的时间（time.time）
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """已缓存的令牌内容，未缓存时返回 None"""
+        return self._tokens.get(self._key(token))
+
+    def set(self, token, payload):
+        ttl = payload.get('exp', 0) - time.time()
+        if ttl > 0:
+            self._tokens.set(self._key(token), payload, ttl=ttl)
+
+    def is_revoked(self, payload):
+        revoked_at = self._revoked.get(payload.get('user_id'))
+        return revoked_at is not None and round(payload.get('iat', 0) * 1000) < revoked_at
+
+    def needs_sync(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def sync(self, cursor):
+        """读取其他进程登记的吊销记录（同一时间只有一个线程读取）"""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            since = now - self.max_age
+            if self._synced_since is not None:
+                since = max(since, self._synced_since - self.OVERLAP_SECONDS)
+            cursor.execute(
+                "SELECT user_id, revoked_at FROM token_revocation WHERE revoked_at >= %s",
+                (int(since * 1000),)
+            )
+            rows = cursor.fetchall()
+            with self._lock:
+                for row in rows:
+                    if isinstance(row, dict):
+                        user_id, revoked_at = row['user_id'], row['revoked_at']
+                    else:
+                        user_id, revoked_at = row
+                    self._apply(user_id, revoked_at)
+                # 早于最长有效期的吊销已无意义
+                for user_id in [u for u, t in self._revoked.items() if t < (now - self.max_age) * 1000]:
+                    del self._revoked[user_id]
+            self._synced_at = time.monotonic()
+            self._synced_since = now
+        finally:
+            self._sync_lock.release()
+
+    def _apply(self, user_id, revoked_at):
+        if revoked_at > self._revoked.get(user_id, -1):
+            self._revoked[user_id] = revoked_at
+
+    def revoke(self, cursor, user_id):
+        """登记吊销某用户此前签发的所有令牌（在写操作的事务中调用）
+
+        返回吊销时间，事务提交后传给 revoked() 在本进程立即生效；回滚时不调用，
+        本进程也就不会吊销实际并未改变的用户的令牌。
+        """
+        now = int(time.time() * 1000)
+        cursor.execute("DELETE FROM token_revocation WHERE revoked_at < %s", (now - self.max_age * 1000,))
+        cursor.execute("INSERT INTO token_revocation (user_id, revoked_at) VALUES (%s, %s)", (user_id, now))
+        return now
+
+    def revoked(self, user_id, revoked_at):
+        """吊销记录已提交，在本进程生效（其他进程在下次 sync 时读到）"""
+        with self._lock:
+            self._apply(user_id, revoked_at)
+
+    def clear(self):
+        self._tokens.clear()
+
+    def stats(self):
+        return {**self._tokens.stats(), 'revoked_users': len(self._revoked)}
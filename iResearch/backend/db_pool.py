@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接池
+为每个请求分配一个连接，请求结束时归还；空闲连接在取出时做健康检查并按寿命回收
+"""
+
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """等待可用连接超时"""
+
+
+class ConnectionPool:
+    """有界的 PyMySQL 连接池
+
+    - max_size: 同时借出的最大连接数
+    - timeout: 连接耗尽时等待的秒数，超时抛出 PoolTimeout
+    - recycle: 连接最长存活秒数，超过后关闭并重建
+    - ping_interval: 空闲超过该秒数的连接在借出前先 ping 一次
+    - slow_checkout_ms: 借出耗时超过该毫秒数时记录警告
+    """
+
+    def __init__(self, creator, max_size=10, timeout=5.0, recycle=3600,
+                 ping_interval=30, slow_checkout_ms=100):
+        self._creator = creator
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.slow_checkout_ms = slow_checkout_ms
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'in_use': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def _incr(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _new_connection(self):
+        conn = self._creator()
+        self._incr('created')
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._incr('closed')
+
+    def _take_idle(self):
+        """取出一个健康的空闲连接，没有则新建"""
+        now = time.monotonic()
+        while True:
+            try:
+                conn, created_at, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_connection()
+
+            if self.recycle and now - created_at > self.recycle:
+                self._discard(conn)
+                continue
+
+            if now - last_used > self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception as e:
+                    logger.info(f"丢弃失效的数据库连接: {e}")
+                    self._discard(conn)
+                    continue
+
+            return conn, created_at
+
+    def checkout(self):
+        """借出连接，返回 (conn, created_at)"""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._incr('timeouts')
+            raise PoolTimeout(f"等待数据库连接超时（{self.timeout}s）")
+
+        try:
+            conn, created_at = self._take_idle()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_ms_total'] += wait_ms
+            self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+        if wait_ms > self.slow_checkout_ms:
+            logger.warning(f"获取数据库连接耗时 {wait_ms:.1f}ms")
+        return conn, created_at
+
+    def checkin(self, conn, created_at, broken=False):
+        """归还连接；未提交的事务会被回滚"""
+        try:
+            if broken or not conn.open:
+                self._discard(conn)
+                return
+            try:
+                conn.rollback()
+            except Exception as e:
+                logger.info(f"归还连接时回滚失败，丢弃连接: {e}")
+                self._discard(conn)
+                return
+            self._idle.put((conn, created_at, time.monotonic()))
+        finally:
+            self._incr('in_use', -1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """在请求上下文之外（初始化、后台任务）使用的连接"""
+        conn, created_at = self.checkout()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not getattr(conn, 'open', False)
+            raise
+        finally:
+            self.checkin(conn, created_at, broken=broken)
+
+    def stats(self):
+        """连接池统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle'] = self._idle.qsize()
+        stats['max_size'] = self.max_size
+        return stats
+
+    def after_fork(self):
+        """在 fork 出的子进程中丢弃从父进程继承的连接和计数
+
+        继承的连接与父进程共用同一个 socket，不能 close（会向服务器发送 COM_QUIT），直接丢弃。
+        """
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def dispose(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
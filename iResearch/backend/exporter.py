@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据导出
+用非缓冲的服务端游标（SSCursor）逐行读取，边读边生成 NDJSON / JSON / CSV，
+内存占用与表大小无关，第一批数据在查询开始返回后即可发出。
+公司导出的每条记录与 /api/upload 的格式相同（explain 为 {术语: 解释}），可直接重新导入；
+概念和关联导出是按表列出的数据（供查看和其他系统使用），/api/upload 不能导入。
+日期时间按 ISO 8601 输出完整的时分秒，不像接口响应那样只保留日期。
+"""
+
+import io
+import csv
+import logging
+from datetime import date, datetime
+
+import pymysql
+
+from importer import COMPANY_FIELDS
+from json_provider import dumps_bytes, iso_default
+
+logger = logging.getLogger(__name__)
+
+# 格式 -> (Content-Type, 文件扩展名)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'json': ('application/json', 'json'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+# 公司表中不属于上传格式的字段，按列名导出（导入时忽略）
+COMPANY_EXTRA_FIELDS = ('domain', 'problem', 'method', 'difference', 'tech_core', 'created_at')
+
+# CSV 中列表字段的分隔符（与前端导出一致）
+LIST_SEPARATOR = '；'
+
+
+def _grouped(rows, width):
+    """合并连续的、前 width 列相同 ID 的行（主记录 LEFT JOIN 附属记录，按主记录 ID 排序）
+
+    产出 (主记录各列, [附属记录各列, ...])，没有附属记录时列表为空。
+    """
+    current = None
+    children = []
+    for row in rows:
+        if current is None or row[0] != current[0]:
+            if current is not None:
+                yield current, children
+            current = row[:width]
+            children = []
+        if row[width] is not None:
+            children.append(row[width:])
+    if current is not None:
+        yield current, children
+
+
+def _companies(rows):
+    columns = len(COMPANY_FIELDS) + len(COMPANY_EXTRA_FIELDS) + 1
+    for company, concepts in _grouped(rows, columns):
+        record = {source: value for (_, source), value in zip(COMPANY_FIELDS, company[1:])}
+        record.update(zip(COMPANY_EXTRA_FIELDS, company[1 + len(COMPANY_FIELDS):]))
+        record['explain'] = {term: plain_def or '' for term, plain_def in concepts}
+        yield record
+
+
+def _concepts(rows):
+    for concept, extras in _grouped(rows, 8):
+        record = dict(zip(('id', 'term', 'plain_def', 'mechanism', 'examples',
+                           'image_path', 'last_used', 'category'), concept))
+        record['extra_categories'] = [name for name, in extras]
+        yield record
+
+
+def _links(rows):
+    for company_id, company_name, concept_id, term in rows:
+        yield {'company_id': company_id, 'company_name': company_name,
+               'concept_id': concept_id, 'term': term}
+
+
+# 导出类型 -> (SQL, 记录生成函数, CSV 列)
+# 带附属记录的导出依赖 ORDER BY 主键，使同一记录的行连续返回
+EXPORTS = {
+    'companies': (
+        f"""
+            SELECT co.id, {', '.join('co.' + column for column, _ in COMPANY_FIELDS)},
+                   {', '.join('co.' + column for column in COMPANY_EXTRA_FIELDS)},
+                   c.term, c.plain_def
+            FROM company co
+            LEFT JOIN company_concept cc ON cc.company_id = co.id
+            LEFT JOIN concept c ON c.id = cc.concept_id
+            ORDER BY co.id
+        """,
+        _companies,
+        [source for _, source in COMPANY_FIELDS] + list(COMPANY_EXTRA_FIELDS) + ['explain']
+    ),
+    'concepts': (
+        """
+            SELECT c.id, c.term, c.plain_def, c.mechanism, c.examples, c.image_path, c.last_used,
+                   cat.name, extra.name
+            FROM concept c
+            LEFT JOIN category cat ON cat.id = c.category_id
+            LEFT JOIN category_concept cc ON cc.concept_id = c.id
+            LEFT JOIN category extra ON extra.id = cc.category_id
+            ORDER BY c.id
+        """,
+        _concepts,
+        ['id', 'term', 'plain_def', 'mechanism', 'examples', 'image_path', 'last_used',
+         'category', 'extra_categories']
+    ),
+    'links': (
+        """
+            SELECT cc.company_id, co.name, cc.concept_id, c.term
+            FROM company_concept cc
+            JOIN company co ON co.id = cc.company_id
+            JOIN concept c ON c.id = cc.concept_id
+            ORDER BY cc.id
+        """,
+        _links,
+        ['company_id', 'company_name', 'concept_id', 'term']
+    ),
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        return LIST_SEPARATOR.join(value)
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(str(item) for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _encode(records, fmt, columns):
+    """把记录编码为输出字节块（每条记录一块，由 export_stream 合并）"""
+    if fmt == 'ndjson':
+        for record in records:
+            yield dumps_bytes(record, default=iso_default) + b'\n'
+
+    elif fmt == 'json':
+        yield b'['
+        first = True
+        for record in records:
+            yield (b'\n' if first else b',\n') + dumps_bytes(record, default=iso_default)
+            first = False
+        yield b'\n]\n'
+
+    else:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        # BOM 便于 Excel 识别 UTF-8
+        buf.write('\ufeff')
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([_csv_value(record.get(column)) for column in columns])
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+
+
+def export_stream(pool, kind, fmt, chunk_bytes=64 * 1024, net_write_timeout=600):
+    """逐块产出导出内容（kind 为 EXPORTS 的键，fmt 为 FORMATS 的键）
+
+    第一次 next() 从 pool 借出连接、执行查询后先产出 b''，调用方据此在发送响应头之前
+    发现错误（如连接池耗尽）。中途中断（客户端断开）时结果集未读完，连接直接丢弃，
+    不再读完剩余的行。
+    """
+    sql, build, columns = EXPORTS[kind]
+
+    conn, created_at = pool.checkout()
+    finished = False
+    try:
+        with conn.cursor() as setup:
+            # 客户端读取较慢时服务端等待写出的时间
+            setup.execute("SET SESSION net_write_timeout = %s", (net_write_timeout,))
+            setup.execute("START TRANSACTION READ ONLY")
+
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        cursor.execute(sql)
+        yield b''
+        rows = cursor.fetchall_unbuffered()
+
+        pending = []
+        size = 0
+        for piece in _encode(build(rows), fmt, columns):
+            pending.append(piece)
+            size += len(piece)
+            if size >= chunk_bytes:
+                yield b''.join(pending)
+                pending = []
+                size = 0
+        if pending:
+            yield b''.join(pending)
+
+        cursor.close()
+        with conn.cursor() as setup:
+            setup.execute("SET SESSION net_write_timeout = DEFAULT")
+        conn.commit()
+        finished = True
+    except GeneratorExit:
+        logger.info(f"导出 {kind} 被客户端中断")
+        raise
+    except Exception as e:
+        logger.error(f"导出 {kind} 错误: {e}")
+        raise
+    finally:
+        pool.checkin(conn, created_at, broken=not finished)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+GUNICORN_WORKER_CLASS 选择 worker 模型，其余参数按模型给出默认值，均可用环境变量覆盖：
+
+- sync:    每个进程同时处理一个请求；进程数 2 × CPU + 1。长请求（导出、快照）会超过 timeout 被杀掉
+- gthread: 每个进程 GUNICORN_THREADS 个线程（默认不超过 DB_POOL_SIZE）；进程数 CPU + 1（默认）
+- gevent:  协程，每个进程最多 GUNICORN_WORKER_CONNECTIONS 个并发连接；进程数 CPU。
+           需要安装 gevent；索引重建等 CPU 密集的后台任务会阻塞同一进程中的请求
+
+平滑重启：preload_app 时 HUP 不会重新加载代码，发布新版本用
+    kill -USR2 <master pid>      # 启动新 master（重新导入应用、执行一次表结构初始化）
+    kill -WINCH <旧 master pid>  # 旧 worker 处理完当前请求后退出
+    kill -QUIT <旧 master pid>
+"""
+
+import os
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # 预加载的应用在 master 中导入，必须在导入之前打补丁
+    from gevent import monkey
+    monkey.patch_all()
+
+cpu_count = multiprocessing.cpu_count()
+db_pool_size = int(os.getenv('DB_POOL_SIZE', '10'))
+
+PRESETS = {
+    'sync': {'workers': cpu_count * 2 + 1, 'threads': 1},
+    'gthread': {'workers': cpu_count + 1, 'threads': min(8, db_pool_size)},
+    'gevent': {'workers': cpu_count, 'threads': 1},
+}
+if worker_class not in PRESETS:
+    raise RuntimeError(f"GUNICORN_WORKER_CLASS 只支持 {', '.join(PRESETS)}")
+preset = PRESETS[worker_class]
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', str(preset['workers'])))
+threads = int(os.getenv('GUNICORN_THREADS', str(preset['threads'])))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+backlog = int(os.getenv('GUNICORN_BACKLOG', '2048'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# 处理一定数量的请求后重启 worker（0 表示不重启），jitter 避免所有 worker 同时重启
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+forwarded_allow_ips = os.getenv('GUNICORN_FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+proc_name = 'iresearch'
+
+
+def on_starting(server):
+    # 清除上次运行留下的各进程指标文件
+    from metrics import clear_directory
+    clear_directory(os.getenv('METRICS_DIR', ''))
+
+
+def when_ready(server):
+    server.log.info(
+        f"worker 模型 {worker_class}：{workers} 个进程，每个进程 {threads} 个线程，"
+        f"数据库连接池 {db_pool_size}，preload={preload_app}"
+    )
+    concurrency = worker_connections if worker_class == 'gevent' else threads
+    if concurrency > db_pool_size:
+        server.log.warning(
+            f"每个进程的并发数 {concurrency} 大于 DB_POOL_SIZE={db_pool_size}，"
+            f"超出的请求会等待连接（最长 DB_POOL_TIMEOUT 秒）"
+        )
+
+
+def post_worker_init(worker):
+    # worker 加载应用之后（preload 时为 fork 之后）：丢弃继承的连接，启动本进程的后台线程
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import db_pool, password_hasher, request_metrics, stack_sampler
+    request_metrics.flush()
+    stack_sampler.flush()
+    password_hasher.shutdown()
+    db_pool.dispose()
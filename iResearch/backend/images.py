@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+概念图片处理
+上传内容按块写入磁盘并限制大小，按文件头判断真实格式（不信任扩展名和 Content-Type），
+按内容哈希存放（见 storage.py），同一张图片只保存一份。
+缩略图和 WebP 版本在后台线程中生成（需要 Pillow，未安装时只保存原图），
+结果以 JSON 记录在 concept.image_variants 中，前端按显示尺寸选择最小的版本。
+"""
+
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+from storage import commit_file, shard_path, temp_path, touch
+
+logger = logging.getLogger(__name__)
+
+# 文件头 -> 扩展名
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+# 缩略图名称 -> 最大边长
+VARIANT_SIZES = (('thumb', 160), ('medium', 480))
+
+COPY_CHUNK = 64 * 1024
+
+
+class ImageError(ValueError):
+    """上传的图片无效"""
+
+
+def sniff(head):
+    """按文件头判断图片格式，不是支持的格式时返回 None"""
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def save_upload(stream, directory, max_bytes):
+    """把上传内容按块写入 directory，返回 (相对路径, 是否与已有文件重复)
+
+    文件按内容哈希命名（如 ab/cd/<sha256>.png）。超过 max_bytes 或不是支持的
+    图片格式时删除已写入的部分并抛出 ImageError。
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = temp_path(directory)
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = stream.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = sniff(chunk)
+                    if ext is None:
+                        raise ImageError('只支持 PNG, JPG, GIF, WebP 格式')
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageError(f'图片不能超过 {max_bytes // (1024 * 1024)}MB')
+                digest.update(chunk)
+                f.write(chunk)
+        if ext is None:
+            raise ImageError('文件为空')
+        rel = shard_path(digest.hexdigest(), ext)
+        return rel, commit_file(tmp_path, directory, rel)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def make_variants(path, max_pixels, quality=80):
+    """为一张图片生成各尺寸的 WebP 缩略图和原尺寸 WebP，返回 {名称: {file, width, height}}
+
+    文件与原图放在同一目录，文件名为 <原图名>_<名称>.webp。原图按内容命名，
+    已有的同名缩略图直接复用。
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    variants = {}
+
+    existing = _existing_variants(directory, stem)
+    if existing is not None:
+        return existing
+
+    with Image.open(path) as image:
+        # 按 EXIF 方向旋转；动图只取第一帧
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        targets = [(name, size) for name, size in VARIANT_SIZES if max(image.size) > size]
+        targets.append(('webp', None))
+        for name, size in targets:
+            out = image
+            if size:
+                out = image.copy()
+                out.thumbnail((size, size), Image.LANCZOS)
+            variant = f"{stem}_{name}.webp"
+            tmp = os.path.join(directory, f".{variant}.part")
+            out.save(tmp, 'WEBP', quality=quality, method=4)
+            os.replace(tmp, os.path.join(directory, variant))
+            variants[name] = {'file': variant, 'width': out.width, 'height': out.height}
+
+    return variants
+
+
+def _existing_variants(directory, stem):
+    """同一内容的缩略图已全部生成时返回它们，否则返回 None"""
+    webp = os.path.join(directory, f"{stem}_webp.webp")
+    if not os.path.exists(webp):
+        return None
+    variants = {}
+    for name in [name for name, _ in VARIANT_SIZES] + ['webp']:
+        variant = f"{stem}_{name}.webp"
+        path = os.path.join(directory, variant)
+        if not os.path.exists(path):
+            continue
+        # 只读文件头取尺寸
+        with Image.open(path) as image:
+            variants[name] = {'file': variant, 'width': image.width, 'height': image.height}
+        touch(path)
+    return variants
+
+
+class ImageProcessor:
+    """后台生成图片缩略图
+
+    on_done(concept_id, image_path, variants) 在生成完成后由工作线程调用，负责写回数据库。
+    """
+
+    def __init__(self, upload_dir, on_done, workers=1, max_pixels=40_000_000, quality=80):
+        self.upload_dir = upload_dir
+        self.on_done = on_done
+        self.max_pixels = max_pixels
+        self.quality = quality
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def submit(self, concept_id, image_path):
+        """登记一张新上传的图片（image_path 为相对 static 的路径，如 uploads/xxx.png）"""
+        if not self.enabled:
+            return
+        # fork 之后线程不会被继承，按进程创建线程池
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='images')
+            self._pid = os.getpid()
+        self._executor.submit(self.process, concept_id, image_path)
+
+    def process(self, concept_id, image_path):
+        """在当前线程中生成缩略图（submit 的同步版本）"""
+        path = os.path.join(self.upload_dir, os.path.relpath(image_path, 'uploads'))
+        try:
+            variants = make_variants(path, self.max_pixels, self.quality)
+            prefix = os.path.dirname(image_path)
+            for variant in variants.values():
+                variant['path'] = f"{prefix}/{variant.pop('file')}"
+            self.on_done(concept_id, image_path, variants)
+        except Exception:
+            logger.exception(f"生成概念 {concept_id} 的缩略图失败: {image_path}")
+
+
+def load_variants(value):
+    """数据库中的 image_variants（JSON 文本）转为字典"""
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台导入任务
+上传的文件先落盘并在 import_job 表登记，由后台线程领取后流式导入。
+任务状态和进度都保存在数据库中，进程重启后未完成的任务会被重新领取并从
+最后一次提交的位置继续。
+"""
+
+import os
+import json
+import socket
+import logging
+import threading
+
+import pymysql
+
+from importer import MAX_RECORD_SIZE, ImportFormatError, ImportReport, is_ndjson, stream_import
+
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = """
+    id, filename, status, created_by, records_processed, companies_added,
+    concepts_added, error_count, message, attempts, created_at, started_at, finished_at,
+    TIMESTAMPDIFF(MICROSECOND, started_at, COALESCE(finished_at, NOW())) / 1000000 AS elapsed
+"""
+
+
+class JobQueueFull(Exception):
+    """排队中的任务过多"""
+
+
+def job_to_dict(job, include_errors=False):
+    """任务记录转为接口返回格式"""
+    elapsed = float(job['elapsed']) if job.get('elapsed') is not None else None
+    result = {
+        'id': job['id'],
+        'filename': job['filename'],
+        'status': job['status'],
+        'created_by': job['created_by'],
+        'records_processed': job['records_processed'],
+        'companies_added': job['companies_added'],
+        'concepts_added': job['concepts_added'],
+        'error_count': job['error_count'],
+        'message': job['message'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'].strftime('%Y-%m-%d %H:%M:%S') if job['created_at'] else None,
+        'started_at': job['started_at'].strftime('%Y-%m-%d %H:%M:%S') if job['started_at'] else None,
+        'finished_at': job['finished_at'].strftime('%Y-%m-%d %H:%M:%S') if job['finished_at'] else None,
+        'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+        'records_per_second': round(job['records_processed'] / elapsed, 1) if elapsed else None
+    }
+    if include_errors:
+        result['errors'] = json.loads(job['errors']) if job.get('errors') else []
+    return result
+
+
+class ImportJobRunner:
+    """导入任务执行器
+
+    - workers: 本进程的后台线程数
+    - max_running: 所有进程合计同时运行的任务数（用 MySQL GET_LOCK 做名额，
+      连接断开时名额自动释放）
+    - max_pending: 排队任务上限，超过时拒绝新任务
+    - stale_seconds: 运行中的任务超过该秒数没有心跳，视为进程已退出，重新排队
+    - max_attempts: 任务最多被领取的次数
+    - max_record_size: 单条记录的最大字节数，超出时任务失败
+    - chunk_hook: 返回 before_commit(cursor, report) 回调的工厂函数，每个任务调用一次
+    """
+
+    LOCK_PREFIX = 'iresearch_import_slot_'
+
+    def __init__(self, pool, spool_dir, workers=1, max_running=1, max_pending=4,
+                 chunk_size=500, batch_size=1000, max_errors=1000, max_record_size=MAX_RECORD_SIZE,
+                 poll_interval=2.0, stale_seconds=600, max_attempts=3, chunk_hook=None):
+        self.pool = pool
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.max_running = max_running
+        self.max_pending = max_pending
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.max_record_size = max_record_size
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.chunk_hook = chunk_hook
+
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程（可重复调用）"""
+        with self._lock:
+            # fork 之后线程不会被继承，按进程重新启动
+            owner = f"{socket.gethostname()}:{os.getpid()}"
+            if self._threads and self.owner == owner:
+                return
+            self.owner = owner
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._loop, name=f'import-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"导入任务线程已启动: {self.workers} 个")
+
+    # 提交任务
+
+    def submit(self, cursor, save_file, filename, user_id):
+        """登记任务并保存上传文件，返回任务 ID（调用方负责提交事务）
+
+        save_file(path) 负责把上传内容写入指定路径。
+        """
+        cursor.execute("SELECT COUNT(*) FROM import_job WHERE status = 'queued'")
+        if cursor.fetchone()[0] >= self.max_pending:
+            raise JobQueueFull(f"排队中的导入任务已达上限（{self.max_pending}）")
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        cursor.execute("""
+            INSERT INTO import_job (filename, file_path, status, created_by)
+            VALUES (%s, '', 'queued', %s)
+        """, (filename, user_id))
+        job_id = cursor.lastrowid
+
+        path = os.path.join(self.spool_dir, f"import_{job_id}.json")
+        save_file(path)
+        cursor.execute("UPDATE import_job SET file_path = %s WHERE id = %s", (path, job_id))
+        return job_id
+
+    def notify(self):
+        """唤醒本进程的后台线程"""
+        self.start()
+        self._wakeup.set()
+
+    # 后台执行
+
+    def _loop(self):
+        while True:
+            try:
+                while self._run_next():
+                    pass
+            except Exception:
+                logger.exception("导入任务线程出错")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _acquire_slot(self, cursor):
+        for slot in range(self.max_running):
+            cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (f"{self.LOCK_PREFIX}{slot}",))
+            if cursor.fetchone()['acquired'] == 1:
+                return slot
+        return None
+
+    def _run_next(self):
+        """领取并执行一个任务，没有可执行的任务时返回 False"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            try:
+                self._requeue_stale(cursor)
+                conn.commit()
+
+                cursor.execute("SELECT id FROM import_job WHERE status = 'queued' ORDER BY id LIMIT 1")
+                if not cursor.fetchone():
+                    return False
+
+                slot = self._acquire_slot(cursor)
+                if slot is None:
+                    return False
+
+                try:
+                    job = self._claim(cursor)
+                    conn.commit()
+                    if job is None:
+                        return False
+                    self._execute(conn, cursor, job)
+                    return True
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (f"{self.LOCK_PREFIX}{slot}",))
+            finally:
+                cursor.close()
+
+    def _requeue_stale(self, cursor):
+        cursor.execute("""
+            UPDATE import_job
+            SET status = IF(attempts >= %s, 'failed', 'queued'),
+                message = IF(attempts >= %s, '导入任务多次中断，已放弃', '进程中断，重新排队'),
+                finished_at = IF(attempts >= %s, NOW(), NULL)
+            WHERE status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND
+        """, (self.max_attempts, self.max_attempts, self.max_attempts, self.stale_seconds))
+        if cursor.rowcount:
+            logger.warning(f"{cursor.rowcount} 个导入任务心跳超时，已重新排队")
+
+    def _claim(self, cursor):
+        cursor.execute("SELECT * FROM import_job WHERE status = 'queued' ORDER BY id LIMIT 1 FOR UPDATE")
+        job = cursor.fetchone()
+        if not job:
+            return None
+        cursor.execute("""
+            UPDATE import_job
+            SET status = 'running', owner = %s, attempts = attempts + 1,
+                started_at = COALESCE(started_at, NOW()), heartbeat_at = NOW()
+            WHERE id = %s AND status = 'queued'
+        """, (self.owner, job['id']))
+        if cursor.rowcount != 1:
+            return None
+        return job
+
+    def _execute(self, conn, cursor, job):
+        job_id = job['id']
+        logger.info(f"开始导入任务 {job_id}（已完成 {job['records_processed']} 条）")
+
+        # 从上次提交的位置继续
+        report = ImportReport(max_errors=self.max_errors)
+        report.records = job['records_processed']
+        report.companies_added = job['companies_added']
+        report.concepts_added = job['concepts_added']
+        report.error_count = job['error_count']
+        report.errors = json.loads(job['errors']) if job['errors'] else []
+
+        hook = self.chunk_hook() if self.chunk_hook else None
+
+        def save_progress(chunk_cursor, report):
+            if hook:
+                hook(chunk_cursor, report)
+            chunk_cursor.execute("""
+                UPDATE import_job
+                SET records_processed = %s, companies_added = %s, concepts_added = %s,
+                    error_count = %s, errors = %s, heartbeat_at = NOW()
+                WHERE id = %s
+            """, (report.records, report.companies_added, report.concepts_added,
+                  report.error_count, json.dumps(report.errors, ensure_ascii=False), job_id))
+
+        status, message = 'succeeded', None
+        try:
+            with open(job['file_path'], 'rb') as f:
+                stream_import(
+                    conn, f,
+                    chunk_size=self.chunk_size,
+                    batch_size=self.batch_size,
+                    report=report,
+                    before_commit=save_progress,
+                    skip=job['records_processed'],
+                    ndjson=is_ndjson(job['filename']),
+                    max_record_size=self.max_record_size
+                )
+        except ImportFormatError as e:
+            status, message = 'failed', str(e)
+        except FileNotFoundError:
+            status, message = 'failed', '上传文件已丢失'
+        except Exception as e:
+            logger.exception(f"导入任务 {job_id} 失败")
+            status, message = 'failed', f"导入失败: {e}"[:500]
+
+        cursor.execute("""
+            UPDATE import_job
+            SET status = %s, message = %s, finished_at = NOW(), heartbeat_at = NOW()
+            WHERE id = %s
+        """, (status, message, job_id))
+        conn.commit()
+
+        try:
+            os.remove(job['file_path'])
+        except OSError:
+            pass
+        logger.info(f"导入任务 {job_id} 结束: {status}，{report.progress()}")
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 批量导入
+先收集整批记录中的公司名和概念术语，用 IN (...) 批量查出已有 ID，
+再用多行 INSERT IGNORE 分批写入新公司、新概念和关联。
+大文件可使用流式模式：边读边解析顶层数组（或每行一条记录的 NDJSON），按固定条数分块提交。
+"""
+
+import copy
+import json
+import time
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 公司表字段 <- JSON 字段
+COMPANY_FIELDS = [
+    ('name', 'company_name'),
+    ('website', 'website'),
+    ('address', 'address'),
+    ('team_info', 'team_info'),
+    ('funding_info', 'funding_info'),
+    ('product', 'product_service'),
+    ('biz_model', 'biz_model'),
+    ('partners', 'partners'),
+    ('clients', 'clients'),
+    ('field', 'field'),
+    ('notes', 'detail'),
+    ('source_link', 'source'),
+]
+
+# 按每行一条记录（NDJSON）解析的文件扩展名
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+COMPANY_NAME_MAX = 255
+CONCEPT_TERM_MAX = 128
+
+# 流式解析时单条记录（JSON 数组元素或 NDJSON 的一行）的最大字节数，超出视为格式错误
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+
+class ImportFormatError(ValueError):
+    """上传内容不是合法的 JSON 数组"""
+
+
+class ImportReport:
+    """导入结果统计，流式导入时也用作进度
+
+    errors 最多保留 max_errors 条，error_count 为实际错误总数。
+    """
+
+    def __init__(self, max_errors=1000):
+        self.records = 0
+        self.companies_added = 0
+        self.concepts_added = 0
+        self.errors = []
+        self.error_count = 0
+        self.max_errors = max_errors
+        self.chunks = 0
+        self.commit_ms_total = 0.0
+        self.last_commit_ms = 0.0
+        self.started_at = time.monotonic()
+        # 新写入的记录 ID 及新增了概念关联的公司 ID，由调用方取走（用于更新搜索索引和缓存）
+        self.added_ids = {'company': [], 'concept': [], 'linked_company': []}
+
+    def add_error(self, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def copy(self):
+        """本块导入用的副本：提交成功后再用 update() 写回，回滚时丢弃"""
+        pending = copy.copy(self)
+        pending.errors = list(self.errors)
+        pending.added_ids = {entity: list(ids) for entity, ids in self.added_ids.items()}
+        return pending
+
+    def update(self, other):
+        self.__dict__.update(other.__dict__)
+
+    def take_added_ids(self, entity):
+        """取出并清空某类新写入记录的 ID"""
+        ids = self.added_ids[entity]
+        self.added_ids[entity] = []
+        return ids
+
+    def to_dict(self):
+        return {
+            'companies_added': self.companies_added,
+            'concepts_added': self.concepts_added,
+            'errors': self.errors
+        }
+
+    def progress(self):
+        """导入过程中的进度快照"""
+        return {
+            'records': self.records,
+            'companies_added': self.companies_added,
+            'concepts_added': self.concepts_added,
+            'error_count': self.error_count,
+            'chunks': self.chunks,
+            'last_commit_ms': round(self.last_commit_ms, 1),
+            'commit_ms_total': round(self.commit_ms_total, 1),
+            'elapsed_ms': round((time.monotonic() - self.started_at) * 1000, 1)
+        }
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _scalar(value):
+    """嵌套结构转为 JSON 文本，避免拼接出非法 SQL"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _fetch_ids(cursor, table, column, keys, batch_size):
+    """按 IN (...) 分批查询已有记录，返回 {数据库中的值: id}"""
+    found = {}
+    for batch in _chunks(keys, batch_size):
+        placeholders = ','.join(['%s'] * len(batch))
+        cursor.execute(
+            f"SELECT id, {column} FROM {table} WHERE {column} IN ({placeholders})",
+            batch
+        )
+        for row_id, value in cursor.fetchall():
+            found[value] = row_id
+    return found
+
+
+def _match_ids(cursor, table, column, keys, found):
+    """把查询结果映射回原始键
+
+    MySQL 的排序规则不区分大小写并忽略尾部空格，数据库中的值可能与导入的
+    字符串不完全一致：先精确匹配，再按 casefold 匹配，最后逐个回查。
+    """
+    folded = {}
+    for value, row_id in found.items():
+        folded.setdefault(value.casefold(), row_id)
+
+    ids = {}
+    for key in keys:
+        row_id = found.get(key)
+        if row_id is None:
+            row_id = folded.get(key.casefold())
+        if row_id is None:
+            cursor.execute(f"SELECT id FROM {table} WHERE {column} = %s", (key,))
+            row = cursor.fetchone()
+            row_id = row[0] if row else None
+        if row_id is not None:
+            ids[key] = row_id
+    return ids
+
+
+def _insert_ignore(cursor, sql, rows, batch_size):
+    """分批执行多行 INSERT IGNORE，返回实际插入的行数"""
+    inserted = 0
+    for batch in _chunks(rows, batch_size):
+        # executemany 会把 INSERT ... VALUES 改写为单条多行语句
+        cursor.executemany(sql, batch)
+        inserted += cursor.rowcount
+    return inserted
+
+
+def import_records(cursor, records, batch_size=1000, start_index=0, report=None):
+    """导入一批公司记录（不提交事务）
+
+    records 为上传 JSON 数组中的元素，start_index 为第一条记录在整个文件中的
+    下标，用于错误提示中的行号。
+    """
+    if report is None:
+        report = ImportReport()
+
+    companies = {}      # 公司名 -> 插入参数
+    concepts = {}       # 术语 -> 解释（首次出现为准）
+    links = []          # (公司名, 术语)
+
+    for offset, record in enumerate(records):
+        line = start_index + offset + 1
+        report.records += 1
+
+        if not isinstance(record, dict):
+            report.add_error(f"第{line}条记录格式错误")
+            continue
+
+        company_name = record.get('company_name')
+        if not company_name or not isinstance(company_name, str):
+            report.add_error(f"第{line}条记录缺少公司名称")
+            continue
+        if len(company_name) > COMPANY_NAME_MAX:
+            report.add_error(f"第{line}条记录公司名称过长")
+            continue
+
+        if company_name not in companies:
+            companies[company_name] = tuple(
+                _scalar(record.get(source)) for _, source in COMPANY_FIELDS
+            )
+
+        explain = record.get('explain', {})
+        if not isinstance(explain, dict):
+            continue
+
+        for term, definition in explain.items():
+            if not term:
+                continue
+            if len(term) > CONCEPT_TERM_MAX:
+                report.add_error(f"第{line}条记录概念「{term[:20]}…」过长")
+                continue
+            if term not in concepts:
+                concepts[term] = _scalar(definition) or ''
+            links.append((company_name, term))
+
+    if not companies:
+        return report
+
+    # 公司
+    names = list(companies)
+    existing = _fetch_ids(cursor, 'company', 'name', names, batch_size)
+    new_names = [name for name in names if name not in existing]
+    if new_names:
+        columns = ', '.join(column for column, _ in COMPANY_FIELDS)
+        placeholders = ', '.join(['%s'] * len(COMPANY_FIELDS))
+        report.companies_added += _insert_ignore(
+            cursor,
+            f"INSERT IGNORE INTO company ({columns}) VALUES ({placeholders})",
+            [companies[name] for name in new_names],
+            batch_size
+        )
+        existing.update(_fetch_ids(cursor, 'company', 'name', new_names, batch_size))
+    company_ids = _match_ids(cursor, 'company', 'name', names, existing)
+    report.added_ids['company'].extend(company_ids[name] for name in new_names if name in company_ids)
+
+    # 概念
+    terms = list(concepts)
+    existing = _fetch_ids(cursor, 'concept', 'term', terms, batch_size)
+    new_terms = [term for term in terms if term not in existing]
+    if new_terms:
+        report.concepts_added += _insert_ignore(
+            cursor,
+            "INSERT IGNORE INTO concept (term, plain_def) VALUES (%s, %s)",
+            [(term, concepts[term]) for term in new_terms],
+            batch_size
+        )
+        existing.update(_fetch_ids(cursor, 'concept', 'term', new_terms, batch_size))
+    concept_ids = _match_ids(cursor, 'concept', 'term', terms, existing)
+    report.added_ids['concept'].extend(concept_ids[term] for term in new_terms if term in concept_ids)
+
+    # 关联
+    pairs = []
+    seen = set()
+    for company_name, term in links:
+        pair = (company_ids.get(company_name), concept_ids.get(term))
+        if None in pair or pair in seen:
+            continue
+        seen.add(pair)
+        pairs.append(pair)
+
+    if pairs:
+        report.added_ids['linked_company'].extend(dict.fromkeys(company_id for company_id, _ in pairs))
+        _insert_ignore(
+            cursor,
+            "INSERT IGNORE INTO company_concept (company_id, concept_id) VALUES (%s, %s)",
+            pairs,
+            batch_size
+        )
+
+    missing = len(companies) - len(company_ids)
+    if missing:
+        report.add_error(f"{missing}家公司写入后未能查到ID，已跳过其概念关联")
+
+    return report
+
+
+def iter_json_array(stream, read_size=64 * 1024, max_record_size=MAX_RECORD_SIZE):
+    """从二进制流中逐个解析顶层 JSON 数组的元素
+
+    只在内存中保留当前未解析完的一段文本，适合任意大小的文件；单个元素超过
+    max_record_size 个字符时抛出 ImportFormatError。
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        data = stream.read(read_size)
+        if not data:
+            eof = True
+        # 丢弃已解析部分
+        buf = buf[pos:] + text.decode(data or b'', final=eof)
+        pos = 0
+
+    def next_char():
+        """跳过空白，返回下一个字符（不消费），流结束返回空串"""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ''
+            fill()
+
+    try:
+        if next_char() != '[':
+            raise ImportFormatError('JSON格式错误，应为数组')
+        pos += 1
+
+        if next_char() == ']':
+            return
+
+        while True:
+            if next_char() == '':
+                raise ImportFormatError('JSON格式错误：文件不完整')
+
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise ImportFormatError('JSON格式错误')
+                    if len(buf) - pos > max_record_size:
+                        raise ImportFormatError(f'JSON格式错误：单条记录超过{max_record_size // (1024 * 1024)}MB')
+                    fill()
+                    continue
+                # 元素恰好结束在缓冲区末尾时可能被截断（如数字），再读一些确认
+                if end == len(buf) and not eof:
+                    fill()
+                    continue
+                break
+
+            pos = end
+            yield value
+
+            ch = next_char()
+            if ch == ',':
+                pos += 1
+            elif ch == ']':
+                return
+            else:
+                raise ImportFormatError('JSON格式错误')
+    except UnicodeDecodeError:
+        raise ImportFormatError('文件编码错误，应为UTF-8')
+
+
+def is_ndjson(filename):
+    return bool(filename) and filename.lower().endswith(NDJSON_EXTENSIONS)
+
+
+def iter_ndjson(stream, max_record_size=MAX_RECORD_SIZE):
+    """从二进制流中逐行解析 NDJSON 记录，空行跳过；一行超过 max_record_size 字节时抛出 ImportFormatError"""
+    line_no = 0
+    while True:
+        line = stream.readline(max_record_size + 1)
+        if not line:
+            return
+        line_no += 1
+        if len(line) > max_record_size:
+            raise ImportFormatError(f'JSON格式错误：第{line_no}行超过{max_record_size // (1024 * 1024)}MB')
+        if line_no == 1:
+            line = line.removeprefix(codecs.BOM_UTF8)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line.decode('utf-8'))
+        except UnicodeDecodeError:
+            raise ImportFormatError('文件编码错误，应为UTF-8')
+        except json.JSONDecodeError:
+            raise ImportFormatError(f'JSON格式错误：第{line_no}行')
+
+
+def stream_import(conn, stream, chunk_size=500, batch_size=1000, report=None,
+                  on_chunk=None, before_commit=None, skip=0, ndjson=False,
+                  max_record_size=MAX_RECORD_SIZE):
+    """流式导入：每解析 chunk_size 条记录导入并提交一次
+
+    ndjson 为 True 时按每行一条记录解析，否则解析顶层 JSON 数组。每次提交前调用 before_commit(cursor, report)（与本块数据同一事务），
+    提交后调用 on_chunk(report) 报告进度。skip 为跳过的前若干条记录（续传）。
+    本块的统计先记在 report 的副本上，提交成功后才写回 report，回滚时 report 保持上次提交后的状态。
+    文件中途格式错误时，之前的记录已提交，抛出 ImportFormatError。
+    """
+    if report is None:
+        report = ImportReport()
+
+    cursor = conn.cursor()
+    chunk = []
+
+    def commit_chunk():
+        pending = report.copy()
+        start = time.monotonic()
+        try:
+            import_records(cursor, chunk, batch_size=batch_size,
+                           start_index=report.records, report=pending)
+            if before_commit:
+                before_commit(cursor, pending)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        report.update(pending)
+        report.chunks += 1
+        report.last_commit_ms = (time.monotonic() - start) * 1000
+        report.commit_ms_total += report.last_commit_ms
+        chunk.clear()
+        logger.info(f"导入进度: {report.progress()}")
+        if on_chunk:
+            on_chunk(report)
+
+    try:
+        try:
+            if ndjson:
+                records = iter_ndjson(stream, max_record_size=max_record_size)
+            else:
+                records = iter_json_array(stream, max_record_size=max_record_size)
+            for index, record in enumerate(records):
+                if index < skip:
+                    continue
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    commit_chunk()
+        except ImportFormatError:
+            # 格式错误前已解析的记录照常导入
+            if chunk:
+                commit_chunk()
+            raise
+        if chunk:
+            commit_chunk()
+    finally:
+        cursor.close()
+
+    return report
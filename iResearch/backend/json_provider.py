@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 序列化与响应压缩
+安装 orjson 时用它序列化，否则使用标准库 json；日期时间统一输出为 YYYY-MM-DD，
+处理函数不必再逐行调用 strftime（数据导出用 iso_default 保留完整时间）。输出为 UTF-8（不转义中文），不排序键。
+"""
+
+import gzip
+import json
+import decimal
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import phase
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# 可压缩的响应类型
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'image/svg+xml')
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"无法序列化 {type(value).__name__} 类型的值")
+
+
+def iso_default(value):
+    """日期时间输出为完整的 ISO 8601（如 2024-05-01T12:30:15），其余同 _default"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return _default(value)
+
+
+def dumps_bytes(obj, indent=False, default=_default):
+    """序列化为 UTF-8 字节串"""
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    if indent:
+        return json.dumps(obj, default=default, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """替换 Flask 默认的 JSON 序列化（app.json = FastJSONProvider(app)）"""
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with phase('serialize'):
+            body = dumps_bytes(obj, indent=indent)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encodings):
+    """按请求的 Accept-Encoding 选择压缩方式：br（需安装 brotli）优先，其次 gzip"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
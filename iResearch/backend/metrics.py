@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求指标
+每个请求按路由记录耗时直方图（路由、方法、状态码）、SQL 语句数、数据库耗时、读取行数和响应字节数；
+数据库连接池统计在导出时读取。/metrics 以 Prometheus 文本格式导出，响应头 Server-Timing
+给出数据库、序列化、压缩和其余 Python 代码各自的耗时，浏览器开发者工具中可以直接查看。
+
+多进程部署（gunicorn）时设置 directory：各进程定期把自己的计数写入该目录下的 <pid>.json，
+导出时汇总所有进程，不论抓取请求落到哪个进程结果都一致。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'iresearch'
+
+# 请求耗时（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求的 SQL 语句数（N+1 查询在这里最明显）
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# 请求之外（后台线程）执行的查询归入该路由
+BACKGROUND = 'background'
+
+_current = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """一个请求内的计时和计数"""
+
+    __slots__ = ('start', 'queries', 'db_seconds', 'rows', 'phases')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.phases = {}
+
+
+def begin_request():
+    """请求开始时调用，返回本请求的 RequestTimer"""
+    timer = RequestTimer()
+    _current.set(timer)
+    return timer
+
+
+def end_request():
+    _current.set(None)
+
+
+@contextmanager
+def phase(name):
+    """把一段代码的耗时计入当前请求的 name 阶段（如 serialize、compress）"""
+    timer = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.phases[name] = timer.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """记录每条 SQL 的耗时和返回行数的 PyMySQL 连接
+
+    所有游标的 execute 最终都经过 Connection.query。非缓冲游标（SSCursor）的行在
+    query 返回之后才读取，不计入行数。设置 slow_log 时游标换成带计时的子类
+    （见 slow_queries.SlowQueryLog）。
+    """
+
+    registry = None
+    slow_log = None
+
+    def cursor(self, cursor=None):
+        if self.slow_log is not None:
+            cursor = self.slow_log.cursor_class(cursor or self.cursorclass)
+        return super().cursor(cursor)
+
+    def query(self, sql, unbuffered=False):
+        start = time.perf_counter()
+        try:
+            return super().query(sql, unbuffered)
+        finally:
+            elapsed = time.perf_counter() - start
+            result = self._result
+            rows = len(result.rows) if result is not None and not unbuffered and result.rows else 0
+            timer = _current.get()
+            if timer is not None:
+                timer.queries += 1
+                timer.db_seconds += elapsed
+                timer.rows += rows
+            elif self.registry is not None:
+                self.registry.observe_background(elapsed, rows)
+
+
+def server_timing(timer, total):
+    """Server-Timing 响应头：数据库、各阶段、其余 Python 代码和总耗时（毫秒）"""
+    parts = [f'db;dur={timer.db_seconds * 1000:.1f};desc="{timer.queries} queries"']
+    other = total - timer.db_seconds
+    for name, seconds in timer.phases.items():
+        parts.append(f"{name};dur={seconds * 1000:.1f}")
+        other -= seconds
+    parts.append(f"app;dur={max(other, 0) * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+
+def _new_histogram(buckets):
+    # 各区间（非累计）计数 + 溢出区间、总和、次数
+    return [[0] * (len(buckets) + 1), 0.0, 0]
+
+
+def _observe(histogram, buckets, value):
+    histogram[0][_bucket_index(buckets, value)] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+
+def _copy_histogram(histogram):
+    return [list(histogram[0]), histogram[1], histogram[2]]
+
+
+def _merge_histogram(target, source):
+    for i, count in enumerate(source[0]):
+        target[0][i] += count
+    target[1] += source[1]
+    target[2] += source[2]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """本进程的请求指标
+
+    - pool_stats: 返回连接池统计（ConnectionPool.stats）的函数
+    - directory: 多进程汇总用的目录，为空时只导出本进程
+    - flush_interval: 写入 directory 的间隔秒数
+    """
+
+    def __init__(self, pool_stats=None, directory='', flush_interval=5):
+        self.pool_stats = pool_stats
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._requests = {}     # (路由, 方法, 状态码) -> 耗时直方图
+        self._queries = {}      # 路由 -> 每请求语句数直方图
+        self._routes = {}       # 路由 -> {db_seconds, rows, bytes}
+        self._flusher_pid = None
+
+    def after_fork(self):
+        """子进程中清空从父进程继承的计数（否则父进程的计数会被每个子进程重复导出）"""
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._queries = {}
+        self._routes = {}
+        self._flusher_pid = None
+
+    def _route_totals(self, route):
+        totals = self._routes.get(route)
+        if totals is None:
+            totals = self._routes[route] = {'db_seconds': 0.0, 'rows': 0, 'bytes': 0}
+        return totals
+
+    def observe_request(self, route, method, status, seconds, timer, response_bytes):
+        key = (route, method, str(status))
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = _new_histogram(LATENCY_BUCKETS)
+            _observe(histogram, LATENCY_BUCKETS, seconds)
+
+            queries = self._queries.get(route)
+            if queries is None:
+                queries = self._queries[route] = _new_histogram(QUERY_BUCKETS)
+            _observe(queries, QUERY_BUCKETS, timer.queries)
+
+            totals = self._route_totals(route)
+            totals['db_seconds'] += timer.db_seconds
+            totals['rows'] += timer.rows
+            totals['bytes'] += response_bytes
+        self._ensure_flusher()
+
+    def observe_background(self, seconds, rows):
+        with self._lock:
+            queries = self._queries.get(BACKGROUND)
+            if queries is None:
+                queries = self._queries[BACKGROUND] = _new_histogram(QUERY_BUCKETS)
+            # 后台查询没有请求边界，每条语句按一次记录
+            _observe(queries, QUERY_BUCKETS, 1)
+            totals = self._route_totals(BACKGROUND)
+            totals['db_seconds'] += seconds
+            totals['rows'] += rows
+
+    # 多进程汇总
+
+    def snapshot(self):
+        """本进程的计数（可 JSON 序列化）"""
+        with self._lock:
+            data = {
+                'requests': [[*key, _copy_histogram(h)] for key, h in self._requests.items()],
+                'queries': [[route, _copy_histogram(h)] for route, h in self._queries.items()],
+                'routes': {route: dict(totals) for route, totals in self._routes.items()},
+            }
+        data['pool'] = self.pool_stats() if self.pool_stats else {}
+        return data
+
+    def _ensure_flusher(self):
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("写入指标文件失败")
+
+    def flush(self):
+        """把本进程的计数写入 directory/<pid>.json"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """所有进程的计数：本进程取实时值，其他进程读文件（已退出进程的连接池计数不计入）"""
+        snapshots = [self.snapshot()]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            pid = int(filename[:-5]) if filename[:-5].isdigit() else None
+            if pid is None or pid == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _pid_alive(pid):
+                data['pool'] = {}
+            snapshots.append(data)
+        return snapshots
+
+    # 导出
+
+    def render(self):
+        """Prometheus 文本格式"""
+        requests, queries, routes, pool = {}, {}, {}, {}
+        for data in self.collect():
+            for route, method, status, histogram in data['requests']:
+                target = requests.setdefault((route, method, status), _new_histogram(LATENCY_BUCKETS))
+                _merge_histogram(target, histogram)
+            for route, histogram in data['queries']:
+                _merge_histogram(queries.setdefault(route, _new_histogram(QUERY_BUCKETS)), histogram)
+            for route, totals in data['routes'].items():
+                target = routes.setdefault(route, {'db_seconds': 0.0, 'rows': 0, 'bytes': 0})
+                for key, value in totals.items():
+                    target[key] += value
+            for key, value in data['pool'].items():
+                pool[key] = pool.get(key, 0) + value
+
+        lines = []
+
+        def histogram_lines(name, help_text, buckets, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, total, count) in sorted(series.items()):
+                labels = dict(labels)
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(**labels)} {total}")
+                lines.append(f"{name}_count{_labels(**labels)} {count}")
+
+        def counter_lines(name, help_text, series, kind='counter'):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                lines.append(f"{name}{_labels(**labels) if labels else ''} {value}")
+
+        histogram_lines(
+            f"{PREFIX}_http_request_duration_seconds", '请求耗时（秒）', LATENCY_BUCKETS,
+            {(('route', r), ('method', m), ('status', s)): h for (r, m, s), h in requests.items()}
+        )
+        histogram_lines(
+            f"{PREFIX}_db_queries_per_request", '每个请求执行的 SQL 语句数', QUERY_BUCKETS,
+            {(('route', r),): h for r, h in queries.items()}
+        )
+        route_series = sorted(routes.items())
+        counter_lines(f"{PREFIX}_db_query_seconds_total", '数据库耗时（秒）',
+                      [({'route': r}, t['db_seconds']) for r, t in route_series])
+        counter_lines(f"{PREFIX}_db_rows_total", '查询返回的行数',
+                      [({'route': r}, t['rows']) for r, t in route_series])
+        counter_lines(f"{PREFIX}_http_response_bytes_total", '响应体字节数（压缩后）',
+                      [({'route': r}, t['bytes']) for r, t in route_series if r != BACKGROUND])
+
+        if pool:
+            for key in ('in_use', 'idle', 'max_size'):
+                counter_lines(f"{PREFIX}_db_pool_{key}", f"连接池 {key}", [({}, pool.get(key, 0))], kind='gauge')
+            for key in ('created', 'closed', 'checkouts', 'timeouts'):
+                counter_lines(f"{PREFIX}_db_pool_{key}_total", f"连接池 {key}", [({}, pool.get(key, 0))])
+            counter_lines(f"{PREFIX}_db_pool_wait_seconds_total", '等待连接的总时间（秒）',
+                          [({}, pool.get('wait_ms_total', 0) / 1000)])
+        return '\n'.join(lines) + '\n'
+
+
+def clear_directory(directory):
+    """删除上一次运行留下的指标文件（master 启动时调用）"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith('.json') or filename.endswith('.json.tmp'):
+            os.remove(os.path.join(directory, filename))
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库迁移
+迁移按版本号顺序执行，每个迁移由若干步骤组成；执行过的迁移连同校验和记录在 schema_version 表中。
+
+启动时先用一条查询读出已执行的迁移，与代码中的迁移一致时直接返回；有未执行的迁移时
+持有 GET_LOCK 执行（多个进程同时启动时只有一个执行，其余等待后重新检查）。
+已执行迁移的内容被修改（校验和不同）时拒绝启动——已发布的迁移不能修改，只能追加新的迁移。
+
+MySQL 的 DDL 会隐式提交，迁移中途失败时已执行的步骤不会回滚，因此每个步骤都必须可以
+重复执行（CREATE TABLE IF NOT EXISTS、先检查再添加列和索引）。
+索引用 ALGORITHM=INPLACE, LOCK=NONE 在线创建，创建期间表仍可读写。
+"""
+
+import time
+import hashlib
+import logging
+
+import pymysql
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'iresearch_schema'
+
+# 表不存在
+ER_NO_SUCH_TABLE = 1146
+
+# 旧版本按函数源码计算的校验和，视同当前校验和（这些迁移已在部署的数据库中执行过）
+LEGACY_CHECKSUMS = {
+    1: '4b1f392b7c57f334c3d4f6847ad7d9e2024d1c381fbfc1b6639330a9df30b3b1',
+}
+
+
+class MigrationError(Exception):
+    """迁移记录与代码不一致，或等待迁移锁超时"""
+
+
+# 步骤：(描述, 执行函数)，描述用于计算校验和
+
+def sql(statement):
+    """执行一条 SQL"""
+    return ' '.join(statement.split()), lambda cursor, config: cursor.execute(statement)
+
+
+def add_column(table, column, definition):
+    """列不存在时添加（在线执行）"""
+    def run(cursor, config):
+        cursor.execute(
+            """
+            SELECT COUNT(1) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            """,
+            (table, column)
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition}, ALGORITHM=INPLACE, LOCK=NONE"
+            )
+    return f"add_column {table}.{column} {definition}", run
+
+
+def add_index(table, name, columns, kind='INDEX', online=True):
+    """索引不存在时在线创建
+
+    已有同名索引，或已有以相同列开头的索引（如外键自动创建的索引）时跳过。
+    """
+    def run(cursor, config):
+        cursor.execute(
+            """
+            SELECT index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index)
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s
+            GROUP BY index_name
+            """,
+            (table,)
+        )
+        wanted = ','.join(columns)
+        for index_name, index_columns in cursor.fetchall():
+            if index_name == name or (kind == 'INDEX' and f"{index_columns},".startswith(f"{wanted},")):
+                logger.info(f"{table} 已有索引 {index_name}({index_columns})，跳过创建 {name}")
+                return
+        options = 'ALGORITHM=INPLACE, LOCK=NONE' if online else 'ALGORITHM=INPLACE'
+        cursor.execute(
+            f"ALTER TABLE `{table}` ADD {kind} `{name}` ({', '.join(columns)}), {options}"
+        )
+    return f"add_index {kind} {table}.{name} ({', '.join(columns)}) online={online}", run
+
+
+def call(fn, description):
+    """执行自定义函数 fn(cursor, config)
+
+    校验和按 description 计算，而不是函数源码：修改注释、调整格式不影响已执行的迁移；
+    函数的行为改变时应同时修改 description（通常应追加新的迁移）。
+    """
+    return f"call {description}", fn
+
+
+def _create_fulltext(cursor, config):
+    # 首个全文索引需要重建表，不能 LOCK=NONE；不支持 FULLTEXT 时只记录警告（搜索改用 LIKE）
+    try:
+        add_index('concept', 'ft_concept_term_plain', ['term', 'plain_def', 'mechanism', 'examples'],
+                  kind='FULLTEXT INDEX', online=False)[1](cursor, config)
+    except pymysql.MySQLError as e:
+        logger.warning(f"创建全文索引失败（可能不支持FULLTEXT）: {e}")
+
+
+def _seed_admin(cursor, config):
+    # 没有任何用户时创建默认管理员
+    cursor.execute("SELECT COUNT(*) FROM user")
+    if cursor.fetchone()[0] == 0:
+        password_hash = generate_password_hash(config['ADMIN_PASS'], method=config['PASSWORD_HASH_METHOD'])
+        cursor.execute("""
+            INSERT INTO user (username, email, password_hash, role)
+            VALUES (%s, %s, %s, 'admin')
+        """, (config['ADMIN_USER'], 'admin@example.com', password_hash))
+        logger.info(f"默认管理员账户已创建: {config['ADMIN_USER']} / {config['ADMIN_PASS']}")
+        logger.warning("请在生产环境中修改默认密码！")
+
+
+# (版本号, 名称, [步骤, ...])；只能在末尾追加
+MIGRATIONS = [
+    (1, 'initial_schema', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS company (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(255) UNIQUE NOT NULL,
+                domain VARCHAR(255),
+                website VARCHAR(512),
+                address VARCHAR(255),
+                team_info TEXT,
+                funding_info TEXT,
+                field VARCHAR(255),
+                product TEXT,
+                problem TEXT,
+                method TEXT,
+                difference TEXT,
+                tech_core TEXT,
+                biz_model TEXT,
+                partners TEXT,
+                clients TEXT,
+                notes TEXT,
+                source_link VARCHAR(512),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_company_name (name)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS category (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(128) UNIQUE NOT NULL,
+                parent_id BIGINT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (parent_id) REFERENCES category(id) ON DELETE SET NULL,
+                INDEX idx_category_parent (parent_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS concept (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                term VARCHAR(128) UNIQUE NOT NULL,
+                plain_def TEXT,
+                mechanism TEXT,
+                examples TEXT,
+                image_path VARCHAR(512),
+                last_used TIMESTAMP NULL,
+                category_id BIGINT NULL,
+                FOREIGN KEY (category_id) REFERENCES category(id) ON DELETE SET NULL,
+                INDEX idx_concept_term (term),
+                INDEX idx_concept_cat (category_id, last_used)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS company_concept (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                company_id BIGINT NOT NULL,
+                concept_id BIGINT NOT NULL,
+                UNIQUE(company_id, concept_id),
+                FOREIGN KEY (company_id) REFERENCES company(id) ON DELETE CASCADE,
+                FOREIGN KEY (concept_id) REFERENCES concept(id) ON DELETE CASCADE,
+                INDEX idx_cc_company (company_id),
+                INDEX idx_cc_concept (concept_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS category_concept (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                category_id BIGINT NOT NULL,
+                concept_id BIGINT NOT NULL,
+                UNIQUE(category_id, concept_id),
+                FOREIGN KEY (category_id) REFERENCES category(id) ON DELETE CASCADE,
+                FOREIGN KEY (concept_id) REFERENCES concept(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS category_relation (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                subject_id BIGINT NOT NULL,
+                predicate ENUM('broader','narrower','related') NOT NULL,
+                object_id BIGINT NOT NULL,
+                UNIQUE(subject_id, predicate, object_id),
+                FOREIGN KEY (subject_id) REFERENCES category(id) ON DELETE CASCADE,
+                FOREIGN KEY (object_id) REFERENCES category(id) ON DELETE CASCADE,
+                INDEX idx_cr_subject (subject_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS user (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                email VARCHAR(100) UNIQUE NULL,
+                password_hash VARCHAR(255) NOT NULL,
+                role ENUM('admin','editor','viewer') NOT NULL DEFAULT 'viewer',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_user_username (username),
+                INDEX idx_user_email (email)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        call(_create_fulltext, 'FULLTEXT ft_concept_term_plain (term, plain_def, mechanism, examples)'),
+        call(_seed_admin, 'INSERT INTO user admin (ADMIN_USER, ADMIN_PASS) when empty'),
+    ]),
+    (2, 'app_state_and_search_log', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS app_state (
+                name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("""
+            CREATE TABLE IF NOT EXISTS search_change_log (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                entity VARCHAR(32) NOT NULL,
+                entity_id BIGINT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_search_change_entity (entity, id),
+                INDEX idx_search_change_created (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+    ]),
+    (3, 'import_job', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS import_job (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                filename VARCHAR(255),
+                file_path VARCHAR(512) NOT NULL,
+                status ENUM('queued','running','succeeded','failed') NOT NULL DEFAULT 'queued',
+                created_by BIGINT NULL,
+                owner VARCHAR(128) NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                records_processed BIGINT NOT NULL DEFAULT 0,
+                companies_added BIGINT NOT NULL DEFAULT 0,
+                concepts_added BIGINT NOT NULL DEFAULT 0,
+                error_count BIGINT NOT NULL DEFAULT 0,
+                errors MEDIUMTEXT NULL,
+                message VARCHAR(512) NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP NULL,
+                finished_at TIMESTAMP NULL,
+                heartbeat_at TIMESTAMP NULL,
+                INDEX idx_import_job_status (status)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+    ]),
+    (4, 'token_revocation', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS token_revocation (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                revoked_at BIGINT NOT NULL,
+                INDEX idx_token_revocation_at (revoked_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+    ]),
+    (5, 'concept_image_variants', [
+        add_column('concept', 'image_variants', 'TEXT NULL AFTER image_path'),
+    ]),
+    # 按概念查其额外分类（详情、删除、导出）；按最近使用排序
+    (6, 'concept_lookup_indexes', [
+        add_index('category_concept', 'idx_catc_concept', ['concept_id']),
+        add_index('concept', 'idx_concept_last_used', ['last_used']),
+    ]),
+    # 运行时设置（如常驻采样器开关）与 app_state 的版本号分开存放：恢复快照时不覆盖、不递增
+    (7, 'app_setting', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS app_setting (
+                name VARCHAR(64) PRIMARY KEY,
+                value VARCHAR(255) NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """),
+        sql("DELETE FROM app_state WHERE name = 'profiling_sampler'"),
+    ]),
+    # 吊销时间改为毫秒，与令牌中精确到毫秒的签发时间比较
+    (8, 'token_revocation_ms', [
+        sql("UPDATE token_revocation SET revoked_at = revoked_at * 1000 WHERE revoked_at < 100000000000"),
+    ]),
+]
+
+
+def checksum(steps):
+    return hashlib.sha256('\n'.join(description for description, _ in steps).encode('utf-8')).hexdigest()
+
+
+def _matches(version, steps, recorded):
+    return recorded in (checksum(steps), LEGACY_CHECKSUMS.get(version))
+
+
+def _applied(cursor):
+    """已执行的迁移 {版本号: 校验和}，schema_version 表不存在时返回 None"""
+    try:
+        cursor.execute("SELECT version, checksum FROM schema_version")
+    except pymysql.err.ProgrammingError as e:
+        if e.args[0] == ER_NO_SUCH_TABLE:
+            return None
+        raise
+    return dict(cursor.fetchall())
+
+
+def _verify(applied, migrations):
+    """已执行的迁移须与代码一致，返回未执行的迁移"""
+    known = {version: (name, steps) for version, name, steps in migrations}
+    for version, recorded in applied.items():
+        if version not in known:
+            raise MigrationError(f"数据库中的迁移 {version} 在代码中不存在（代码版本比数据库旧？）")
+        name, steps = known[version]
+        if not _matches(version, steps, recorded):
+            raise MigrationError(f"迁移 {version} {name} 在执行后被修改（校验和不一致）")
+    return [m for m in migrations if m[0] not in applied]
+
+
+def migrate(conn, config, migrations=MIGRATIONS, lock_timeout=300):
+    """执行未执行的迁移，返回本次执行的版本号列表
+
+    config 提供迁移步骤需要的配置（如默认管理员账户）。
+    """
+    cursor = conn.cursor()
+    try:
+        # 快速路径：一条查询确认已是最新
+        applied = _applied(cursor)
+        conn.commit()
+        if applied is not None and not _verify(applied, migrations):
+            return []
+
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, lock_timeout))
+        if cursor.fetchone()[0] != 1:
+            raise MigrationError('等待数据库迁移锁超时')
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    name VARCHAR(128) NOT NULL,
+                    checksum CHAR(64) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    duration_ms INT NOT NULL DEFAULT 0
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            # 持锁后重新读取：等待期间其他进程可能已经执行完
+            pending = _verify(_applied(cursor) or {}, migrations)
+            done = []
+            for version, name, steps in sorted(pending):
+                start = time.monotonic()
+                logger.info(f"执行数据库迁移 {version} {name}")
+                for _, run in steps:
+                    run(cursor, config)
+                duration_ms = int((time.monotonic() - start) * 1000)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+                    (version, name, checksum(steps), duration_ms)
+                )
+                conn.commit()
+                logger.info(f"数据库迁移 {version} {name} 完成，耗时 {duration_ms}ms")
+                done.append(version)
+            return done
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    finally:
+        cursor.close()
+
+
+def status(conn, migrations=MIGRATIONS):
+    """各迁移的执行情况 [{version, name, applied_at, duration_ms, state}]"""
+    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    try:
+        try:
+            cursor.execute("SELECT version, checksum, applied_at, duration_ms FROM schema_version")
+            rows = {row['version']: row for row in cursor.fetchall()}
+        except pymysql.err.ProgrammingError as e:
+            if e.args[0] != ER_NO_SUCH_TABLE:
+                raise
+            rows = {}
+        conn.commit()
+    finally:
+        cursor.close()
+
+    result = []
+    for version, name, steps in migrations:
+        row = rows.get(version)
+        if row is None:
+            state = 'pending'
+        elif not _matches(version, steps, row['checksum']):
+            state = 'modified'
+        else:
+            state = 'applied'
+        result.append({
+            'version': version,
+            'name': name,
+            'state': state,
+            'applied_at': row['applied_at'] if row else None,
+            'duration_ms': row['duration_ms'] if row else None,
+        })
+    return result
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+游标（keyset）分页
+游标记录上一页边界行的排序键，下一页直接用 WHERE (k1, k2, ...) > (...) 在索引上定位，
+不需要 OFFSET 扫描并丢弃前面的行，插入新数据时翻页结果也不会错位。
+"""
+
+import json
+import base64
+import bisect
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """无法解析的分页游标"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.strftime('%Y-%m-%d %H:%M:%S.%f')}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.strptime(value['dt'], '%Y-%m-%d %H:%M:%S.%f')
+    return value
+
+
+def encode_cursor(values, direction='next'):
+    """排序键编码为不透明的游标字符串"""
+    payload = {'d': direction, 'k': [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _check_type(value, expected):
+    # bool 是 int 的子类，不能当作 ID
+    return isinstance(value, expected) and not (isinstance(value, bool) and bool not in expected)
+
+
+def decode_cursor(cursor, key_types):
+    """解析游标，返回 (排序键列表, 方向)
+
+    key_types 为每个排序键允许的类型（元组，可以包含 type(None)），类型不符的游标视为无效。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        values = [_decode_value(v) for v in payload['k']]
+        direction = payload['d']
+    except Exception:
+        raise InvalidCursor('无效的分页游标')
+    if direction not in ('next', 'prev') or len(values) != len(key_types):
+        raise InvalidCursor('无效的分页游标')
+    if not all(_check_type(value, expected) for value, expected in zip(values, key_types)):
+        raise InvalidCursor('无效的分页游标')
+    return values, direction
+
+
+def keyset_condition(keys, values, reverse=False):
+    """生成"排在游标之后"的条件
+
+    keys 为 [(列表达式, 'ASC' / 'DESC'), ...]，reverse=True 时取"排在游标之前"。
+    值为 None 的键只参与相等比较（IS NULL），不单独生成"之后"的条件：NULL 行的先后
+    由前面的 (列 IS NULL) 键区分（如 last_used IS NULL 分组内的行）。
+    返回 (SQL 片段, 参数列表)。
+    """
+    pairs = list(zip(keys, values))
+
+    clauses = []
+    params = []
+    for i, ((column, direction), value) in enumerate(pairs):
+        if value is None:
+            continue
+        ascending = (direction == 'ASC') != reverse
+        parts = []
+        for (prev_column, _), prev_value in pairs[:i]:
+            if prev_value is None:
+                parts.append(f"{prev_column} IS NULL")
+            else:
+                parts.append(f"{prev_column} = %s")
+                params.append(prev_value)
+        parts.append(f"{column} {'>' if ascending else '<'} %s")
+        params.append(value)
+        clauses.append('(' + ' AND '.join(parts) + ')')
+
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def order_clause(keys, reverse=False):
+    """生成 ORDER BY 子句，reverse=True 时整体反向"""
+    parts = []
+    for column, direction in keys:
+        if reverse:
+            direction = 'DESC' if direction == 'ASC' else 'ASC'
+        parts.append(f"{column} {direction}")
+    return 'ORDER BY ' + ', '.join(parts)
+
+
+def fetch_keyset_page(cursor, select_sql, conditions, params, sort, page_size, cursor_token=None):
+    """按游标取一页
+
+    sort 为 (排序键列表, 取行排序键值的函数, 各排序键允许的类型, 内存排序键函数（此处不用）)。
+    多取一行判断前后是否还有数据。
+    返回 (rows, next_cursor, prev_cursor)。
+    """
+    keys, key_values, key_types, _ = sort
+    conditions = list(conditions)
+    params = list(params)
+    direction = 'next'
+
+    if cursor_token:
+        values, direction = decode_cursor(cursor_token, key_types)
+        condition, condition_params = keyset_condition(keys, values, reverse=direction == 'prev')
+        conditions.append(condition)
+        params.extend(condition_params)
+
+    where_clause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    cursor.execute(
+        f"{select_sql} {where_clause} {order_clause(keys, reverse=direction == 'prev')} LIMIT %s",
+        params + [page_size + 1]
+    )
+    rows = list(cursor.fetchall())
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if direction == 'prev':
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, bool(cursor_token)
+
+    next_cursor = encode_cursor(key_values(rows[-1]), 'next') if rows and has_next else None
+    prev_cursor = encode_cursor(key_values(rows[0]), 'prev') if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def _fetch_by_ids(cursor, select_sql, id_column, ids):
+    """按主键取行，保持 ids 的顺序（已删除的行跳过）"""
+    if not ids:
+        return []
+    placeholders = ','.join(['%s'] * len(ids))
+    cursor.execute(f"{select_sql} WHERE {id_column} IN ({placeholders})", ids)
+    by_id = {row['id']: row for row in cursor.fetchall()}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+def fetch_ranked_page(cursor, select_sql, id_column, ranked_ids, page, page_size):
+    """按给定的 ID 顺序（如搜索得分）取第 page 页
+
+    排序在内存中完成，数据库只按主键取当前页的行。返回 (rows, has_more)。
+    """
+    offset = (page - 1) * page_size
+    rows = _fetch_by_ids(cursor, select_sql, id_column, ranked_ids[offset:offset + page_size])
+    return rows, len(ranked_ids) > offset + page_size
+
+
+def fetch_sorted_page(cursor, select_sql, id_column, sort_rows, sort, page_size, cursor_token=None):
+    """在内存中已排好序的行（如搜索命中）上按游标取一页
+
+    sort_rows 为按 sort 的内存排序键排好序的排序字段（含 id），sort 为
+    (排序键列表, 取行排序键值的函数, 各排序键允许的类型, 排序键值 -> 内存排序键的函数)。
+    游标与 fetch_keyset_page 的格式相同。返回 (rows, next_cursor, prev_cursor)。
+    """
+    _, key_values, key_types, order_key = sort
+    values = [key_values(row) for row in sort_rows]
+    start, end = 0, min(page_size, len(values))
+    direction = 'next'
+
+    if cursor_token:
+        boundary, direction = decode_cursor(cursor_token, key_types)
+        positions = [order_key(row_values) for row_values in values]
+        if direction == 'prev':
+            end = bisect.bisect_left(positions, order_key(boundary))
+            start = max(end - page_size, 0)
+        else:
+            start = bisect.bisect_right(positions, order_key(boundary))
+            end = min(start + page_size, len(values))
+
+    page = sort_rows[start:end]
+    rows = _fetch_by_ids(cursor, select_sql, id_column, [row['id'] for row in page])
+    has_next = end < len(values)
+    has_prev = start > 0
+
+    next_cursor = encode_cursor(values[end - 1], 'next') if page and has_next else None
+    prev_cursor = encode_cursor(values[start], 'prev') if page and has_prev else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+密码哈希
+PBKDF2 计算放到独立的进程池中执行，请求线程只等待结果；排队数超过上限时立即拒绝，
+登录高峰不会占满所有请求线程。另有按用户名、IP 的登录失败限流。
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """密码哈希队列已满或等待超时"""
+
+
+class PasswordHasher:
+    """有界的密码哈希进程池
+
+    - workers: 进程数
+    - max_pending: 同时排队和执行的最大任务数，超过时抛出 HasherBusy
+    - timeout: 等待单个任务的秒数
+    - method: 新哈希使用的算法参数（werkzeug 格式，如 pbkdf2:sha256:600000）
+    """
+
+    def __init__(self, workers=2, max_pending=32, timeout=10.0, method='pbkdf2:sha256:600000'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.method = method
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._method_prefix = None  # 按 method 生成的哈希的参数部分，首次需要时确定
+        self._lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0}
+
+    def _get_executor(self):
+        # 多进程部署时每个进程（fork 之后）各自创建进程池
+        if self._executor is None or self._pid != os.getpid():
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, stat, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise HasherBusy('密码校验排队已满')
+            self._pending += 1
+            executor = self._get_executor()
+
+        start = time.monotonic()
+        future = None
+        try:
+            future = executor.submit(fn, *args)
+            # 超时后任务仍在工作进程中执行，名额在任务真正结束时才释放
+            future.add_done_callback(self._release)
+            result = future.result(timeout=self.timeout)
+            with self._lock:
+                self._stats[stat] += 1
+            return result
+        except FutureTimeout:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HasherBusy('密码校验超时')
+        except BrokenProcessPool:
+            # 工作进程异常退出，下次调用时重建
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            if future is None:
+                self._release(None)
+            wait_ms = (time.monotonic() - start) * 1000
+            with self._lock:
+                self._stats['wait_ms_total'] += wait_ms
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        """生成密码哈希"""
+        pwhash = self._run('hashed', generate_password_hash, password, self.method)
+        self._method_prefix = pwhash.split('$', 1)[0]
+        return pwhash
+
+    def verify(self, pwhash, password):
+        """校验密码"""
+        return self._run('verified', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """哈希参数与当前配置不同（登录成功后应重新生成）
+
+        method 可以是 scrypt、pbkdf2 这样的简写，werkzeug 写入哈希的是补全后的参数
+        （如 scrypt:32768:8:1），因此按当前配置实际生成一次哈希后比较前缀。
+        """
+        if self._method_prefix is None:
+            try:
+                self.hash('')
+            except Exception as e:
+                # 繁忙或出错时不重新生成，下次登录再判断
+                logger.warning(f"确定密码哈希参数失败: {e}")
+                return False
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'pending': self._pending, 'workers': self.workers,
+                    'max_pending': self.max_pending}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoginThrottle:
+    """登录失败限流（进程内）
+
+    window 秒内同一用户名失败 max_user 次、或同一 IP 失败 max_ip 次后拒绝登录，
+    直到窗口结束；登录成功清除该用户名的计数。
+    """
+
+    def __init__(self, max_user=5, max_ip=20, window=300, max_entries=10000):
+        self.max_user = max_user
+        self.max_ip = max_ip
+        self.window = window
+        self._failures = LRUCache(max_entries=max_entries, ttl=window)
+        self._lock = threading.Lock()
+
+    def _keys(self, username, ip):
+        return (('user', (username or '').casefold()), self.max_user), (('ip', ip), self.max_ip)
+
+    def retry_after(self, username, ip):
+        """被限流时返回需等待的秒数，否则返回 0"""
+        now = time.time()
+        wait = 0
+        for key, limit in self._keys(username, ip):
+            entry = self._failures.get(key)
+            if entry and entry[0] >= limit:
+                wait = max(wait, int(entry[1] + self.window - now) + 1)
+        return wait
+
+    def failure(self, username, ip):
+        now = time.time()
+        with self._lock:
+            for key, _ in self._keys(username, ip):
+                count, started_at = self._failures.get(key) or (0, now)
+                self._failures.set(key, (count + 1, started_at), ttl=started_at + self.window - now)
+
+    def success(self, username):
+        self._failures.pop(('user', (username or '').casefold()))
+
+    def stats(self):
+        return self._failures.stats()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求分析
+- RequestProfiler：分析单个请求。cprofile 模式用 cProfile 记录每个函数的调用次数和耗时，结果为
+  pstats 文件（python -m pstats、snakeviz 打开）；sample 模式由另一个线程按固定间隔采集处理请求的
+  线程的调用栈，结果为折叠栈文本（flamegraph.pl、speedscope 可直接读取）。
+- StackSampler：常驻的低开销采样器，只采集正在处理请求的线程，栈底为路由。开关状态保存在 app_setting
+  表中，各进程定期读取；多进程部署时各进程定期把计数写入 directory/stacks-<pid>.json，下载时汇总。
+
+采样看到的是线程当前的 Python 调用栈：等待数据库时停在 PyMySQL 读取套接字的位置，SQL 耗时也在栈中。
+采样线程需要拿到 GIL 才能运行，CPU 密集的代码实际采样间隔不小于 sys.getswitchinterval()（默认 5ms）。
+gevent worker 中所有协程在同一个线程里，采样结果没有意义。
+"""
+
+import os
+import sys
+import json
+import time
+import marshal
+import cProfile
+import logging
+import threading
+from collections import Counter
+
+from cache import get_version
+
+logger = logging.getLogger(__name__)
+
+# 常驻采样器的开关：app_setting 中的采样间隔毫秒数（0 或不存在为关闭）
+SAMPLER_STATE = 'profiling_sampler'
+# app_state 中采样计数的轮次（清空时递增）
+SAMPLER_EPOCH = 'profiling_sampler_epoch'
+
+# 超过最多调用栈数后新出现的栈计入该项
+OTHER_STACK = '[其他]'
+
+
+class ProfilerBusy(Exception):
+    """本进程已有请求在用 cProfile 分析"""
+
+
+_frame_labels = {}
+
+
+def _frame_label(code):
+    label = _frame_labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        _frame_labels[code] = label
+    return label
+
+
+def collapse(frame, root=None, stop_at=None):
+    """调用栈的折叠形式：从栈底到栈顶以 ; 连接，stop_at（代码对象）以下的帧不计入"""
+    names = []
+    while frame is not None:
+        names.append(_frame_label(frame.f_code))
+        if frame.f_code is stop_at:
+            break
+        frame = frame.f_back
+    if root:
+        names.append(root)
+    names.reverse()
+    return ';'.join(names)
+
+
+def format_stacks(stacks):
+    """折叠栈文本，每行“调用栈 次数”"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def set_sampler_state(cursor, interval_ms):
+    """打开（interval_ms > 0）或关闭常驻采样器（在事务中调用，提交后各进程陆续生效）"""
+    cursor.execute("""
+        INSERT INTO app_setting (name, value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE value = VALUES(value)
+    """, (SAMPLER_STATE, str(interval_ms)))
+
+
+def get_sampler_state(cursor):
+    """常驻采样器的采样间隔毫秒数，0 为关闭"""
+    cursor.execute("SELECT value FROM app_setting WHERE name = %s", (SAMPLER_STATE,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    value = row['value'] if isinstance(row, dict) else row[0]
+    return int(value) if str(value).isdigit() else 0
+
+
+class StackSampler:
+    """按固定间隔采集已登记线程的调用栈，按折叠栈计数
+
+    - interval_ms: 采样间隔毫秒数
+    - max_stacks: 最多保存的不同调用栈数
+    - directory: 多进程汇总用的目录，为空时只有本进程的计数
+    - flush_interval: 写入 directory 的间隔秒数
+    - sync_interval: 读取开关状态的间隔秒数
+    - stop_at: 调用栈截止的代码对象（如 Flask.wsgi_app），以下的服务器框架帧不计入
+    """
+
+    def __init__(self, interval_ms=20, max_stacks=10000, directory='', flush_interval=5,
+                 sync_interval=10, stop_at=None):
+        self.interval = interval_ms / 1000
+        self.max_stacks = max_stacks
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self.stop_at = stop_at
+        self.enabled = False
+        self.epoch = 0
+        self._threads = {}          # 线程 ID -> 栈底标签（路由）
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def after_fork(self):
+        """子进程中丢弃父进程的计数和线程，开关状态在下一次读取数据库时恢复"""
+        self.enabled = False
+        self._threads = {}
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # 登记线程
+
+    def add_thread(self, label, ident=None):
+        self._threads[ident or threading.get_ident()] = label
+
+    def remove_thread(self, ident=None):
+        self._threads.pop(ident or threading.get_ident(), None)
+
+    # 开关
+
+    def start(self, interval_ms=None):
+        if interval_ms:
+            self.interval = interval_ms / 1000
+        self.enabled = True
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(self._stop,),
+                                        name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.enabled = False
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+
+    def _loop(self, stop):
+        flushed_at = time.monotonic()
+        while not stop.wait(self.interval):
+            self.sample()
+            if self.directory and time.monotonic() - flushed_at >= self.flush_interval:
+                flushed_at = time.monotonic()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("写入调用栈文件失败")
+
+    def sample(self):
+        frames = sys._current_frames()
+        stacks = []
+        for ident, label in list(self._threads.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                stacks.append(collapse(frame, label, self.stop_at))
+        del frames
+        if not stacks:
+            return
+        with self._lock:
+            for stack in stacks:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = OTHER_STACK
+                self._stacks[stack] += 1
+            self._samples += len(stacks)
+
+    def reset(self):
+        with self._lock:
+            self._stacks = Counter()
+            self._samples = 0
+
+    # 各进程同步开关状态
+
+    def needs_sync(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def sync(self, cursor):
+        """读取数据库中的开关状态和计数轮次（同一时间只有一个线程读取）"""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            # 读取失败时也等到下一个间隔再重试
+            self._synced_at = time.monotonic()
+            self.configure(get_sampler_state(cursor), get_version(cursor, SAMPLER_EPOCH))
+        finally:
+            self._sync_lock.release()
+
+    def configure(self, interval_ms, epoch):
+        if epoch != self.epoch:
+            self.reset()
+            self.epoch = epoch
+        if interval_ms > 0:
+            if not self.enabled or interval_ms / 1000 != self.interval:
+                logger.info(f"常驻采样器开启，间隔 {interval_ms}ms")
+            self.start(interval_ms)
+        elif self.enabled:
+            logger.info("常驻采样器关闭")
+            self.stop()
+            self.flush()
+
+    # 结果
+
+    def stacks(self):
+        with self._lock:
+            return Counter(self._stacks)
+
+    def stats(self):
+        with self._lock:
+            samples = self._samples
+            stacks = len(self._stacks)
+        return {
+            'enabled': self.enabled,
+            'interval_ms': round(self.interval * 1000),
+            'threads': len(self._threads),
+            'samples': samples,
+            'stacks': stacks,
+            'epoch': self.epoch,
+        }
+
+    def flush(self):
+        """把本进程的计数写入 directory/stacks-<pid>.json"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"stacks-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'epoch': self.epoch, 'stacks': self.stacks()}, f)
+        os.replace(tmp, path)
+
+    def collect(self, epoch):
+        """所有进程在 epoch 轮次的计数：本进程取实时值，其他进程（包括已退出的）读文件"""
+        stacks = self.stacks() if self.epoch == epoch else Counter()
+        if not self.directory or not os.path.isdir(self.directory):
+            return stacks
+        own = f"stacks-{os.getpid()}.json"
+        for filename in os.listdir(self.directory):
+            if not filename.startswith('stacks-') or not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('epoch') == epoch:
+                stacks.update(data['stacks'])
+        return stacks
+
+
+class RequestProfiler:
+    """分析当前线程处理的一个请求
+
+    - mode: cprofile（函数调用次数和耗时）或 sample（调用栈采样）
+    - label: 采样结果的栈底标签（路由）
+    - interval_ms: sample 模式的采样间隔毫秒数
+    - stop_at: 同 StackSampler
+    """
+
+    MODES = ('cprofile', 'sample')
+
+    # Python 3.12 起同一进程同一时间只能有一个 cProfile
+    _cprofile_lock = threading.Lock()
+
+    def __init__(self, mode, label=None, interval_ms=1, stop_at=None):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的分析模式: {mode}")
+        self.mode = mode
+        self.label = label
+        self.interval_ms = interval_ms
+        self.stop_at = stop_at
+        self._profile = None
+        self._sampler = None
+        self._running = False
+
+    def start(self):
+        if self.mode == 'cprofile':
+            if not self._cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy()
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:
+                # 其他分析工具（如 coverage）正在运行
+                self._cprofile_lock.release()
+                raise ProfilerBusy()
+        else:
+            self._sampler = StackSampler(self.interval_ms, stop_at=self.stop_at)
+            self._sampler.add_thread(self.label)
+            self._sampler.start()
+        self._running = True
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        if self._profile is not None:
+            self._profile.disable()
+            self._cprofile_lock.release()
+        else:
+            self._sampler.stop()
+
+    def result(self):
+        """(内容, MIME 类型, 扩展名)"""
+        self.stop()
+        if self._profile is not None:
+            # 与 pstats.Stats.dump_stats 写出的格式相同
+            self._profile.create_stats()
+            return marshal.dumps(self._profile.stats), 'application/octet-stream', 'prof'
+        return format_stacks(self._sampler.stacks()).encode('utf-8'), 'text/plain', 'folded'
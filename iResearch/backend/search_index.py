@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存倒排索引搜索
+中日韩文字按单字 + 相邻二字切分，其他文字按词切分（查询时支持前缀匹配），
+按 BM25F 打分。索引在进程内构建，写操作在 search_change_log 表中登记变更的
+记录 ID，查询前读取新增的登记并增量更新，多个进程因此能看到彼此的写入。
+"""
+
+import re
+import math
+import time
+import heapq
+import bisect
+import logging
+import threading
+import unicodedata
+
+import pymysql
+
+from cache import get_version
+
+logger = logging.getLogger(__name__)
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[^\W_{_CJK}]+')
+_CJK_RE = re.compile(rf'[{_CJK}]')
+
+# 数据被整体替换（如恢复快照）时递增，各进程据此全量重建索引
+REBUILD_VERSION = 'search_rebuild'
+
+
+def normalize(text):
+    """全角转半角并统一大小写"""
+    return unicodedata.normalize('NFKC', text or '').casefold()
+
+
+def _runs(text):
+    for match in _TOKEN_RE.finditer(normalize(text)):
+        run = match.group()
+        yield run, bool(_CJK_RE.match(run))
+
+
+def tokenize(text):
+    """索引切分：中日韩文字取单字和二字组，其他文字取整词"""
+    tokens = []
+    for run, cjk in _runs(text):
+        if cjk:
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def query_units(text):
+    """查询切分，返回 [(词, 是否前缀匹配), ...]
+
+    中日韩文字取二字组（单字时取单字），全部命中才算匹配，效果接近子串搜索；
+    其他文字按前缀匹配。
+    """
+    units = []
+    for run, cjk in _runs(text):
+        if not cjk:
+            units.append((run, True))
+        elif len(run) == 1:
+            units.append((run, False))
+        else:
+            units.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+    # 去重并保持顺序
+    return list(dict.fromkeys(units))
+
+
+class SearchResult:
+    """一次搜索的全部匹配
+
+    scores 为 {记录 ID: 得分}；rows 为 {记录 ID: 排序字段}（索引的 sort_fields 加上 id），
+    用于不按相关度排序时在内存中排序
+    """
+
+    __slots__ = ('scores', 'rows')
+
+    def __init__(self, scores=None, rows=None):
+        self.scores = scores or {}
+        self.rows = rows or {}
+
+    def __len__(self):
+        return len(self.scores)
+
+    def ids(self):
+        """全部匹配的记录 ID（无序）"""
+        return list(self.scores)
+
+    def ranked(self, limit=None):
+        """按得分从高到低排列的记录 ID，limit 为空时返回全部"""
+        items = self.scores.items()
+        if limit and len(self.scores) > limit:
+            items = heapq.nlargest(limit, items, key=lambda item: (item[1], -item[0]))
+        else:
+            items = sorted(items, key=lambda item: (-item[1], item[0]))
+        return [doc_id for doc_id, _ in items]
+
+    def sorted_rows(self, key):
+        """按 key(排序字段) 排列的全部匹配的排序字段"""
+        return sorted(self.rows.values(), key=key)
+
+
+class SearchIndex:
+    """BM25F 倒排索引
+
+    fields 为 [(字段名, 权重), ...]，第一个字段视为标题：与查询完全相同或以查询
+    开头的记录额外加分。每条倒排记录在写入时算好词频饱和后的得分（查询时只需
+    乘以 idf），字段平均长度取 avg_lengths，未指定时取写入时的当前平均值。
+    sort_fields 为另外保存的排序字段（如名称、最近使用时间），随搜索结果返回。
+    """
+
+    def __init__(self, fields, k1=1.2, b=0.75, avg_lengths=None, sort_fields=()):
+        self.fields = [name for name, _ in fields]
+        self.weights = [weight for _, weight in fields]
+        self.k1 = k1
+        self.b = b
+        self.avg_lengths = avg_lengths
+        self.sort_fields = tuple(sort_fields)
+        self._postings = {}         # 词 -> {记录 ID: 得分}
+        self._doc_terms = {}        # 记录 ID -> 词列表（删除时使用）
+        self._lengths = {}          # 记录 ID -> 各字段长度
+        self._total_lengths = [0] * len(self.fields)
+        self._titles = {}           # 记录 ID -> 规范化后的标题
+        self._sort_rows = {}        # 记录 ID -> 排序字段
+        self._words = []            # 非中日韩词的有序词表，用于前缀匹配
+        self._words_dirty = False
+        # 得分取三位小数后共用同一对象，节省内存
+        self._score_pool = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def average_lengths(self):
+        """各字段的平均长度（按词数）"""
+        count = len(self._doc_terms) or 1
+        return [max(total / count, 1) for total in self._total_lengths]
+
+    def add(self, doc_id, doc):
+        """添加或替换一条记录，doc 为 {字段名: 文本}"""
+        field_tokens = [tokenize(doc.get(name)) for name in self.fields]
+        frequencies = {}
+        for i, tokens in enumerate(field_tokens):
+            for token in tokens:
+                tf = frequencies.get(token)
+                if tf is None:
+                    tf = frequencies[token] = [0] * len(self.fields)
+                tf[i] += 1
+        lengths = tuple(len(tokens) for tokens in field_tokens)
+
+        with self._lock:
+            self._remove(doc_id)
+            if self.avg_lengths:
+                avg_lengths = self.avg_lengths
+            elif self._doc_terms:
+                avg_lengths = self.average_lengths()
+            else:
+                avg_lengths = [max(length, 1) for length in lengths]
+            norms = [1 - self.b + self.b * length / avg
+                     for length, avg in zip(lengths, avg_lengths)]
+
+            for token, tf in frequencies.items():
+                weighted = sum(self.weights[i] * count / norms[i]
+                               for i, count in enumerate(tf) if count)
+                score = round(weighted * (self.k1 + 1) / (weighted + self.k1), 3)
+                score = self._score_pool.setdefault(score, score)
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    if not _CJK_RE.match(token):
+                        self._words_dirty = True
+                postings[doc_id] = score
+            self._doc_terms[doc_id] = list(frequencies)
+            self._lengths[doc_id] = lengths
+            for i, length in enumerate(lengths):
+                self._total_lengths[i] += length
+            self._titles[doc_id] = normalize(doc.get(self.fields[0]))
+            if self.sort_fields:
+                sort_row = {name: doc.get(name) for name in self.sort_fields}
+                sort_row['id'] = doc_id
+                self._sort_rows[doc_id] = sort_row
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            postings = self._postings[token]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[token]
+                if not _CJK_RE.match(token):
+                    self._words_dirty = True
+        for i, length in enumerate(self._lengths.pop(doc_id)):
+            self._total_lengths[i] -= length
+        self._titles.pop(doc_id, None)
+        self._sort_rows.pop(doc_id, None)
+
+    def prepare(self):
+        """构建完成后、投入使用前调用，预先整理前缀匹配用的词表"""
+        with self._lock:
+            if self._words_dirty:
+                self._words = sorted(token for token in self._postings if not _CJK_RE.match(token))
+                self._words_dirty = False
+
+    def _expand(self, word):
+        """以 word 为前缀的全部词"""
+        self.prepare()
+        start = bisect.bisect_left(self._words, word)
+        end = bisect.bisect_left(self._words, word[:-1] + chr(ord(word[-1]) + 1), start)
+        return self._words[start:end]
+
+    def _idf(self, doc_freq):
+        doc_count = len(self._doc_terms)
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query):
+        """返回全部匹配的 SearchResult"""
+        units = query_units(query)
+        if not units:
+            return SearchResult()
+
+        with self._lock:
+            # 每个查询词对应 (倒排记录, idf)；前缀展开为多个词时合并为一个，取最高分
+            unit_postings = []
+            for text, prefix in units:
+                if prefix:
+                    tokens = self._expand(text)
+                else:
+                    tokens = [text] if text in self._postings else []
+                if not tokens:
+                    return SearchResult()
+                if len(tokens) == 1 and tokens[0] == text:
+                    postings = self._postings[text]
+                    unit_postings.append((postings, self._idf(len(postings))))
+                    continue
+                merged = {}
+                for token in tokens:
+                    postings = self._postings[token]
+                    # 前缀展开出的词权重略低
+                    idf = self._idf(len(postings)) * (1 if token == text else 0.8)
+                    for doc_id, score in postings.items():
+                        score *= idf
+                        if score > merged.get(doc_id, 0):
+                            merged[doc_id] = score
+                unit_postings.append((merged, 1))
+
+            # 先求交集再计分，从最短的倒排表开始
+            unit_postings.sort(key=lambda unit: len(unit[0]))
+            candidates = unit_postings[0][0].keys()
+            for postings, _ in unit_postings[1:]:
+                candidates = candidates & postings.keys()
+                if not candidates:
+                    return SearchResult()
+
+            if len(unit_postings) == 1:
+                postings, idf = unit_postings[0]
+                results = {doc_id: score * idf for doc_id, score in postings.items()}
+            else:
+                results = {doc_id: sum(postings[doc_id] * idf for postings, idf in unit_postings)
+                           for doc_id in candidates}
+
+            needle = normalize(query).strip()
+            titles = self._titles
+            for doc_id, score in results.items():
+                title = titles[doc_id]
+                if title.startswith(needle):
+                    results[doc_id] = score * (3 if title == needle else 1.5)
+
+            rows = {}
+            if self.sort_fields:
+                sort_rows = self._sort_rows
+                rows = {doc_id: sort_rows[doc_id] for doc_id in results}
+
+        return SearchResult(results, rows)
+
+
+def log_changes(cursor, entity, ids):
+    """登记变更的记录（在写操作的事务中调用）"""
+    ids = list(dict.fromkeys(ids))
+    if ids:
+        cursor.executemany(
+            "INSERT INTO search_change_log (entity, entity_id) VALUES (%s, %s)",
+            [(entity, entity_id) for entity_id in ids]
+        )
+
+
+class SearchService:
+    """一张表的搜索索引及其与数据库的同步
+
+    - select_sql: 查询 id 和各字段的 SELECT 语句（不含 WHERE），id_column 为按 ID
+      增量查询时使用的列名
+    - settle_seconds: 较新的变更登记在该时间内会被重复读取，防止晚提交的事务
+      （登记 ID 较小）被跳过；重复应用同一变更是安全的
+    - rebuild_interval: 定期全量重建的间隔（秒），同时清理过期的变更登记
+    - sort_fields: 索引另外保存、随搜索结果返回的排序字段（需包含在 select_sql 中）
+    """
+
+    def __init__(self, pool, entity, select_sql, fields,
+                 settle_seconds=10, rebuild_interval=3600, log_retention=86400, id_column='id',
+                 sort_fields=()):
+        self.pool = pool
+        self.entity = entity
+        self.name = entity
+        self.select_sql = select_sql
+        self.id_column = id_column
+        self.fields = fields
+        self.sort_fields = sort_fields
+        self.settle_seconds = settle_seconds
+        self.rebuild_interval = rebuild_interval
+        self.log_retention = log_retention
+
+        self.index = None
+        self._position = 0
+        self._generation = None
+        self._rebuilding = False
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    def start(self):
+        """后台构建索引并定期重建（可重复调用）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name=f'search-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            self._rebuilding = True
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception(f"构建 {self.name} 索引失败")
+                time.sleep(30)
+                continue
+            finally:
+                self._rebuilding = False
+            # 定期重建，或数据被整体替换时提前重建
+            self._wake.wait(self.rebuild_interval)
+
+    def rebuild(self):
+        """全量构建索引，完成后替换当前索引"""
+        start = time.monotonic()
+        index = self.new_index()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            try:
+                cursor.execute(
+                    "DELETE FROM search_change_log WHERE created_at < NOW() - INTERVAL %s SECOND",
+                    (self.log_retention,)
+                )
+                conn.commit()
+                # 先记下登记位置再读数据，构建期间的变更之后会被重新应用
+                position = self._settled_position(cursor)
+                generation = get_version(cursor, REBUILD_VERSION)
+            finally:
+                cursor.close()
+
+            # 逐行读取，不把整张表一次性读入内存
+            cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+            try:
+                cursor.execute(self.select_sql)
+                for row in cursor.fetchall_unbuffered():
+                    index.add(row['id'], row)
+            finally:
+                cursor.close()
+            conn.commit()
+        index.prepare()
+
+        with self._lock:
+            self.index = index
+            self._position = position
+            self._generation = generation
+        logger.info(f"{self.name} 索引已构建: {len(index)} 条，"
+                    f"耗时 {(time.monotonic() - start) * 1000:.0f}ms")
+
+    def new_index(self):
+        """创建空索引（子类可替换索引类型）"""
+        # 沿用上一次的字段平均长度，首次构建时取构建过程中的平均值
+        return SearchIndex(self.fields, avg_lengths=self.index.average_lengths() if self.index else None,
+                           sort_fields=self.sort_fields)
+
+    def _settled_position(self, cursor, after=0):
+        cursor.execute("""
+            SELECT COALESCE(MAX(id), %s) AS position FROM search_change_log
+            WHERE id > %s AND created_at < NOW() - INTERVAL %s SECOND
+        """, (after, after, self.settle_seconds))
+        return cursor.fetchone()['position']
+
+    def refresh(self, cursor):
+        """应用其他请求（包括其他进程）登记的变更"""
+        with self._lock:
+            index, position = self.index, self._position
+        if index is None:
+            return
+
+        if get_version(cursor, REBUILD_VERSION) != self._generation and not self._rebuilding:
+            # 数据已被整体替换：后台全量重建，完成前沿用当前索引
+            self._wake.set()
+
+        cursor.execute("""
+            SELECT id, entity_id, created_at < NOW() - INTERVAL %s SECOND AS settled
+            FROM search_change_log
+            WHERE entity = %s AND id > %s ORDER BY id
+        """, (self.settle_seconds, self.entity, position))
+        changes = cursor.fetchall()
+        if not changes:
+            return
+
+        ids = list(dict.fromkeys(row['entity_id'] for row in changes))
+        placeholders = ','.join(['%s'] * len(ids))
+        cursor.execute(f"{self.select_sql} WHERE {self.id_column} IN ({placeholders})", ids)
+        rows = {row['id']: row for row in cursor.fetchall()}
+        for entity_id in ids:
+            if entity_id in rows:
+                index.add(entity_id, rows[entity_id])
+            else:
+                index.remove(entity_id)
+
+        # 只推进到连续的已稳定登记为止
+        for row in changes:
+            if not row['settled']:
+                break
+            position = row['id']
+        with self._lock:
+            if self.index is index and position > self._position:
+                self._position = position
+
+    def search(self, cursor, query, *args):
+        """应用最新的变更后搜索（其余参数及返回值同索引的 search）；索引尚未构建完成时返回 None"""
+        if self.index is None:
+            return None
+        self.refresh(cursor)
+        return self.index.search(query, *args)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+慢查询日志
+游标的 execute / executemany 计时，按语句指纹（占位符和字面量替换为 ?、IN 列表合并后的 SQL）
+在内存中汇总次数、总耗时和最大耗时。超过阈值的语句记录日志（规范化 SQL、参数、所在路由），
+并由后台线程在另一个连接上执行 EXPLAIN FORMAT=JSON，执行计划随汇总结果保存。
+语句中任何位置出现敏感表名（用户、令牌吊销）就不记录参数、不捕获执行计划（计划中含有代入的参数值）。
+
+非缓冲游标（SSCursor）的耗时只包括执行，不包括之后逐行读取结果的时间。
+"""
+
+import re
+import time
+import queue
+import hashlib
+import logging
+import threading
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+# 可以 EXPLAIN 的语句
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE', 'WITH')
+
+MAX_PARAMS_LENGTH = 500
+# 参数可能含密码哈希、令牌等的表
+REDACT_TABLES = ('user', 'token_revocation')
+REDACTED = '[已隐藏]'
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER = re.compile(r"%(?:\(\w+\))?s")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES = re.compile(r"(VALUES\s*\(\?\+?\))(?:\s*,\s*\(\?\+?\))+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """规范化 SQL：字面量和占位符替换为 ?，IN 列表和多行 VALUES 合并，空白压缩"""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    sql = _LIST.sub('(?+)', sql)
+    sql = _VALUES.sub(r'\1', sql)
+    return sql
+
+
+def _table_pattern(tables):
+    """匹配语句中任何位置出现的这些表名（逗号连接、子查询、带库名限定的都算）
+
+    只要求表名前后不是标识符字符，宁可把同名的列也算进去多隐藏一些。
+    """
+    names = '|'.join(re.escape(table) for table in tables)
+    return re.compile(rf"(?<![\w$])`?(?:{names})`?(?![\w$])", re.IGNORECASE)
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def _format_params(args):
+    if args is None:
+        return None
+    text = repr(args)
+    if len(text) > MAX_PARAMS_LENGTH:
+        text = text[:MAX_PARAMS_LENGTH] + '…'
+    return text
+
+
+class _TimedCursorMixin:
+    """为游标类增加计时（由 SlowQueryLog.cursor_class 组合出具体的类）"""
+
+    _slow_log = None
+    _timing = False
+
+    def execute(self, query, args=None):
+        if self._timing:
+            return super().execute(query, args)
+        self._timing = True
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            self._timing = False
+            self._slow_log.record(self, query, args, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        if self._timing:
+            return super().executemany(query, args)
+        self._timing = True
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._timing = False
+            self._slow_log.record(self, query, args, time.perf_counter() - start, many=True)
+
+
+class SlowQueryLog:
+    """按语句指纹汇总的查询统计和慢查询日志
+
+    - threshold_ms: 超过该毫秒数的语句记录日志并捕获执行计划
+    - pool: 执行 EXPLAIN 用的连接池，为 None 时不捕获执行计划
+    - context: 返回当前调用位置（如路由）的函数
+    - max_fingerprints: 最多保存的指纹数，超过时淘汰总耗时最小的
+    - explain_interval: 同一指纹两次捕获执行计划的最小间隔秒数
+    - redact_tables: 涉及这些表的语句不记录参数、不捕获执行计划
+    """
+
+    def __init__(self, threshold_ms=200, pool=None, context=None, max_fingerprints=500,
+                 explain_interval=600, redact_tables=REDACT_TABLES):
+        self.threshold = threshold_ms / 1000
+        self.pool = pool
+        self.context = context
+        self.max_fingerprints = max_fingerprints
+        self.explain_interval = explain_interval
+        self._redact = _table_pattern(redact_tables) if redact_tables else None
+        self._stats = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+        self._cursor_classes = {}
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._explain_thread = None
+
+    def cursor_class(self, cls):
+        """返回带计时的 cls 子类（按游标类缓存）"""
+        timed = self._cursor_classes.get(cls)
+        if timed is None:
+            timed = type(f"Timed{cls.__name__}", (_TimedCursorMixin, cls), {'_slow_log': self})
+            self._cursor_classes[cls] = timed
+        return timed
+
+    def _normalize(self, query):
+        # 同一个模板反复执行，规范化结果按原文缓存
+        normalized = self._normalized.get(query)
+        if normalized is None:
+            normalized = normalize(query)
+            if len(self._normalized) < 10000:
+                self._normalized[query] = normalized
+        return normalized
+
+    def record(self, cursor, query, args, seconds, many=False):
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        if query.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+        normalized = self._normalize(query)
+        key = fingerprint(normalized)
+        ms = seconds * 1000
+        slow = seconds >= self.threshold
+        route = self.context() if self.context else None
+        now = time.time()
+
+        params = None
+        redact = False
+        if slow:
+            redact = self._redact is not None and self._redact.search(normalized) is not None
+            params = REDACTED if redact and args is not None else _format_params(args)
+
+        explain = False
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    self._evict()
+                entry = self._stats[key] = {
+                    'fingerprint': key, 'sql': normalized, 'count': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0, 'slow_count': 0, 'last_slow_params': None, 'last_slow_route': None,
+                    'last_slow_at': None, 'explain': None, 'explain_at': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            if slow:
+                entry['slow_count'] += 1
+                entry['last_slow_params'] = params
+                entry['last_slow_route'] = route
+                entry['last_slow_at'] = now
+                if (not many and not redact and self.pool is not None
+                        and normalized.split(' ', 1)[0].upper() in EXPLAINABLE
+                        and (entry['explain_at'] is None or now - entry['explain_at'] > self.explain_interval)):
+                    entry['explain_at'] = now
+                    explain = True
+
+        if not slow:
+            return
+        logger.warning(f"慢查询 {ms:.0f}ms [{route or '-'}] {normalized} 参数 {params}")
+        if explain:
+            try:
+                statement = cursor.mogrify(query, args)
+            except Exception:
+                return
+            self._submit_explain(key, statement)
+
+    def _evict(self):
+        victim = min(self._stats.values(), key=lambda entry: entry['total_ms'])
+        del self._stats[victim['fingerprint']]
+
+    # 执行计划
+
+    def _submit_explain(self, key, statement):
+        if self._explain_thread is None or not self._explain_thread.is_alive():
+            with self._lock:
+                if self._explain_thread is None or not self._explain_thread.is_alive():
+                    self._explain_thread = threading.Thread(target=self._explain_loop,
+                                                            name='slow-query-explain', daemon=True)
+                    self._explain_thread.start()
+        try:
+            self._explain_queue.put_nowait((key, statement))
+        except queue.Full:
+            pass
+
+    def _explain_loop(self):
+        while True:
+            key, statement = self._explain_queue.get()
+            try:
+                plan = self._explain(statement)
+            except Exception as e:
+                plan = {'error': str(e)}
+            with self._lock:
+                entry = self._stats.get(key)
+                if entry is not None:
+                    entry['explain'] = plan
+            logger.warning(f"慢查询执行计划 {key}: {plan}")
+
+    def _explain(self, statement):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"EXPLAIN FORMAT=JSON {statement}")
+                row = cursor.fetchone()
+                conn.commit()
+            except pymysql.MySQLError as e:
+                conn.rollback()
+                return {'error': str(e)}
+            finally:
+                cursor.close()
+        return row[0] if row else None
+
+    # 查询
+
+    def top(self, limit=20, order='total_ms'):
+        """按 order（total_ms / max_ms / count / slow_count）排序的前 limit 个指纹"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._stats.values()]
+        entries.sort(key=lambda entry: entry[order], reverse=True)
+        for entry in entries[:limit]:
+            entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 2) if entry['count'] else 0
+            entry['total_ms'] = round(entry['total_ms'], 2)
+            entry['max_ms'] = round(entry['max_ms'], 2)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def after_fork(self):
+        """fork 之后调用：丢弃父进程的统计，执行计划线程和队列在本进程重新创建"""
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._explain_thread = None
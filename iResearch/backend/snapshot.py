@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据快照
+整个数据集（migrations.py 中除 schema_version、app_setting 外的所有表和 static/uploads 下的文件）写入一个带版本号的
+快照文件，用于在环境之间迁移和备份恢复。
+
+快照文件是 ZIP 容器：
+- manifest.json：格式版本、各表的列名、行数和耗时
+- tables/<表名>.bin：按列存储的行组，每组 [uint32 长度][zlib 压缩数据]
+- uploads/<相对路径>：上传的文件（原样存储）
+
+行组内按列依次存放：类型（1 字节）、是否有空值（1 字节）、空值位图、
+uint32 数据长度和数据。整数、浮点数、时间用定长数组，字符串为长度数组加拼接的 UTF-8。
+
+导出和恢复都按表并行：导出时各连接在表锁下同时开启一致性快照读事务，
+恢复时关闭外键和唯一性检查，按主键顺序批量插入。
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import array
+import shutil
+import struct
+import logging
+import zipfile
+import tempfile
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+
+from cache import bump_version
+from search_index import REBUILD_VERSION
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = 'iresearch-snapshot'
+FORMAT_VERSION = 1
+EXTENSION = '.irsnap'
+
+# 快照包含的表；恢复时 app_state 不覆盖，改为递增所有版本号使各进程的缓存失效。
+# app_setting（运行时设置）属于部署环境，不导出也不恢复
+TABLES = (
+    'user', 'category', 'category_relation', 'concept', 'company',
+    'company_concept', 'category_concept', 'search_change_log', 'import_job', 'token_revocation',
+    'app_state',
+)
+MERGED_TABLES = ('app_state',)
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+MICROSECOND = timedelta(microseconds=1)
+
+_LENGTH = struct.Struct('<I')
+_COLUMN_HEADER = struct.Struct('<ccI')
+
+
+class SnapshotError(Exception):
+    """快照文件无效或与当前表结构不兼容"""
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _column_type(values):
+    """根据一组值选择编码：n 全空、i 整数、f 浮点、t 日期时间、d 日期、b 字节串、s 文本"""
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return b'n'
+    if kinds == {int}:
+        return b'i'
+    if kinds == {float}:
+        return b'f'
+    if kinds == {datetime}:
+        return b't'
+    if kinds == {date}:
+        return b'd'
+    if kinds <= {bytes, bytearray}:
+        return b'b'
+    return b's'
+
+
+def _encode_column(values):
+    kind = _column_type(values)
+    present = [value for value in values if value is not None]
+    bitmap = b''
+    if kind != b'n' and len(present) != len(values):
+        bits = bytearray((len(values) + 7) // 8)
+        for i, value in enumerate(values):
+            if value is None:
+                bits[i >> 3] |= 1 << (i & 7)
+        bitmap = bytes(bits)
+
+    if kind == b'i':
+        data = _little_endian(array.array('q', present)).tobytes()
+    elif kind == b'f':
+        data = _little_endian(array.array('d', present)).tobytes()
+    elif kind == b't':
+        data = _little_endian(array.array('q', [(value - EPOCH) // MICROSECOND for value in present])).tobytes()
+    elif kind == b'd':
+        data = _little_endian(array.array('i', [(value - EPOCH_DATE).days for value in present])).tobytes()
+    elif kind in (b'b', b's'):
+        if kind == b's':
+            present = [value if isinstance(value, str) else str(value) for value in present]
+            present = [value.encode('utf-8') for value in present]
+        lengths = _little_endian(array.array('I', [len(value) for value in present])).tobytes()
+        data = lengths + b''.join(present)
+    else:
+        data = b''
+
+    return _COLUMN_HEADER.pack(kind, b'\x01' if bitmap else b'\x00', len(data)) + bitmap + data
+
+
+def encode_group(rows, width, level=6):
+    """把一组行按列编码并压缩"""
+    parts = [_LENGTH.pack(len(rows))]
+    for i in range(width):
+        parts.append(_encode_column([row[i] for row in rows]))
+    return zlib.compress(b''.join(parts), level)
+
+
+def _decode_array(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    return _little_endian(values)
+
+
+def _decode_column(buf, offset, count):
+    kind, has_nulls, size = _COLUMN_HEADER.unpack_from(buf, offset)
+    offset += _COLUMN_HEADER.size
+    nulls = None
+    if has_nulls == b'\x01':
+        nbytes = (count + 7) // 8
+        nulls = buf[offset:offset + nbytes]
+        offset += nbytes
+    data = buf[offset:offset + size]
+    offset += size
+
+    if kind == b'n':
+        return [None] * count, offset
+    if kind == b'i':
+        present = _decode_array('q', data).tolist()
+    elif kind == b'f':
+        present = _decode_array('d', data).tolist()
+    elif kind == b't':
+        present = [EPOCH + value * MICROSECOND for value in _decode_array('q', data)]
+    elif kind == b'd':
+        present = [EPOCH_DATE + timedelta(days=value) for value in _decode_array('i', data)]
+    elif kind in (b'b', b's'):
+        n = count - (sum(bin(byte).count('1') for byte in nulls) if nulls else 0)
+        lengths = _decode_array('I', data[:n * 4])
+        present = []
+        pos = n * 4
+        for length in lengths:
+            present.append(data[pos:pos + length])
+            pos += length
+        if kind == b's':
+            present = [value.decode('utf-8') for value in present]
+    else:
+        raise SnapshotError(f'未知的列编码 {kind!r}')
+
+    if nulls is None:
+        return present, offset
+    values = []
+    it = iter(present)
+    for i in range(count):
+        values.append(None if nulls[i >> 3] & (1 << (i & 7)) else next(it))
+    return values, offset
+
+
+def decode_group(blob, width):
+    """解压一组行，返回 [(列值, ...), ...]"""
+    buf = zlib.decompress(blob)
+    count, = _LENGTH.unpack_from(buf, 0)
+    offset = _LENGTH.size
+    columns = []
+    for _ in range(width):
+        values, offset = _decode_column(buf, offset, count)
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def iter_groups(stream):
+    """逐个读出表数据中的压缩行组"""
+    while True:
+        header = stream.read(_LENGTH.size)
+        if not header:
+            return
+        if len(header) < _LENGTH.size:
+            raise SnapshotError('快照文件不完整')
+        size, = _LENGTH.unpack(header)
+        blob = stream.read(size)
+        if len(blob) < size:
+            raise SnapshotError('快照文件不完整')
+        yield blob
+
+
+def _reset_session(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SET SESSION time_zone = DEFAULT, foreign_key_checks = DEFAULT, unique_checks = DEFAULT")
+
+
+def _dump_table(conn, table, path, group_rows, level):
+    """把一张表按行组写入 path，返回该表的清单"""
+    start = time.monotonic()
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    rows = groups = 0
+    try:
+        cursor.execute(f"SELECT * FROM `{table}`")
+        columns = [column[0] for column in cursor.description]
+        with open(path, 'wb') as f:
+            batch = []
+            for row in cursor.fetchall_unbuffered():
+                batch.append(row)
+                if len(batch) >= group_rows:
+                    blob = encode_group(batch, len(columns), level)
+                    f.write(_LENGTH.pack(len(blob)) + blob)
+                    rows += len(batch)
+                    groups += 1
+                    batch = []
+            if batch:
+                blob = encode_group(batch, len(columns), level)
+                f.write(_LENGTH.pack(len(blob)) + blob)
+                rows += len(batch)
+                groups += 1
+    finally:
+        cursor.close()
+    return {
+        'columns': columns,
+        'rows': rows,
+        'groups': groups,
+        'bytes': os.path.getsize(path),
+        'ms': round((time.monotonic() - start) * 1000, 1)
+    }
+
+
+def _start_snapshots(pool, count):
+    """借出 count 个连接并让它们在同一时间点开始一致性快照读
+
+    多个连接时先用一个连接对所有表加读锁，其余连接在锁内开启事务后再解锁；
+    没有 LOCK TABLES 权限时退回单个连接。返回 [(conn, created_at), ...]。
+    """
+    def begin(conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SET SESSION time_zone = '+00:00'")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+
+    if count > 1:
+        lock_conn, lock_created_at = pool.checkout()
+        conns = []
+        try:
+            with lock_conn.cursor() as cursor:
+                cursor.execute("LOCK TABLES " + ', '.join(f"`{table}` READ" for table in TABLES))
+            try:
+                for _ in range(count):
+                    conns.append(pool.checkout())
+                    begin(conns[-1][0])
+            finally:
+                with lock_conn.cursor() as cursor:
+                    cursor.execute("UNLOCK TABLES")
+            return conns
+        except Exception as e:
+            for conn, created_at in conns:
+                pool.checkin(conn, created_at)
+            # 1044/1142：没有 LOCK TABLES 权限
+            if not isinstance(e, pymysql.err.OperationalError):
+                raise
+            logger.warning(f"无法加表锁，改为单连接导出: {e}")
+        finally:
+            pool.checkin(lock_conn, lock_created_at)
+
+    conn, created_at = pool.checkout()
+    try:
+        begin(conn)
+    except Exception:
+        pool.checkin(conn, created_at, broken=True)
+        raise
+    return [(conn, created_at)]
+
+
+def create_snapshot(pool, path, upload_dir, workers=4, group_rows=5000, level=6):
+    """写出快照文件，返回清单
+
+    各表由 workers 个连接并行导出到临时文件，同时主线程打包上传文件，最后合并为一个文件。
+    """
+    start = time.monotonic()
+    # 至少留一半连接给正常请求
+    workers = max(1, min(workers, len(TABLES), pool.max_size // 2))
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'time_zone': '+00:00',
+        'tables': {},
+        'uploads': 0
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    conns = _start_snapshots(pool, workers)
+    idle = queue.Queue()
+    for conn in conns:
+        idle.put(conn)
+    broken = set()
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp_dir:
+        def dump(table):
+            conn, created_at = idle.get()
+            try:
+                return _dump_table(conn, table, os.path.join(tmp_dir, table), group_rows, level)
+            except Exception:
+                broken.add(id(conn))
+                raise
+            finally:
+                idle.put((conn, created_at))
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(conns), thread_name_prefix='snapshot') as executor:
+                futures = {table: executor.submit(dump, table) for table in TABLES}
+                with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+                    # 上传文件多为已压缩的图片，原样存储
+                    for root, _, files in os.walk(upload_dir):
+                        for name in sorted(files):
+                            full = os.path.join(root, name)
+                            rel = os.path.relpath(full, upload_dir).replace(os.sep, '/')
+                            zf.write(full, f"uploads/{rel}")
+                            manifest['uploads'] += 1
+
+                    for table, future in futures.items():
+                        manifest['tables'][table] = future.result()
+                        zf.write(os.path.join(tmp_dir, table), f"tables/{table}.bin")
+
+                    manifest['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+                    zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            for conn, created_at in conns:
+                if id(conn) in broken:
+                    pool.checkin(conn, created_at, broken=True)
+                    continue
+                try:
+                    conn.commit()
+                    _reset_session(conn)
+                    pool.checkin(conn, created_at)
+                except Exception:
+                    pool.checkin(conn, created_at, broken=True)
+
+    logger.info(f"快照已写入 {path}: {sum(t['rows'] for t in manifest['tables'].values())} 行，"
+                f"{manifest['uploads']} 个文件，耗时 {manifest['elapsed_ms']:.0f}ms")
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with zipfile.ZipFile(path) as zf:
+            manifest = json.loads(zf.read('manifest.json'))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        raise SnapshotError('不是有效的快照文件')
+    if manifest.get('format') != FORMAT_NAME:
+        raise SnapshotError('不是有效的快照文件')
+    if manifest.get('version', 0) > FORMAT_VERSION:
+        raise SnapshotError(f"快照格式版本 {manifest['version']} 高于当前支持的版本 {FORMAT_VERSION}")
+    return manifest
+
+
+def _check_columns(cursor, manifest, tables):
+    """快照中的列必须都存在于当前表中（当前表多出的列使用默认值）"""
+    for table in tables:
+        cursor.execute(f"SHOW COLUMNS FROM `{table}`")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [column for column in manifest['tables'][table]['columns'] if column not in existing]
+        if missing:
+            raise SnapshotError(f"表 {table} 缺少快照中的列: {', '.join(missing)}")
+
+
+def _load_table(pool, path, table, columns, batch_size):
+    start = time.monotonic()
+    rows = 0
+    column_list = ', '.join(f"`{column}`" for column in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f"INSERT INTO `{table}` ({column_list}) VALUES ({placeholders})"
+
+    with pool.connection() as conn, zipfile.ZipFile(path) as zf:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET SESSION time_zone = '+00:00', foreign_key_checks = 0, unique_checks = 0")
+            with zf.open(f"tables/{table}.bin") as stream:
+                for blob in iter_groups(stream):
+                    group = decode_group(blob, len(columns))
+                    for i in range(0, len(group), batch_size):
+                        # executemany 改写为多行 INSERT
+                        cursor.executemany(sql, group[i:i + batch_size])
+                    conn.commit()
+                    rows += len(group)
+        finally:
+            try:
+                _reset_session(conn)
+            finally:
+                cursor.close()
+    return {'rows': rows, 'ms': round((time.monotonic() - start) * 1000, 1)}
+
+
+def _safe_upload_path(upload_dir, name):
+    rel = os.path.normpath(name)
+    if os.path.isabs(rel) or rel.startswith('..'):
+        raise SnapshotError(f'快照中的文件路径无效: {name}')
+    return os.path.join(upload_dir, rel)
+
+
+def _restore_uploads(zf, upload_dir):
+    count = 0
+    for info in zf.infolist():
+        if not info.filename.startswith('uploads/') or info.is_dir():
+            continue
+        target = _safe_upload_path(upload_dir, info.filename[len('uploads/'):])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.restoring"
+        with zf.open(info) as src, open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, target)
+        count += 1
+    return count
+
+
+def restore_snapshot(pool, path, upload_dir, workers=4, batch_size=1000):
+    """用快照替换当前数据，返回各表的行数和耗时
+
+    先清空所有表，再由 workers 个连接并行加载（关闭外键、唯一性检查），主线程同时还原
+    上传文件；最后递增 app_state 中的所有版本号，各进程的缓存和搜索索引随之刷新。
+    恢复不是原子的，应在维护期间进行。
+    """
+    start = time.monotonic()
+    manifest = read_manifest(path)
+    tables = [table for table in TABLES if table in manifest['tables'] and table not in MERGED_TABLES]
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            _check_columns(cursor, manifest, tables)
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            try:
+                for table in tables:
+                    cursor.execute(f"TRUNCATE TABLE `{table}`")
+            finally:
+                _reset_session(conn)
+        finally:
+            cursor.close()
+
+    result = {'tables': {}, 'uploads': 0}
+    workers = max(1, min(workers, len(tables), pool.max_size // 2))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='restore') as executor:
+        futures = {
+            table: executor.submit(_load_table, pool, path, table,
+                                   manifest['tables'][table]['columns'], batch_size)
+            for table in tables
+        }
+        with zipfile.ZipFile(path) as zf:
+            result['uploads'] = _restore_uploads(zf, upload_dir)
+        for table, future in futures.items():
+            result['tables'][table] = future.result()
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE app_state SET version = version + 1")
+            bump_version(cursor, REBUILD_VERSION)
+            conn.commit()
+        finally:
+            cursor.close()
+
+    result['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+    logger.info(f"快照已恢复 {path}: {sum(t['rows'] for t in result['tables'].values())} 行，"
+                f"{result['uploads']} 个文件，耗时 {result['elapsed_ms']:.0f}ms")
+    return result
+
+
+def list_snapshots(directory):
+    """目录中的快照文件，按修改时间倒序"""
+    if not os.path.isdir(directory):
+        return []
+    items = []
+    for name in os.listdir(directory):
+        if not name.endswith(EXTENSION):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        items.append({
+            'name': name,
+            'size': stat.st_size,
+            'modified_at': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+        })
+    items.sort(key=lambda item: item['modified_at'], reverse=True)
+    return items
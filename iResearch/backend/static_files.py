@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态文件发送
+上传文件和前端构建产物（assets/ 下）的文件名都是唯一的，内容不会变化，可以长期缓存（immutable）；
+index.html 每次向服务器确认（ETag 协商）。支持 Range 请求，可选把文件内容交给前端的
+nginx（X-Accel-Redirect）或 Apache / lighttpd（X-Sendfile）发送，应用进程只检查路径和生成响应头。
+"""
+
+import os
+import mimetypes
+from zlib import adler32
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# 文件名唯一、内容不变的文件
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# 文件名固定、内容会随发布变化的文件（每次用 ETag 确认）
+REVALIDATE = 'no-cache'
+# 其他静态文件（favicon 等）
+SHORT_LIVED = 'public, max-age=3600'
+
+OFFLOAD_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+
+
+def file_etag(path, st):
+    """与 werkzeug send_file 相同的默认 ETag（修改时间-大小-路径校验和）"""
+    check = adler32(path.encode('utf-8')) & 0xFFFFFFFF
+    return f"{st.st_mtime}-{st.st_size}-{check}"
+
+
+def send_static(root, path, cache_control, etag=None, offload='', accel_prefix='/_static/'):
+    """发送 root 下的 path（相对路径），文件不存在时抛出 NotFound
+
+    - etag: 指定的强 ETag（如内容哈希），默认按修改时间和大小生成
+    - offload: '' 由本进程发送（支持 Range 和条件请求）；'x-accel-redirect' / 'x-sendfile'
+      只返回响应头，由前端服务器发送文件内容并处理 Range
+    - accel_prefix: nginx 中对应 root 目录的 internal location
+    """
+    full = safe_join(root, path)
+    if full is None:
+        raise NotFound()
+    try:
+        st = os.stat(full)
+    except OSError:
+        raise NotFound()
+    if not os.path.isfile(full):
+        raise NotFound()
+
+    if not offload:
+        response = send_file(full, etag=etag or True, conditional=True, last_modified=st.st_mtime)
+        response.headers['Cache-Control'] = cache_control
+        response.accept_ranges = 'bytes'
+        return response
+
+    header = OFFLOAD_HEADERS[offload]
+    mimetype = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+    response = current_app.response_class(mimetype=mimetype)
+    response.set_etag(etag or file_etag(full, st))
+    response.last_modified = st.st_mtime
+    response.headers['Cache-Control'] = cache_control
+    response = response.make_conditional(request)
+    if response.status_code != 304:
+        if offload == 'x-accel-redirect':
+            response.headers[header] = accel_prefix + quote(path.replace(os.sep, '/'))
+        else:
+            response.headers[header] = os.path.abspath(full)
+    return response
+
+
+def asset_cache_control(path):
+    """前端构建产物的缓存策略：assets/ 下的文件名带内容哈希"""
+    if path.startswith('assets/'):
+        return IMMUTABLE
+    if path.endswith('.html'):
+        return REVALIDATE
+    return SHORT_LIVED
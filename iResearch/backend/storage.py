@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传文件存储
+文件按内容的 SHA-256 命名，按哈希的前两级分目录存放（ab/cd/<哈希>.<扩展名>），
+相同内容只保存一份，每个目录中的文件数保持在较小的范围。
+引用关系就是数据库中记录的路径（如 concept.image_path），不单独维护计数：
+UploadSweeper 定期统计各文件的引用数，删除没有任何记录引用的文件并报告回收的空间。
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# 上传文件相对 static 目录的前缀（数据库中记录的路径以此开头）
+URL_PREFIX = 'uploads/'
+
+TEMP_SUFFIX = '.part'
+
+CONTENT_PATH = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def shard_path(digest, ext):
+    """内容哈希 -> 相对上传目录的路径"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def is_content_addressed(path):
+    """路径（相对 static 或上传目录）是否为按内容命名的文件"""
+    if path.startswith(URL_PREFIX):
+        path = path[len(URL_PREFIX):]
+    return bool(CONTENT_PATH.match(path))
+
+
+def temp_path(root):
+    """在上传目录中生成临时文件路径（与最终位置在同一文件系统，可原子改名）"""
+    return os.path.join(root, f".{os.urandom(8).hex()}{TEMP_SUFFIX}")
+
+
+def commit_file(tmp, root, rel):
+    """把写好的临时文件放到 rel 处，返回是否与已有文件重复
+
+    已有相同内容时丢弃临时文件，并更新已有文件的修改时间，
+    防止清理线程把刚被重新引用的文件当作过期的孤立文件删除。
+    """
+    target = os.path.join(root, rel)
+    if os.path.exists(target):
+        os.remove(tmp)
+        os.utime(target)
+        return True
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(tmp, target)
+    return False
+
+
+def touch(path):
+    """更新文件的修改时间（文件被重新引用时调用）"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadSweeper:
+    """定期删除没有被引用的上传文件
+
+    - references(cursor): 产出被引用文件路径（相对 static，如 uploads/ab/cd/x.png）的函数，
+      同一路径被几条记录引用就产出几次
+    - interval: 自动清理的间隔秒数，0 表示只手动清理
+    - grace: 修改时间在该秒数内的文件不删除（上传已写盘、数据库尚未提交的文件）
+
+    所有进程共用一个 MySQL GET_LOCK，同一时间只有一个进程在清理。
+    """
+
+    LOCK_NAME = 'iresearch_upload_gc'
+
+    def __init__(self, pool, root, references, interval=3600, grace=3600):
+        self.pool = pool
+        self.root = root
+        self.references = references
+        self.interval = interval
+        self.grace = grace
+        self.last_report = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台清理线程（可重复调用，fork 之后按进程重新启动）"""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='upload-gc', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("清理上传文件失败")
+
+    def sweep(self, dry_run=False):
+        """统计引用并删除孤立文件，返回报告；其他进程正在清理时返回 None"""
+        start = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+                if cursor.fetchone()[0] != 1:
+                    return None
+                try:
+                    # 先读引用再列文件：之后才被引用的文件修改时间一定晚于 start - grace
+                    refs = Counter(
+                        path[len(URL_PREFIX):] if path.startswith(URL_PREFIX) else path
+                        for path in self.references(cursor)
+                    )
+                    conn.commit()
+                    report = self._sweep_files(refs, start - self.grace, dry_run)
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+            finally:
+                cursor.close()
+
+        report['elapsed_ms'] = round((time.time() - start) * 1000, 1)
+        self.last_report = report
+        logger.info(
+            f"上传文件清理{'（试运行）' if dry_run else ''}: {report['files']} 个文件，"
+            f"删除 {report['orphans']} 个，回收 {report['reclaimed_bytes'] / 1048576:.1f}MB，"
+            f"去重节省 {report['dedup_saved_bytes'] / 1048576:.1f}MB，耗时 {report['elapsed_ms']:.0f}ms"
+        )
+        return report
+
+    def _sweep_files(self, refs, cutoff, dry_run):
+        report = {
+            'dry_run': dry_run,
+            'files': 0,
+            'bytes': 0,
+            'referenced': 0,
+            'shared': 0,
+            'dedup_saved_bytes': 0,
+            'recent': 0,
+            'orphans': 0,
+            'reclaimed_bytes': 0,
+            'missing': 0,
+        }
+        seen = set()
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                rel = os.path.relpath(full, self.root).replace(os.sep, '/')
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                report['files'] += 1
+                report['bytes'] += st.st_size
+
+                count = refs.get(rel, 0)
+                if count:
+                    seen.add(rel)
+                    report['referenced'] += 1
+                    if count > 1:
+                        report['shared'] += 1
+                        report['dedup_saved_bytes'] += st.st_size * (count - 1)
+                elif st.st_mtime > cutoff:
+                    report['recent'] += 1
+                else:
+                    if not dry_run:
+                        try:
+                            os.remove(full)
+                        except FileNotFoundError:
+                            continue
+                    report['orphans'] += 1
+                    report['reclaimed_bytes'] += st.st_size
+
+        report['missing'] = len(set(refs) - seen)
+        return report
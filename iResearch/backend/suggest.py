@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输入联想
+概念术语、公司名称按规范化形式（安装 pypinyin 时另加全拼和拼音首字母）放入
+有序数组，前缀查询用二分定位，结果按关联公司数、最近使用时间排序。
+与搜索索引一样通过 search_change_log 与数据库同步。
+"""
+
+import re
+import heapq
+import bisect
+import threading
+
+from search_index import SearchService, normalize
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+_SEPARATOR_RE = re.compile(r'[\W_]+')
+
+# 一次前缀查询最多检查的条目数
+MAX_SCAN = 5000
+# 前缀查询结果缓存的条目数，索引变化时清空
+MAX_CACHED = 2048
+
+
+def compact(text):
+    """规范化并去掉空白和标点，如 "GPT-4 Turbo" -> "gpt4turbo" """
+    return _SEPARATOR_RE.sub('', normalize(text))
+
+
+def suggest_keys(label):
+    """一个名称的所有可匹配形式"""
+    key = compact(label)
+    if not key:
+        return ()
+    keys = {key}
+    if lazy_pinyin:
+        syllables = lazy_pinyin(key)
+        full = ''.join(syllables)
+        if full != key:
+            keys.add(full)
+            keys.add(''.join(syllable[0] for syllable in syllables if syllable))
+    return tuple(keys)
+
+
+class SuggestIndex:
+    """前缀联想索引
+
+    记录需包含 label_field，可选 links（关联数）和 last_used。search 返回
+    [(记录 ID, 名称, 关联数, 最近使用时间), ...]。
+    """
+
+    def __init__(self, label_field):
+        self.label_field = label_field
+        self._keys = []             # (匹配形式, 记录 ID)，有序
+        # 构建阶段只追加，prepare() 时统一排序；之后逐条插入保持有序
+        self._loading = True
+        self._items = {}            # 记录 ID -> (名称, 规范化名称, 关联数, 最近使用时间, 匹配形式)
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, doc_id, row):
+        label = row[self.label_field] or ''
+        keys = suggest_keys(label)
+        with self._lock:
+            self._remove(doc_id)
+            self._items[doc_id] = (label, compact(label), row.get('links') or 0, row.get('last_used'), keys)
+            if self._loading:
+                self._keys.extend((key, doc_id) for key in keys)
+            else:
+                for key in keys:
+                    bisect.insort(self._keys, (key, doc_id))
+            self._cache.clear()
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        item = self._items.pop(doc_id, None)
+        if item is None:
+            return
+        self.prepare()
+        for key in item[4]:
+            i = bisect.bisect_left(self._keys, (key, doc_id))
+            if i < len(self._keys) and self._keys[i] == (key, doc_id):
+                del self._keys[i]
+        self._cache.clear()
+
+    def prepare(self):
+        """结束构建阶段"""
+        with self._lock:
+            if self._loading:
+                self._keys.sort()
+                self._loading = False
+
+    def _rank(self, doc_id, prefix):
+        label, compacted, links, last_used, _ = self._items[doc_id]
+        return (compacted != prefix, -links, -(last_used.timestamp() if last_used else 0), len(label), label)
+
+    def search(self, query, limit=10):
+        prefix = compact(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            self.prepare()
+            start = bisect.bisect_left(self._keys, (prefix,))
+            matches = set()
+            for key, doc_id in self._keys[start:start + MAX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                matches.add(doc_id)
+
+            ranked = heapq.nsmallest(limit, matches, key=lambda doc_id: self._rank(doc_id, prefix))
+            results = []
+            for doc_id in ranked:
+                label, _, links, last_used, _ = self._items[doc_id]
+                results.append((doc_id, label, links, last_used))
+
+            if len(self._cache) >= MAX_CACHED:
+                self._cache.clear()
+            self._cache[(prefix, limit)] = results
+        return results
+
+
+class SuggestService(SearchService):
+    """联想索引的构建与同步（同 SearchService）"""
+
+    def __init__(self, pool, entity, select_sql, label_field, **kwargs):
+        super().__init__(pool, entity, select_sql, fields=None, **kwargs)
+        self.name = f'{entity}-suggest'
+        self.label_field = label_field
+
+    def new_index(self):
+        return SuggestIndex(self.label_field)
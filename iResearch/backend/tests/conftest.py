@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""后端模块按脚本目录导入（from cache import ...），测试时把 backend 目录加入 sys.path"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
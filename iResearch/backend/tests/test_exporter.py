@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""数据导出：日期时间保留完整的时分秒"""
+
+import json
+from datetime import datetime
+
+from exporter import EXPORTS, _encode
+
+
+def test_datetimes_keep_time():
+    used = datetime(2024, 5, 1, 12, 30, 15)
+    _, build, columns = EXPORTS['concepts']
+    rows = [(1, 'GPU', '', '', '', None, used, '硬件', None)]
+
+    ndjson = b''.join(_encode(build(rows), 'ndjson', columns))
+    assert json.loads(ndjson)['last_used'] == '2024-05-01T12:30:15'
+
+    csv_text = b''.join(_encode(build(rows), 'csv', columns)).decode('utf-8')
+    assert '2024-05-01 12:30:15' in csv_text
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""流式导入：单条记录大小上限，统计只在提交成功后更新"""
+
+import io
+import json
+
+import pytest
+
+import importer
+from importer import ImportFormatError, ImportReport, iter_json_array, iter_ndjson, stream_import
+
+
+def test_json_array_record_too_large():
+    data = b'[{"company_name": "a"}, "' + b'x' * 4096
+    records = iter_json_array(io.BytesIO(data), read_size=256, max_record_size=1024)
+    assert next(records) == {'company_name': 'a'}
+    with pytest.raises(ImportFormatError):
+        next(records)
+
+
+def test_json_array_within_limit():
+    items = [{'company_name': f'c{i}', 'detail': 'x' * 300} for i in range(20)]
+    data = json.dumps(items).encode('utf-8')
+    assert list(iter_json_array(io.BytesIO(data), read_size=64, max_record_size=1024)) == items
+
+
+def test_ndjson_line_too_large():
+    data = b'{"company_name": "a"}\n"' + b'x' * 4096 + b'"\n'
+    records = iter_ndjson(io.BytesIO(data), max_record_size=1024)
+    assert next(records) == {'company_name': 'a'}
+    with pytest.raises(ImportFormatError):
+        next(records)
+
+
+class FakeConnection:
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def commit(self):
+        if self.commits + 1 == self.fail_at:
+            raise RuntimeError('commit failed')
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def fake_import_records(cursor, records, batch_size=1000, start_index=0, report=None):
+    for offset, record in enumerate(records):
+        report.records += 1
+        report.companies_added += 1
+        report.added_ids['company'].append(start_index + offset)
+        if not record:
+            report.add_error(f"第{start_index + offset + 1}条记录格式错误")
+    return report
+
+
+def test_report_unchanged_when_commit_fails(monkeypatch):
+    monkeypatch.setattr(importer, 'import_records', fake_import_records)
+    records = [{'company_name': 'a'}, {}, {'company_name': 'c'}, {}]
+    conn = FakeConnection(fail_at=2)
+    report = ImportReport()
+    seen = []
+
+    with pytest.raises(RuntimeError):
+        stream_import(conn, io.BytesIO(json.dumps(records).encode('utf-8')), chunk_size=2,
+                      report=report, before_commit=lambda cursor, pending: seen.append(pending.records))
+
+    # 第二块的 before_commit 看到的是累计值，但提交失败后 report 停在第一块
+    assert seen == [2, 4]
+    assert conn.rollbacks == 1
+    assert report.records == 2
+    assert report.companies_added == 2
+    assert report.error_count == 1
+    assert report.errors == ['第2条记录格式错误']
+    assert report.added_ids['company'] == [0, 1]
+    assert report.chunks == 1
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""登录失败限流：按真实客户端 IP（X-Forwarded-For）计数，同一 IP 的不同用户名互不影响"""
+
+import pytest
+
+import app as backend
+from passwords import LoginThrottle
+
+
+class NoUserCursor:
+    def execute(self, sql, args=()):
+        pass
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class NoUserConnection:
+    open = True
+
+    def cursor(self, *args):
+        return NoUserCursor()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, 'login_throttle', LoginThrottle(max_user=3, max_ip=5, window=300))
+    monkeypatch.setattr(backend, 'get_db_connection', lambda: NoUserConnection())
+    monkeypatch.setattr(backend.stack_sampler, '_synced_at', float('inf'))
+    return backend.app.test_client()
+
+
+def login(client, username, client_ip):
+    # 请求都来自反向代理（127.0.0.1），客户端地址在 X-Forwarded-For 中
+    return client.post('/api/auth/login', json={'username': username, 'password': 'wrong'},
+                       headers={'X-Forwarded-For': client_ip},
+                       environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code
+
+
+def test_usernames_from_same_address_do_not_throttle_each_other(client):
+    for _ in range(3):
+        assert login(client, 'alice', '203.0.113.7') == 401
+    assert login(client, 'alice', '203.0.113.7') == 429
+    # 同一地址的其他用户名未达到 IP 上限
+    assert login(client, 'bob', '203.0.113.7') == 401
+
+
+def test_clients_behind_proxy_counted_separately(client):
+    for i in range(5):
+        assert login(client, f'user{i}', '203.0.113.7') == 401
+    assert login(client, 'carol', '203.0.113.7') == 429
+    # 经过同一个代理的其他客户端不受影响
+    assert login(client, 'carol', '198.51.100.9') == 401
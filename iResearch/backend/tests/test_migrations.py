@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""迁移校验和：自定义函数按描述计算，旧版本按源码记录的校验和仍被接受"""
+
+import pytest
+
+from migrations import LEGACY_CHECKSUMS, MIGRATIONS, MigrationError, _verify, call, checksum
+
+
+def test_call_checksum_ignores_source():
+    def first(cursor, config):
+        cursor.execute("SELECT 1")
+
+    def second(cursor, config):
+        # 只改了注释和格式
+        cursor.execute(
+            "SELECT 1"
+        )
+
+    assert checksum([call(first, 'select one')]) == checksum([call(second, 'select one')])
+    assert checksum([call(first, 'select one')]) != checksum([call(first, 'select one v2')])
+
+
+def test_applied_checksums_accepted():
+    current = {version: checksum(steps) for version, _, steps in MIGRATIONS}
+    assert _verify(current, MIGRATIONS) == []
+    assert _verify({**current, **LEGACY_CHECKSUMS}, MIGRATIONS) == []
+
+
+def test_modified_migration_rejected():
+    applied = {version: checksum(steps) for version, _, steps in MIGRATIONS}
+    applied[2] = '0' * 64
+    with pytest.raises(MigrationError):
+        _verify(applied, MIGRATIONS)
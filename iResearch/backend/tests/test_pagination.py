@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""游标分页：游标中排序键的类型校验，NULL 键的边界条件"""
+
+from datetime import datetime
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_sorted_page, keyset_condition
+
+TERM_TYPES = [(str,), (int,)]
+LAST_USED_KEYS = [('(c.last_used IS NULL)', 'ASC'), ('c.last_used', 'DESC'), ('c.term', 'ASC'), ('c.id', 'ASC')]
+LAST_USED_TYPES = [(int,), (datetime, type(None)), (str,), (int,)]
+
+
+def test_round_trip():
+    used = datetime(2024, 5, 1, 12, 30, 15, 250000)
+    values, direction = decode_cursor(encode_cursor([0, used, 'GPU', 7], 'prev'), LAST_USED_TYPES)
+    assert values == [0, used, 'GPU', 7]
+    assert direction == 'prev'
+
+
+@pytest.mark.parametrize('values', [
+    ['GPU', '7'],
+    ['GPU', None],
+    ['GPU', True],
+    [1, 7],
+    ['GPU', 7, 8],
+])
+def test_bad_cursor_rejected(values):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor(values), TERM_TYPES)
+
+
+def test_bad_last_used_rejected():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([0, '2024-05-01', 'GPU', 7]), LAST_USED_TYPES)
+
+
+def test_null_key_compared_with_is_null():
+    condition, params = keyset_condition(LAST_USED_KEYS, [1, None, 'GPU', 7])
+    assert condition == (
+        "(((c.last_used IS NULL) > %s)"
+        " OR ((c.last_used IS NULL) = %s AND c.last_used IS NULL AND c.term > %s)"
+        " OR ((c.last_used IS NULL) = %s AND c.last_used IS NULL AND c.term = %s AND c.id > %s))"
+    )
+    assert params == [1, 1, 'GPU', 1, 'GPU', 7]
+
+
+class RowCursor:
+    """按主键取行的假游标"""
+
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, sql, args=()):
+        self.rows = [{'id': row_id} for row_id in args]
+
+    def fetchall(self):
+        return self.rows
+
+
+TERM_SORT = (
+    [('c.term', 'ASC'), ('c.id', 'ASC')],
+    lambda row: [row['term'], row['id']],
+    TERM_TYPES,
+    lambda values: (values[0].casefold(), values[0], values[1])
+)
+
+
+def test_sorted_page_walk():
+    sort_rows = sorted(({'id': i, 'term': f'T{i % 7}'} for i in range(1, 24)),
+                       key=lambda row: TERM_SORT[3](TERM_SORT[1](row)))
+    expected = [row['id'] for row in sort_rows]
+
+    seen, pages, token = [], [], None
+    while True:
+        rows, next_cursor, prev_cursor = fetch_sorted_page(RowCursor(), 'SELECT', 'c.id', sort_rows,
+                                                           TERM_SORT, 5, token)
+        assert (prev_cursor is not None) == bool(seen)
+        seen.extend(row['id'] for row in rows)
+        pages.append((rows, prev_cursor))
+        if next_cursor is None:
+            break
+        token = next_cursor
+    assert seen == expected
+
+    # 从最后一页往前翻
+    rows, _, prev_cursor = fetch_sorted_page(RowCursor(), 'SELECT', 'c.id', sort_rows,
+                                             TERM_SORT, 5, pages[-1][1])
+    assert rows == pages[-2][0]
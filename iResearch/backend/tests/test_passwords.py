@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""密码哈希进程池：参数简写的重新哈希判断，超时任务占用的排队名额"""
+
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.2, method='scrypt')
+    yield hasher
+    hasher.shutdown()
+
+
+def test_needs_rehash_with_short_method(hasher):
+    assert not hasher.needs_rehash(generate_password_hash('secret', 'scrypt'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+
+def test_timed_out_task_keeps_its_slot(hasher):
+    with pytest.raises(HasherBusy):
+        hasher._run('hashed', time.sleep, 1)
+    assert hasher.stats()['pending'] == 1
+    with pytest.raises(HasherBusy):
+        hasher._run('hashed', time.sleep, 0)
+
+    deadline = time.monotonic() + 5
+    while hasher.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert hasher.stats()['pending'] == 0
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""合并并发未命中：等待者在等待前调用 before_wait，领头的请求不调用"""
+
+import threading
+
+from cache import ResponseCache
+
+
+def test_follower_calls_before_wait_before_waiting():
+    cache = ResponseCache(wait_timeout=5.0)
+    calls = []
+    released = threading.Event()
+    results = []
+
+    def follower():
+        def before_wait():
+            calls.append('follower')
+            released.set()
+        with cache.single_flight('key', before_wait=before_wait) as leader:
+            results.append(leader)
+
+    with cache.single_flight('key', before_wait=lambda: calls.append('leader')) as leader:
+        assert leader
+        thread = threading.Thread(target=follower)
+        thread.start()
+        # 领头的请求仍在生成时，等待者已经调用了 before_wait
+        assert released.wait(5)
+        assert results == []
+    thread.join(5)
+
+    assert calls == ['follower']
+    assert results == [False]
+    assert cache.stats()['coalesced'] == 1
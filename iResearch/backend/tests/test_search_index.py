@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""内存搜索索引：前缀展开不截断，排序字段随结果返回"""
+
+from search_index import SearchIndex
+
+FIELDS = [('term', 3.0), ('plain_def', 1.0)]
+
+
+def test_prefix_expands_to_all_words():
+    index = SearchIndex(FIELDS)
+    for i in range(500):
+        index.add(i, {'term': f'alpha{i}', 'plain_def': ''})
+    index.add(500, {'term': 'alps', 'plain_def': ''})
+    index.add(501, {'term': 'beta', 'plain_def': ''})
+
+    assert sorted(index.search('alp').ids()) == list(range(501))
+    assert sorted(index.search('alpha49').ids()) == [49] + list(range(490, 500))
+
+
+def test_sorted_rows():
+    index = SearchIndex(FIELDS, sort_fields=('term',))
+    index.add(1, {'term': '神经网络', 'plain_def': ''})
+    index.add(2, {'term': 'Attention 网络', 'plain_def': ''})
+    index.add(3, {'term': '图像', 'plain_def': ''})
+    index.remove(1)
+    index.add(1, {'term': 'Bert 网络', 'plain_def': ''})
+
+    result = index.search('网络')
+    rows = result.sorted_rows(key=lambda row: row['term'].casefold())
+    assert rows == [{'term': 'Attention 网络', 'id': 2}, {'term': 'Bert 网络', 'id': 1}]
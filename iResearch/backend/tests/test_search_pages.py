@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""列表接口的 q 搜索只用内存索引匹配：命中很多时也在内存中排序分页，不改用 LIKE"""
+
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as backend
+from search_index import SearchIndex
+
+
+class FakeCursor:
+    """只实现按主键取行、按分类取 ID"""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, args=()):
+        sql = ' '.join(sql.split())
+        args = list(args or ())
+        self.db.statements.append(sql)
+        self.rows = []
+        match = re.search(r'WHERE (?:c\.)?id IN \(([%s,]+)\)$', sql)
+        if match:
+            ids = args[:match.group(1).count('%s')]
+            self.rows = [dict(self.db.rows[row_id]) for row_id in ids if row_id in self.db.rows]
+        elif sql.startswith('SELECT c.id FROM concept c'):
+            self.rows = [{'id': row_id} for row_id in self.db.allowed]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    open = True
+
+    def __init__(self, rows, allowed=()):
+        self.rows = rows
+        self.allowed = set(allowed)
+        self.statements = []
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(backend, 'verify_token', lambda token: {'user_id': 1, 'username': 'admin', 'role': 'admin'})
+    monkeypatch.setattr(backend.stack_sampler, '_synced_at', float('inf'))
+    monkeypatch.setattr(backend.response_cache, 'get', lambda *args, **kwargs: None)
+    return backend.app.test_client()
+
+
+def install(monkeypatch, service, docs, allowed=()):
+    index = SearchIndex(service.fields, sort_fields=service.sort_fields)
+    for doc in docs:
+        index.add(doc['id'], doc)
+    index.prepare()
+    monkeypatch.setattr(service, 'index', index)
+    monkeypatch.setattr(service, 'refresh', lambda cursor: None)
+    conn = FakeConnection({doc['id']: doc for doc in docs}, allowed)
+    monkeypatch.setattr(backend, 'get_db_connection', lambda: conn)
+    return conn
+
+
+def get(client, url):
+    response = client.get(url, headers={'Authorization': 'Bearer test'})
+    return response.status_code, response.get_json()
+
+
+def concept_docs(count):
+    return [{'id': i, 'term': f'Alpha {i:05d}', 'plain_def': '', 'mechanism': '', 'examples': '',
+             'last_used': datetime(2024, 1, 1) + timedelta(hours=i) if i % 3 else None}
+            for i in range(1, count + 1)]
+
+
+@pytest.mark.parametrize('sort', ['term', 'last_used'])
+def test_concepts_many_hits_use_index(monkeypatch, client, sort):
+    count = 3007
+    conn = install(monkeypatch, backend.concept_search, concept_docs(count))
+
+    seen = []
+    url = f'/api/concepts?q=alp&sort={sort}&paging=cursor&page_size=200'
+    while url:
+        status, body = get(client, url)
+        assert status == 200
+        assert body['total'] == count
+        seen.extend(item['id'] for item in body['items'])
+        url = body['next_cursor'] and f'/api/concepts?q=alp&sort={sort}&page_size=200&cursor={body["next_cursor"]}'
+
+    assert len(seen) == len(set(seen)) == count
+    if sort == 'term':
+        assert seen == list(range(1, count + 1))
+    assert not any('LIKE' in sql for sql in conn.statements)
+
+
+def test_concepts_category_filter(monkeypatch, client):
+    install(monkeypatch, backend.concept_search, concept_docs(50), allowed=[4, 8, 15])
+    status, body = get(client, '/api/concepts?q=alpha&cat_id=3&page_size=2')
+    assert status == 200
+    assert body['total'] == 3
+    assert [item['id'] for item in body['items']] == [4, 8]
+    assert body['has_more']
+
+
+def test_index_not_ready(monkeypatch, client):
+    monkeypatch.setattr(backend.concept_search, 'index', None)
+    monkeypatch.setattr(backend, 'get_db_connection', lambda: FakeConnection({}))
+    status, _ = get(client, '/api/concepts?q=alpha')
+    assert status == 503
+
+
+def company_docs(count):
+    docs = []
+    for i in range(1, count + 1):
+        doc = {name: '' for name, _ in backend.COMPANY_SEARCH_FIELDS}
+        doc.update({'id': i, 'name': f'Company {count - i:05d}', 'field': '机器学习平台', 'created_at': None})
+        docs.append(doc)
+    return docs
+
+
+@pytest.mark.parametrize('paging', ['page', 'cursor'])
+def test_companies_many_hits_use_index(monkeypatch, client, paging):
+    # 命中数远超过一次 IN 列表能容纳的 ID 数
+    count = 2500
+    conn = install(monkeypatch, backend.company_search, company_docs(count))
+
+    seen = []
+    if paging == 'cursor':
+        url = '/api/companies?q=机器学习&sort=name&paging=cursor&page_size=200'
+        while url:
+            status, body = get(client, url)
+            assert status == 200
+            seen.extend(item['id'] for item in body['items'])
+            url = body['next_cursor'] and f'/api/companies?q=机器学习&sort=name&page_size=200&cursor={body["next_cursor"]}'
+    else:
+        page = 1
+        while True:
+            status, body = get(client, f'/api/companies?q=机器学习&sort=name&page={page}&page_size=200')
+            assert status == 200
+            seen.extend(item['id'] for item in body['items'])
+            if not body['has_more']:
+                break
+            page += 1
+
+    assert body['total'] == count
+    assert seen == list(range(count, 0, -1))
+    assert not any('LIKE' in sql for sql in conn.statements)
+    # 每次只按主键取当前页
+    assert all(sql.count('%s') <= 200 for sql in conn.statements)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""慢查询日志：用户、令牌吊销表的语句不记录参数、不捕获执行计划"""
+
+import logging
+
+import pytest
+
+from slow_queries import REDACTED, SlowQueryLog
+
+
+class FakePool:
+    """只用于判断是否启用执行计划，record 不会真的取连接"""
+
+
+@pytest.fixture
+def slow_log(monkeypatch):
+    slow_log = SlowQueryLog(threshold_ms=0, pool=FakePool())
+    explained = []
+    monkeypatch.setattr(slow_log, '_submit_explain', lambda key, statement: explained.append(statement))
+    slow_log.explained = explained
+    return slow_log
+
+
+class FakeCursor:
+    def mogrify(self, query, args):
+        return query % tuple(repr(arg) for arg in args)
+
+
+@pytest.mark.parametrize('query', [
+    "SELECT * FROM user WHERE username = %s",
+    "UPDATE `user` SET password_hash = %s WHERE id = %s",
+    "INSERT INTO token_revocation (user_id, revoked_at) VALUES (%s, %s)",
+    # 逗号连接、带库名限定、子查询里的表也要识别
+    "SELECT c.name FROM company c, user u WHERE u.password_hash = %s AND c.id = %s",
+    "SELECT * FROM iresearch.user WHERE password_hash = %s AND id = %s",
+    "SELECT * FROM `iresearch`.`user` WHERE password_hash = %s AND id = %s",
+    "SELECT x.id FROM (SELECT id, password_hash FROM user) x WHERE x.password_hash = %s AND x.id = %s",
+    "DELETE FROM iresearch.token_revocation WHERE user_id = %s AND revoked_at < %s",
+])
+def test_sensitive_params_redacted(slow_log, caplog, query):
+    with caplog.at_level(logging.WARNING, logger='slow_queries'):
+        slow_log.record(FakeCursor(), query, ('pbkdf2:sha256:600000$salt$hash', 1), 0.5)
+    entry = slow_log.top()[0]
+    assert entry['last_slow_params'] == REDACTED
+    assert 'pbkdf2' not in caplog.text
+    assert slow_log.explained == []
+
+
+def test_other_params_kept(slow_log):
+    slow_log.record(FakeCursor(), "SELECT * FROM company_concept WHERE company_id = %s", (7,), 0.5)
+    entry = slow_log.top()[0]
+    assert entry['last_slow_params'] == '(7,)'
+    assert len(slow_log.explained) == 1
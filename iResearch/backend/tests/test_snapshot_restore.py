@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""恢复快照：递增 app_state 的版本号，不改动 app_setting 中的运行时设置"""
+
+import re
+import json
+import zipfile
+from contextlib import contextmanager
+
+import pytest
+
+from profiling import SAMPLER_EPOCH, StackSampler, get_sampler_state, set_sampler_state
+from search_index import REBUILD_VERSION
+from snapshot import FORMAT_NAME, FORMAT_VERSION, _LENGTH, encode_group, restore_snapshot
+
+
+class FakeDatabase:
+    """只实现恢复快照和采样器开关用到的语句"""
+
+    def __init__(self):
+        self.tables = {'category': []}
+        self.app_state = {}
+        self.app_setting = {}
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, args=()):
+        sql = ' '.join(sql.split())
+        db = self.db
+        self.rows = []
+        if sql.startswith('SET SESSION'):
+            return
+        if sql.startswith('SHOW COLUMNS FROM `category`'):
+            self.rows = [('id',), ('name',)]
+        elif match := re.match(r'TRUNCATE TABLE `(\w+)`', sql):
+            db.tables[match.group(1)] = []
+        elif sql == 'UPDATE app_state SET version = version + 1':
+            for name in db.app_state:
+                db.app_state[name] += 1
+        elif sql.startswith('INSERT INTO app_state'):
+            for name in args:
+                db.app_state[name] = db.app_state.get(name, 0) + 1
+        elif sql.startswith('INSERT INTO app_setting'):
+            name, value = args
+            db.app_setting[name] = value
+        elif sql.startswith('SELECT value FROM app_setting'):
+            if args[0] in db.app_setting:
+                self.rows = [(db.app_setting[args[0]],)]
+        elif sql.startswith('SELECT version FROM app_state'):
+            if args[0] in db.app_state:
+                self.rows = [(db.app_state[args[0]],)]
+        else:
+            raise AssertionError(f"未预期的语句: {sql}")
+
+    def executemany(self, sql, rows):
+        table = re.match(r'INSERT INTO `(\w+)`', sql).group(1)
+        self.db.tables[table].extend(rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, *args):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    max_size = 4
+
+    def __init__(self, db):
+        self.db = db
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self.db)
+
+
+def write_snapshot(path, rows):
+    blob = encode_group(rows, 2)
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'tables': {
+            'category': {'columns': ['id', 'name'], 'rows': len(rows)},
+            # 快照中的 app_state 不覆盖当前数据
+            'app_state': {'columns': ['name', 'version'], 'rows': 1},
+        },
+        'uploads': 0,
+    }
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('tables/category.bin', _LENGTH.pack(len(blob)) + blob)
+        zf.writestr('manifest.json', json.dumps(manifest))
+
+
+@pytest.mark.parametrize('interval_ms', [0, 20])
+def test_restore_keeps_sampler_setting(tmp_path, interval_ms):
+    db = FakeDatabase()
+    db.tables['category'] = [(9, '旧分类')]
+    db.app_state = {'taxonomy': 3, SAMPLER_EPOCH: 2}
+    cursor = FakeCursor(db)
+    set_sampler_state(cursor, interval_ms)
+
+    path = tmp_path / 'test.irsnap'
+    write_snapshot(path, [(1, '半导体'), (2, '新能源')])
+    result = restore_snapshot(FakePool(db), str(path), str(tmp_path / 'uploads'), workers=2)
+
+    assert result['tables'] == {'category': {'rows': 2, 'ms': result['tables']['category']['ms']}}
+    assert db.tables['category'] == [(1, '半导体'), (2, '新能源')]
+    # 版本号全部递增，各进程的缓存和搜索索引随之刷新
+    assert db.app_state['taxonomy'] == 4
+    assert db.app_state[SAMPLER_EPOCH] == 3
+    assert db.app_state[REBUILD_VERSION] == 1
+    # 采样器开关保持原值
+    assert get_sampler_state(cursor) == interval_ms
+
+    sampler = StackSampler()
+    try:
+        sampler.sync(cursor)
+        assert sampler.enabled == (interval_ms > 0)
+        assert sampler.epoch == 3
+    finally:
+        sampler.stop()
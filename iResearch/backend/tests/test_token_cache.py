@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""令牌吊销：按毫秒比较签发时间，提交后才在本进程生效"""
+
+import time
+
+from cache import TokenCache
+
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, sql, args=()):
+        if sql.startswith('INSERT INTO token_revocation'):
+            self.rows.append(args)
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+def test_token_issued_after_revocation_in_same_second():
+    cache = TokenCache()
+    cursor = FakeCursor()
+    before = round(time.time(), 3)
+    time.sleep(0.002)
+    revoked_at = cache.revoke(cursor, 1)
+    time.sleep(0.002)
+    after = round(time.time(), 3)
+
+    # 提交前本进程不生效
+    assert not cache.is_revoked({'user_id': 1, 'iat': before})
+
+    cache.revoked(1, revoked_at)
+    assert cache.is_revoked({'user_id': 1, 'iat': before})
+    assert not cache.is_revoked({'user_id': 1, 'iat': after})
+    assert not cache.is_revoked({'user_id': 2, 'iat': before})
+
+
+def test_sync_reads_committed_revocations():
+    cursor = FakeCursor()
+    revoked_at = TokenCache().revoke(cursor, 1)
+
+    cache = TokenCache()
+    cache.sync(cursor)
+    assert cache.is_revoked({'user_id': 1, 'iat': revoked_at / 1000 - 1})
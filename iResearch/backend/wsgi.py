@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产环境 WSGI 入口
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+gunicorn.conf.py 默认预加载应用（preload_app）：本模块在 master 进程中导入一次，
+表结构初始化随之只执行一次（每次部署一次，而不是每个 worker 一次）；
+之后关闭 master 持有的数据库连接，worker fork 出来后由 post_worker_init 调用 init_worker()
+启动各自的后台线程。
+"""
+
+from app import app, db_pool, ensure_schema
+
+ensure_schema()
+# fork 之前关闭初始化用过的连接，worker 不继承打开的 socket
+db_pool.dispose()
+
+application = app
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 序列化与压缩基准
+对比 Flask 默认 JSON（逐行 strftime + jsonify）与 FastJSONProvider 的序列化耗时，
+以及原始 / gzip / brotli 的传输字节数。
+
+    python benchmarks/bench_json.py                      # 本地生成的数据
+    python benchmarks/bench_json.py --concepts 50000
+    python benchmarks/bench_json.py --url http://localhost:5000 --token <JWT>   # 实际接口
+"""
+
+import os
+import sys
+import time
+import gzip
+import random
+import argparse
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import FastJSONProvider, brotli, orjson
+
+WORDS = '人工智能大语言模型机器学习芯片半导体新能源汽车电池医疗器械生物制药云计算数据中心安全网络通信材料光伏储能机器人'
+
+
+def text(n):
+    return ''.join(random.choice(WORDS) for _ in range(n))
+
+
+def make_tree(categories, concepts):
+    """与 /api/categories/with-concepts 结构相同的数据"""
+    nodes = [{'id': i, 'name': text(4), 'parent_id': None if i < 10 else random.randrange(i),
+              'children': [], 'concepts': [], 'count': 0} for i in range(categories)]
+    for i in range(concepts):
+        node = nodes[random.randrange(categories)]
+        node['concepts'].append({'id': i, 'term': text(random.randint(2, 8)), 'is_extra': random.random() < 0.1})
+    roots = []
+    for node in nodes:
+        node['count'] = len(node['concepts'])
+        if node['parent_id'] is None:
+            roots.append(node)
+        else:
+            nodes[node['parent_id']]['children'].append(node)
+    return {'tree': roots, 'uncategorized': [], 'total_concepts': concepts}
+
+
+def make_page(rows):
+    """与 /api/concepts 一页（四个 TEXT 字段）结构相同的数据"""
+    now = datetime.now()
+    return [{
+        'id': i,
+        'term': text(6),
+        'plain_def': text(200),
+        'mechanism': text(300),
+        'examples': text(150),
+        'category_id': i % 50,
+        'category': text(4),
+        'last_used': now - timedelta(days=i) if i % 3 else None
+    } for i in range(rows)]
+
+
+def timed(fn, data, repeat):
+    """取 repeat 次中最快的一次（毫秒），每次使用数据的新副本"""
+    best = float('inf')
+    for _ in range(repeat):
+        copy = deepcopy(data)
+        start = time.perf_counter()
+        result = fn(copy)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def encodings(body):
+    sizes = {'raw': len(body), 'gzip': len(gzip.compress(body, compresslevel=6))}
+    if brotli is not None:
+        sizes['br'] = len(brotli.compress(body, quality=4))
+    return sizes
+
+
+def bench_local(args):
+    random.seed(42)
+    default_app = Flask('default')
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app = Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+
+    def default_page(rows):
+        # 原来的写法：逐行格式化日期后 jsonify
+        for row in rows:
+            if row['last_used']:
+                row['last_used'] = row['last_used'].strftime('%Y-%m-%d')
+        return default_app.json.response({'items': rows, 'total': len(rows)}).get_data()
+
+    cases = [
+        (f"with-concepts（{args.categories} 个分类，{args.concepts} 个概念）",
+         make_tree(args.categories, args.concepts),
+         lambda data: default_app.json.response(data).get_data(),
+         lambda data: fast_app.json.response(data).get_data()),
+        (f"concepts 列表（{args.rows} 行）",
+         make_page(args.rows),
+         default_page,
+         lambda rows: fast_app.json.response({'items': rows, 'total': len(rows)}).get_data()),
+    ]
+
+    print(f"序列化：{'orjson' if orjson else '标准库 json'}；brotli：{'已安装' if brotli else '未安装'}")
+    for title, data, old, new in cases:
+        with default_app.app_context():
+            old_ms, old_body = timed(old, data, args.repeat)
+        with fast_app.app_context():
+            new_ms, new_body = timed(new, data, args.repeat)
+        print(f"\n{title}")
+        print(f"  序列化  默认 {old_ms:8.1f} ms    快速 {new_ms:8.1f} ms    {old_ms / new_ms:5.1f}x")
+        for name, body in (('默认', old_body), ('快速', new_body)):
+            sizes = encodings(body)
+            print(f"  {name}字节  " + '    '.join(f"{k} {v / 1024:9.1f} KB" for k, v in sizes.items()))
+
+
+def bench_remote(args):
+    import requests
+
+    headers = {'Authorization': f'Bearer {args.token}'}
+    for path in ('/api/categories/flat', '/api/categories/tree', '/api/categories/with-concepts',
+                 '/api/concepts?page_size=200'):
+        print(path)
+        for encoding in ('identity', 'gzip', 'br'):
+            start = time.perf_counter()
+            response = requests.get(args.url + path, headers={**headers, 'Accept-Encoding': encoding}, stream=True)
+            wire = len(response.raw.read(decode_content=False))
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {encoding:8s} {response.status_code}  {response.headers.get('Content-Encoding', '-'):5s}"
+                  f"  {wire / 1024:9.1f} KB  {elapsed:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 序列化与压缩基准')
+    parser.add_argument('--categories', type=int, default=500)
+    parser.add_argument('--concepts', type=int, default=20000)
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--url', help='测试运行中的服务，如 http://localhost:5000')
+    parser.add_argument('--token', help='--url 模式使用的 JWT')
+    args = parser.parse_args()
+
+    if args.url:
+        bench_remote(args)
+    else:
+        bench_local(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发登录基准
+若干线程持续登录的同时，另一组线程持续请求普通接口，分别统计两者的延迟分位数，
+用于观察登录高峰对其他接口的影响。
+
+    python benchmarks/bench_login.py --url http://localhost:5000 --username admin --password admin123
+    python benchmarks/bench_login.py --url ... --logins 32 --readers 8 --duration 30
+
+注意：--password 错误时会触发登录限流（429）。
+"""
+
+import time
+import argparse
+import threading
+from collections import Counter
+
+import requests
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def worker(fn, deadline, latencies, statuses, lock):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status = fn(session)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发登录基准')
+    parser.add_argument('--url', required=True, help='如 http://localhost:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--logins', type=int, default=16, help='并发登录线程数')
+    parser.add_argument('--readers', type=int, default=4, help='并发请求普通接口的线程数')
+    parser.add_argument('--path', default='/api/categories/flat', help='普通接口')
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    response = requests.post(f"{args.url}/api/auth/login",
+                             json={'username': args.username, 'password': args.password})
+    response.raise_for_status()
+    headers = {'Authorization': f"Bearer {response.json()['token']}"}
+
+    def login(session):
+        return session.post(f"{args.url}/api/auth/login",
+                            json={'username': args.username, 'password': args.password}).status_code
+
+    def read(session):
+        return session.get(args.url + args.path, headers=headers).status_code
+
+    lock = threading.Lock()
+    results = {'login': ([], Counter()), 'api': ([], Counter())}
+    deadline = time.monotonic() + args.duration
+    threads = []
+    for name, fn, count in (('login', login, args.logins), ('api', read, args.readers)):
+        latencies, statuses = results[name]
+        for _ in range(count):
+            thread = threading.Thread(target=worker, args=(fn, deadline, latencies, statuses, lock))
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    print(f"{args.logins} 个登录线程 + {args.readers} 个 {args.path} 线程，{args.duration:.0f} 秒")
+    for name, (latencies, statuses) in results.items():
+        print(f"{name:6s} 请求 {len(latencies):6d}  {len(latencies) / args.duration:7.1f}/s  "
+              f"p50 {percentile(latencies, 50):7.1f} ms  p99 {percentile(latencies, 99):7.1f} ms  "
+              f"max {max(latencies, default=0):7.1f} ms  状态 {dict(statuses)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gunicorn worker 模型基准
+依次用 sync / gthread / gevent 启动 backend（gunicorn.conf.py 的预设），在相同的并发下
+轮流请求一组接口，比较吞吐量和延迟分位数。需要可用的数据库（.env 中的配置）。
+
+    python benchmarks/bench_workers.py --username admin --password admin123
+    python benchmarks/bench_workers.py --models gthread gevent --clients 64 --duration 30
+    python benchmarks/bench_workers.py --workers 4 --paths /api/concepts '/api/concepts?q=芯片'
+
+未安装 gevent 时跳过 gevent。
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import tempfile
+import subprocess
+import importlib.util
+from collections import Counter
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+DEFAULT_PATHS = [
+    '/api/concepts?page_size=50',
+    '/api/concepts?q=数据&page_size=50',
+    '/api/companies?page_size=50',
+    '/api/categories/flat',
+    '/api/categories/with-concepts',
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def start_server(model, port, workers):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=model, GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_ACCESS_LOG='')
+    if workers:
+        env['GUNICORN_WORKERS'] = str(workers)
+    # 服务日志写入临时文件（管道不读取会写满阻塞服务进程）
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=log
+    )
+    return process, log
+
+
+def wait_ready(url, process, log, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(log.read().decode('utf-8', 'replace')[-2000:])
+        try:
+            # 任何 HTTP 响应都说明已经开始接受请求
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError('服务启动超时')
+
+
+def run_load(url, headers, paths, clients, duration, warmup):
+    lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+    start_at = time.monotonic() + warmup
+    deadline = start_at + duration
+
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status = session.get(url + path, headers=headers).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - start) * 1000
+            if time.monotonic() >= start_at:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn worker 模型基准')
+    parser.add_argument('--models', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--clients', type=int, default=32, help='并发客户端线程数')
+    parser.add_argument('--workers', type=int, default=0, help='进程数（默认用各模型的预设）')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3, help='不计入统计的预热秒数')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}"
+    results = []
+    for model in args.models:
+        if model == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print('未安装 gevent，跳过')
+            continue
+
+        process, log = start_server(model, args.port, args.workers)
+        try:
+            wait_ready(url, process, log)
+            response = requests.post(f"{url}/api/auth/login",
+                                     json={'username': args.username, 'password': args.password})
+            response.raise_for_status()
+            headers = {'Authorization': f"Bearer {response.json()['token']}",
+                       'Accept-Encoding': 'gzip'}
+            latencies, statuses = run_load(url, headers, args.paths, args.clients,
+                                           args.duration, args.warmup)
+            results.append((model, latencies, statuses))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=60)
+            log.close()
+
+    print(f"{args.clients} 个并发客户端，{args.duration:.0f} 秒，{len(args.paths)} 个接口轮流请求")
+    for model, latencies, statuses in results:
+        print(f"{model:8s} {len(latencies) / args.duration:8.1f} req/s  "
+              f"p50 {percentile(latencies, 50):7.1f} ms  p99 {percentile(latencies, 99):7.1f} ms  "
+              f"max {max(latencies, default=0):7.1f} ms  状态 {dict(statuses)}")
+
+
+if __name__ == '__main__':
+    main()